@@ -4,50 +4,25 @@ Created on Thu Jul 10 21:33:04 2025
 
 @author: danie
 """
-import re
-import numpy as np
-import soundfile as sf
-from kokoro import KPipeline
+from tts_cache import SegmentCache
+from tts_renderer import iter_audio, parse_guide, write_audio, SAMPLE_RATE
 
 
-# Asumimos que ya está importado KPipeline y configurado
-pipeline = KPipeline(lang_code='e')
-
 with open(r'C:\Users\danie\Desktop\Meditacion\Salidas\Salidas de texto\Guia1_Gemma3_27b_k10promp2_1.txt', 'r', encoding='utf-8') as archivo:
     respuesta_llm = archivo.read()
 
 # Texto de entrada desde el LLM
 texto = respuesta_llm
 
-# Patrón para detectar [Pausa X seg]
-patron_pausa = re.compile(r"\[Pausa (\d+) segundos\]")
-
-# Separar el texto en segmentos de narración y pausas
-segmentos = patron_pausa.split(texto)
-
-# Lista final de audio
-audio_chunks = []
-
-i = 0
-while i < len(segmentos):
-    if i % 2 == 0:
-        # Texto narrado
-        texto_segmento = segmentos[i].strip()
-        if texto_segmento:
-            generator = pipeline(texto_segmento, voice="em_alex", speed=0.7)
-            for _, _, audio in generator:
-                audio_chunks.append(audio)
-    else:
-        # Pausa en segundos
-        segundos = int(segmentos[i])
-        silencio = np.zeros(int(24000 * segundos), dtype=np.float32)
-        audio_chunks.append(silencio)
-    i += 1
-
-# Concatenar todo el audio
-audio_total = np.concatenate(audio_chunks)
-
-# Guardar en archivo WAV
-sf.write("voz_kokoro.wav", audio_total, samplerate=24000)
+# Separar el texto en segmentos de narración y pausas [Pausa X segundos]
+segmentos = parse_guide(texto)
 
+# Caché de segmentos ya sintetizados: un cambio solo de pausas no vuelve a pasar por el TTS
+cache = SegmentCache()
 
+# Sintetizar los segmentos en paralelo (en orden) y escribir el WAV a medida que llegan,
+# sin acumular todo el audio en memoria
+duracion = write_audio(iter_audio(segmentos, voice="em_alex", speed=0.7, cache=cache), "voz_kokoro.wav",
+                       sample_rate=SAMPLE_RATE)
+print(f"Audio guardado en voz_kokoro.wav ({duracion:.1f} segundos)")
+print(f"Caché TTS: {cache.hits} segmentos reutilizados, {cache.misses} sintetizados")
@@ -6,6 +6,7 @@ Created on Thu Jul 10 12:31:39 2025
 """
 
 import os
+import sys
 import pandas as pd
 import numpy as np
 import regex as re
@@ -20,7 +21,6 @@ import requests
 
 
 # LangChain imports
-from langchain_community.vectorstores import Chroma
 from langchain.docstore.document import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.llms import Ollama
@@ -28,48 +28,55 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
+from meditation_prompts import crear_prompt_con_contexto, instruccion_meditacion
+from instrumentation import span
+from ollama_client import format_stats, get_client
+from context_builder import build_context, format_report
+from lexical_index import build_lexical_index, load_lexical_index, reciprocal_rank_fusion
+from query_cache import QueryCache
+from stream_pipeline import format_timings, stream_guide_to_audio
+from tts_cache import SegmentCache
+from vector_store import LocalVectorStore
+
 
 # from langchain.schema import Document
 # from langchain.vectorstores import Chroma
 
 # --- Configuración (DEBE COINCIDIR CON LA CONFIGURACIÓN DE TU CÓDIGO ANTERIOR) ---
 MODEL_NAME = "all-mpnet-base-v2" # Modelo de embedding usado para generar los embeddings
-CHROMA_PERSIST_DIR = r"C:\Users\danie\Desktop\Meditacion\Salidas\Base de datos vectorial" # Directorio donde Chroma guarda la DB
+# Almacén vectorial local (sin servidor). Se crea una vez a partir de la base de Chroma con:
+#   python vector_store.py migrate "chroma:C:\...\Base de datos vectorial" "local:C:\...\Almacen vectorial"
+ALMACEN_VECTORIAL_DIR = r"C:\Users\danie\Desktop\Meditacion\Salidas\Almacen vectorial"
 OLLAMA_MODEL = "gemma3:27b" # TU MODELO DE OLLAMA
 TOP_K = 50
 duracion_minutos = 5
+# Caché de vectores de consulta (se invalida sola si cambia el almacén)
+QUERY_CACHE_PATH = os.path.join(os.path.dirname(ALMACEN_VECTORIAL_DIR), "query_cache.sqlite")
+# Índice BM25 sobre los mismos fragmentos del almacén (búsqueda híbrida densa + léxica)
+BUSQUEDA_HIBRIDA = True
+# Tokens de contexto para el LLM: los TOP_K fragmentos se filtran con MMR y se recortan a este presupuesto
+CONTEXTO_MAX_TOKENS = 4096
+# Opcional (python RAG.py --narrar): narrar cada sección en cuanto llega su [Pausa X segundos],
+# mientras el LLM sigue escribiendo (sin esperar a Generador_voz.py); el tiempo total se acerca
+# a max(LLM, TTS) en vez de la suma. Necesita Kokoro y escribe RUTA_AUDIO
+NARRAR_EN_STREAMING = "--narrar" in sys.argv[1:]
+RUTA_AUDIO = r"C:\Users\danie\Desktop\Meditacion\Salidas\Salidas de audio\voz_kokoro.wav"
 
 
 
 inicio = time.time()
 
 # Paso 1: Cargar embeddings y vectorstore existente
-embedding_model = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+with span("embedding_model_load"):
+    embedding_model = HuggingFaceEmbeddings(model_name=MODEL_NAME)
 
-print("Cargando base de datos vectorial desde Chroma...")
-vectorstore = Chroma(
-    persist_directory=CHROMA_PERSIST_DIR,
-    embedding_function=embedding_model
-)
+print("Cargando almacén vectorial...")
+with span("corpus_load"):
+    almacen = LocalVectorStore(ALMACEN_VECTORIAL_DIR)
 
 # Paso 2: Instrucción principal para el LLM
 duracion_minutos = 5
-palabras_esperadas = duracion_minutos * 150
-pregunta_usuario = (
-    f"Eres un guía de meditación con profundo conocimiento de las enseñanzas budistas. "
-    f"Usa el siguiente contexto (en inglés) como fuente de inspiración para crear una guía de meditación paso a paso. "
-    f"Escríbela completamente en español, con un tono calmado, contemplativo, suave y claro. "
-    f"No traduzcas literalmente el contexto ni lo menciones directamente. "
-    f"La guía debe estar diseñada para ser narrada en voz alta, con una extensión aproximada de {palabras_esperadas} palabras. "
-    f"Divide el texto en secciones breves, con frases cortas y comprensibles. "
-    f"Al final de cada sección, incluye una pausa sugerida en el formato: [Pausa X segundos], donde X debe estar entre 3 y 12 segundos. "
-    f"La duración total estimada del texto completo con pausas debe ser de aproximadamente {duracion_minutos} minutos. "
-    f"No uses más de 10 pausas de más de 10 segundos. "
-    f"Evita pausas excesivamente largas o innecesarias. "
-    f"Utiliza silencios y respiraciones conscientes como herramienta para la calma, sin exagerar. "
-    f"El objetivo es lograr una experiencia pausada pero fluida, sin estancamientos. "
-    f"Escribe solo la guía de meditación, sin explicaciones externas ni avisos."
-)
+pregunta_usuario = instruccion_meditacion(duracion_minutos)
 
 # Promp de Pruebas 
 # pregunta_usuario = (
@@ -85,40 +92,89 @@ pregunta_usuario = (
 # )
 
 # Paso 3: Buscar los textos más similares
-resultados = vectorstore.similarity_search(pregunta_usuario, k=TOP_K)
-contexto = "\n\n".join([r.page_content for r in resultados])
+# El vector de la pregunta se reutiliza entre ejecuciones: sin pasada por el transformer
+cache = QueryCache(MODEL_NAME, store_version=almacen.version, path=QUERY_CACHE_PATH)
+vector_pregunta = cache.get_vector(pregunta_usuario)
+if vector_pregunta is None:
+    with span("query_encode"):
+        vector_pregunta = embedding_model.embed_query(pregunta_usuario)
+    cache.put_vector(pregunta_usuario, vector_pregunta)
+with span("search", mode="local"):
+    resultados = almacen.search(vector_pregunta, TOP_K)[0]
+cache.close()
+ids_candidatos = [r.id for r in resultados]
+
+if BUSQUEDA_HIBRIDA:
+    # Los términos pali (satipaṭṭhāna, jhāna...) y nombres propios se recuperan mejor con BM25;
+    # el índice se guarda junto al almacén y se reconstruye solo si este cambia
+    indice_lexico = load_lexical_index(ALMACEN_VECTORIAL_DIR, almacen.version)
+    if indice_lexico is None:
+        print("Construyendo índice léxico BM25...")
+        indice_lexico = build_lexical_index(ALMACEN_VECTORIAL_DIR)
+    _, ids_lexicos = indice_lexico.search(pregunta_usuario, TOP_K)
+    _, ids_fusionados = reciprocal_rank_fusion([almacen.rows(ids_candidatos), ids_lexicos], TOP_K)
+    ids_candidatos = [almacen.ids[i] for i in ids_fusionados.tolist()]
+
+# Los vectores de los candidatos se leen del almacén: no hace falta volver a codificarlos
+vectores_candidatos, textos_candidatos, metadatos_candidatos = almacen.get(ids_candidatos)
+candidatos = list(zip(textos_candidatos, metadatos_candidatos))
+
+# Paso 3b: Compactar el contexto: MMR descarta fragmentos casi repetidos (se solapan CHUNK_OVERLAP
+# palabras), los contiguos se unen y se llena como máximo CONTEXTO_MAX_TOKENS
+with span("context_build"):
+    contexto, _, informe = build_context(vector_pregunta, candidatos, vectores_candidatos, CONTEXTO_MAX_TOKENS)
+print(f"Contexto: {format_report(informe)}")
 
 # Paso 4: Crear el prompt para el LLM
-def crear_prompt_con_contexto(pregunta, contexto):
-    return (
-        f"A continuación tienes un contexto basado en textos de meditación:\n\n"
-        f"{contexto}\n\n"
-        f"Basado en el contexto anterior, responde la siguiente pregunta de forma clara y útil:\n"
-        f"{pregunta}\n\n"
-        f"Respuesta:"
-    )
-
-prompt_final = crear_prompt_con_contexto(pregunta_usuario, contexto)
-
-# Paso 5: Enviar prompt a Ollama
+with span("prompt_build"):
+    prompt_final = crear_prompt_con_contexto(pregunta_usuario, contexto)
+
+# Paso 5: Enviar prompt a Ollama (streaming, conexión reutilizada)
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_READ_TIMEOUT = 600  # Segundos máximos sin recibir tokens
+
 def consultar_ollama(prompt):
-    url = "http://localhost:11434/api/generate"
-    payload = {
-        "model": OLLAMA_MODEL,  # Reemplaza con el modelo que tienes cargado en Ollama
-        "prompt": prompt,
-        "stream": False
-    }
+    cliente = get_client(OLLAMA_URL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+    estadisticas = {}
+    partes = []
+    try:
+        # Los tokens se muestran a medida que llegan
+        for token in cliente.stream_generate(prompt, OLLAMA_MODEL, stats=estadisticas):
+            partes.append(token)
+            print(token, end="", flush=True)
+        print()
+        print(f"Ollama: {format_stats(estadisticas)}")
+        return "".join(partes).strip()
+    except requests.exceptions.HTTPError as e:
+        return f"ERROR {e.response.status_code}: {e.response.text}"
+    except Exception as e:
+        return f"EXCEPTION: {str(e)}"
+
+def narrar_en_streaming(prompt):
+    cliente = get_client(OLLAMA_URL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+    estadisticas = {}
+    cache_tts = SegmentCache()
     try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()['response'].strip()
-        else:
-            return f"ERROR {response.status_code}: {response.text}"
+        os.makedirs(os.path.dirname(RUTA_AUDIO), exist_ok=True)
+        texto, duracion, tiempos = stream_guide_to_audio(
+            cliente.stream_generate(prompt, OLLAMA_MODEL, stats=estadisticas), RUTA_AUDIO,
+            on_token=lambda token: print(token, end="", flush=True),
+            voice="em_alex", speed=0.7, cache=cache_tts)
+        print()
+        print(f"Ollama: {format_stats(estadisticas)}")
+        print(f"Audio guardado en {RUTA_AUDIO} ({duracion:.1f} segundos): {format_timings(tiempos)}")
+        return texto.strip()
+    except requests.exceptions.HTTPError as e:
+        return f"ERROR {e.response.status_code}: {e.response.text}"
     except Exception as e:
         return f"EXCEPTION: {str(e)}"
 
 # Paso 6: Ejecutar y mostrar
-respuesta_llm = consultar_ollama(prompt_final)
+if NARRAR_EN_STREAMING:
+    respuesta_llm = narrar_en_streaming(prompt_final)
+else:
+    respuesta_llm = consultar_ollama(prompt_final)
 print("\n=== RESPUESTA DEL LLM ===")
 print(respuesta_llm)
 
@@ -127,4 +183,6 @@ print(respuesta_llm)
 ruta_salida = r"C:\Users\danie\Desktop\Meditacion\Salidas\Salidas de texto\guia_meditacion1.txt"
 
 with open(ruta_salida, "w", encoding="utf-8") as f:
-    f.write(respuesta_llm)
\ No newline at end of file
+    f.write(respuesta_llm)
+
+print(f"Tiempo total: {time.time() - inicio:.1f} segundos")
\ No newline at end of file
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Audio Mix
+
+Block-wise mixing of a narration with background music:
+1. Takes the narration as blocks, straight from the renderer (iter_audio) or
+   read back from disk
+2. Streams the music bed from its file, looping it with an equal-power
+   crossfade so the seam is not audible
+3. Ducks the music under speech: a per-window RMS envelope of each voice block
+   (vectorised, held through the short gaps between phrases) sets its gain
+4. Writes every output in the same pass, as the blocks arrive: WAV plus
+   compressed variants (FLAC, Ogg Vorbis or Ogg Opus), picked by file extension
+
+Only one block of narration and music is in memory at a time, so deriving the
+"con_musica" variant of a guide never re-synthesises or loads a whole file.
+"""
+
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+
+import numpy as np
+import soundfile as sf
+
+from instrumentation import count, observe
+from tts_renderer import SAMPLE_RATE
+
+MUSIC_GAIN = 0.15  # Music level under the voice (linear)
+READ_BLOCK_FRAMES = SAMPLE_RATE  # One second per block
+CROSSFADE_SECONDS = 3.0  # Overlap between the end of the music track and its restart
+DUCK_WINDOW_SECONDS = 0.05  # RMS window of the ducking envelope
+DUCK_HOLD_SECONDS = 0.6  # Music stays ducked this long after speech stops
+DUCK_THRESHOLD = 0.02  # Voice RMS above which a window counts as speech
+DUCK_DEPTH = 0.35  # Music gain under speech, relative to MUSIC_GAIN (1.0 disables ducking)
+
+# File extension -> soundfile (format, subtype)
+OUTPUT_FORMATS = {
+    ".wav": ("WAV", "PCM_16"),
+    ".flac": ("FLAC", "PCM_16"),
+    ".ogg": ("OGG", "VORBIS"),
+    ".opus": ("OGG", "OPUS"),
+}
+
+
+def _mono(block: np.ndarray) -> np.ndarray:
+    return block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+
+
+def read_blocks(path, block_frames: int = READ_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """Yield a mono audio file as float32 blocks"""
+    for block in sf.blocks(str(path), blocksize=block_frames, dtype='float32', always_2d=True):
+        yield _mono(block)
+
+
+class MusicBed:
+    """Endless music stream, read block-wise from a file (or an array) and looped with a crossfade
+
+    Each pass ends by fading the track's last `crossfade` seconds out while its
+    first ones fade in; the next pass then continues right after them.
+    """
+
+    def __init__(self, source, sample_rate: int = SAMPLE_RATE, crossfade: float = CROSSFADE_SECONDS,
+                 block_frames: int = READ_BLOCK_FRAMES):
+        if isinstance(source, np.ndarray):
+            self._file, self._array, self.frames = None, source.astype(np.float32, copy=False), len(source)
+        else:
+            self._file = sf.SoundFile(str(source))
+            if self._file.samplerate != sample_rate:
+                raise ValueError(f"{source} is {self._file.samplerate} Hz, expected {sample_rate} Hz")
+            self._array, self.frames = None, self._file.frames
+        if not self.frames:
+            raise ValueError(f"{source} has no audio")
+        self.block_frames = block_frames
+        self.crossfade = min(int(crossfade * sample_rate), self.frames // 2)
+        # Equal-power curves keep the loudness constant through the overlap
+        phase = (np.arange(self.crossfade, dtype=np.float32) + 0.5) / max(self.crossfade, 1) * (np.pi / 2)
+        self._fade_out, self._fade_in = np.cos(phase), np.sin(phase)
+        self._head = self._read(0, self.crossfade)
+        self._position = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def _read(self, start, frames):
+        if self._array is not None:
+            return self._array[start:start + frames]
+        self._file.seek(start)
+        return _mono(self._file.read(frames, dtype='float32', always_2d=True))
+
+    def _next_chunk(self):
+        body_end = self.frames - self.crossfade
+        if self._position < body_end:
+            chunk = self._read(self._position, min(self.block_frames, body_end - self._position))
+            self._position += len(chunk)
+            return chunk
+        tail = self._read(body_end, self.crossfade)
+        # The head has just been played inside the crossfade
+        self._position = self.crossfade
+        return tail * self._fade_out + self._head * self._fade_in
+
+    def read(self, frames: int) -> np.ndarray:
+        """The next `frames` samples of the looped track"""
+        parts, available = [self._pending], len(self._pending)
+        while available < frames:
+            chunk = self._next_chunk()
+            parts.append(chunk)
+            available += len(chunk)
+        music = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        self._pending = music[frames:]
+        return music[:frames]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class Ducker:
+    """Per-sample music gain that drops under speech, computed one voice block at a time"""
+
+    def __init__(self, gain: float = MUSIC_GAIN, depth: float = DUCK_DEPTH, threshold: float = DUCK_THRESHOLD,
+                 window_seconds: float = DUCK_WINDOW_SECONDS, hold_seconds: float = DUCK_HOLD_SECONDS,
+                 sample_rate: int = SAMPLE_RATE):
+        self.gain = gain
+        self.depth = depth
+        self.threshold = threshold
+        self.window = max(1, int(window_seconds * sample_rate))
+        self.hold = int(round(hold_seconds / window_seconds))
+        self._recent = np.zeros(self.hold, dtype=bool)  # Speech flags of the last windows seen
+        self._last_gain = gain
+
+    def __call__(self, voice: np.ndarray) -> np.ndarray:
+        if not len(voice):
+            return np.zeros(0, dtype=np.float32)
+        starts = np.arange(0, len(voice), self.window)
+        energy = np.add.reduceat(np.square(voice, dtype=np.float32), starts)
+        rms = np.sqrt(energy / np.diff(np.append(starts, len(voice))))
+        speech = np.concatenate([self._recent, rms > self.threshold])
+        # A window stays ducked if speech occurred in it or in the `hold` windows before it
+        held = np.lib.stride_tricks.sliding_window_view(speech, self.hold + 1).max(axis=1)
+        self._recent = speech[len(speech) - self.hold:]
+        targets = np.where(held, self.gain * self.depth, self.gain).astype(np.float32)
+        # Interpolate between window centres, starting from where the previous block ended
+        centres = np.minimum(starts + self.window / 2, len(voice) - 1)
+        gains = np.interp(np.arange(len(voice)), np.concatenate([[-0.5], centres]),
+                          np.concatenate([[self._last_gain], targets])).astype(np.float32)
+        self._last_gain = float(targets[-1])
+        return gains
+
+
+def output_format(path):
+    """soundfile (format, subtype) for an output file, from its extension"""
+    suffix = Path(path).suffix.lower()
+    if suffix not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported audio format '{suffix}' (use {', '.join(OUTPUT_FORMATS)})")
+    return OUTPUT_FORMATS[suffix]
+
+
+def write_variants(voice_blocks: Iterable[np.ndarray], outputs: Dict, music=None, gain: float = MUSIC_GAIN,
+                   duck: bool = True, sample_rate: int = SAMPLE_RATE) -> float:
+    """Write the narration to several files in one pass; returns the duration in seconds
+
+    `outputs` maps each path to True (mixed with `music`, a MusicBed, array or
+    file path) or False (the voice alone). Blocks are written as they arrive.
+    """
+    if any(outputs.values()) and music is None:
+        raise ValueError("Music is needed for the mixed outputs")
+    bed = None
+    if any(outputs.values()):
+        bed = music if isinstance(music, MusicBed) else MusicBed(music, sample_rate)
+    ducker = Ducker(gain, sample_rate=sample_rate) if duck else None
+    files = {}
+    frames = 0
+    write_time = 0.0  # Time spent mixing and encoding, not waiting for blocks
+    try:
+        for path, with_music in outputs.items():
+            audio_format, subtype = output_format(path)
+            files[path] = sf.SoundFile(str(path), 'w', samplerate=sample_rate, channels=1,
+                                       format=audio_format, subtype=subtype)
+        for block in voice_blocks:
+            start = time.perf_counter()
+            mixed = None
+            if bed is not None:
+                mixed = block + (ducker(block) if ducker is not None else gain) * bed.read(len(block))
+                np.clip(mixed, -1.0, 1.0, out=mixed)
+            for path, out in files.items():
+                out.write(mixed if outputs[path] else block)
+            write_time += time.perf_counter() - start
+            frames += len(block)
+    finally:
+        for out in files.values():
+            out.close()
+        if bed is not None and bed is not music:
+            bed.close()
+    observe("mix_write_seconds", write_time)
+    count("audio_seconds_written_total", frames / sample_rate)
+    return frames / sample_rate
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mix a narration with looped, ducked background music")
+    parser.add_argument("narration", help="Mono narration at the renderer's sample rate")
+    parser.add_argument("music", help="Background track at the same sample rate")
+    parser.add_argument("outputs", nargs="+", help=f"Files to write ({', '.join(OUTPUT_FORMATS)})")
+    parser.add_argument("--gain", type=float, default=MUSIC_GAIN)
+    parser.add_argument("--no-duck", action="store_true", help="Keep the music at a fixed gain")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    duration = write_variants(read_blocks(args.narration), {path: True for path in args.outputs}, args.music,
+                              args.gain, duck=not args.no_duck)
+    print(f"Mixed {duration:.1f}s of audio in {time.perf_counter() - start:.2f}s")
+    for path in args.outputs:
+        print(f"  {path}: {Path(path).stat().st_size / 1e6:.2f} MB")
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Audio Server
+
+Serves the meditation catalogue to the web-ui:
+1. GET /data/audio/<file>: the audio files, with HTTP Range support (seeking
+   in a 10-minute narration only fetches the bytes needed), ETag and
+   Last-Modified validators and conditional requests (304). Bodies go out
+   with socket.sendfile, i.e. os.sendfile where available: no copy through Python
+2. GET /api/catalogue: JSON index of the (duration, level, music) variants
+   actually on disk and their formats, rescanned when the directory changes,
+   so the UI only offers combinations that exist
+3. Optionally the built web-ui itself (--static web-ui/build), so one process
+   serves the whole player
+
+Run from the repository root:
+    python scripts/audio_server.py serve [--port 8001] [--static web-ui/build]
+    python scripts/audio_server.py loadtest [--url http://127.0.0.1:8001] [--clients 16]
+Without --url the load test starts its own server, with synthetic audio if the
+catalogue is empty.
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+import numpy as np
+
+AUDIO_DIR = "web-ui/public/data/audio"  # Where build_catalogue.py writes the catalogue
+AUDIO_URL_PREFIX = "/data/audio/"  # Same URLs as the web-ui's public/ folder
+CATALOGUE_URL = "/api/catalogue"
+CACHE_MAX_AGE = 3600  # Seconds browsers may reuse a file before revalidating it
+CATALOGUE_PATTERN = re.compile(r"^meditacion_kokoro_(\d+)_([a-z]+)_(con_musica|mute)\.(\w+)$")  # build_catalogue.py
+CONTENT_TYPES = {
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg; codecs=opus",
+    ".mp3": "audio/mpeg",
+    ".html": "text/html; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".png": "image/png",
+    ".ico": "image/x-icon",
+    ".svg": "image/svg+xml",
+    ".txt": "text/plain; charset=utf-8",
+}
+AUDIO_EXTENSIONS = {".wav", ".flac", ".ogg", ".opus", ".mp3"}
+LOADTEST_RANGE_BYTES = 256 * 1024  # Bytes per ranged request, about what a browser fetches per seek
+
+
+def audio_seconds(path):
+    """Duration of an audio file from its header, or None if soundfile cannot read it"""
+    try:
+        import soundfile as sf
+        return round(sf.info(str(path)).duration, 2)
+    except Exception:
+        return None
+
+
+class Catalogue:
+    """Index of the catalogue files in a directory, rebuilt when the directory changes"""
+
+    def __init__(self, audio_dir, url_prefix=AUDIO_URL_PREFIX):
+        self.audio_dir = Path(audio_dir)
+        self.url_prefix = url_prefix
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._body = b""
+        self._etag = ""
+
+    def scan(self):
+        """The variants on disk, each with its files (smallest first)"""
+        variants = {}
+        if self.audio_dir.is_dir():
+            for entry in os.scandir(self.audio_dir):
+                match = CATALOGUE_PATTERN.match(entry.name)
+                suffix = os.path.splitext(entry.name)[1]
+                if not match or suffix not in AUDIO_EXTENSIONS or not entry.is_file():
+                    continue
+                duration, level, music, _ = match.groups()
+                variant = variants.setdefault((int(duration), level, music), {
+                    "duration": int(duration), "level": level, "music": music, "seconds": None, "files": []})
+                variant["files"].append({"format": suffix[1:], "url": self.url_prefix + entry.name,
+                                         "type": CONTENT_TYPES[suffix], "bytes": entry.stat().st_size})
+                if variant["seconds"] is None:
+                    variant["seconds"] = audio_seconds(entry.path)
+        for variant in variants.values():
+            variant["files"].sort(key=lambda f: f["bytes"])
+        return [variants[key] for key in sorted(variants)]
+
+    def get(self):
+        """(JSON body, ETag) of the current catalogue"""
+        try:
+            mtime = self.audio_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = -1
+        with self._lock:
+            if mtime != self._mtime:
+                variants = self.scan()
+                body = json.dumps({
+                    "variants": variants,
+                    "durations": sorted({v["duration"] for v in variants}),
+                    "levels": sorted({v["level"] for v in variants}),
+                    "music": sorted({v["music"] for v in variants}),
+                }, ensure_ascii=False).encode("utf-8")
+                self._body, self._etag, self._mtime = body, f'"{hashlib.sha1(body).hexdigest()[:16]}"', mtime
+            return self._body, self._etag
+
+
+def parse_range(header, size):
+    """(start, end) of a single "bytes=" range, None if unsatisfiable
+
+    Raises ValueError for anything else (other units, several ranges, bad
+    syntax); the whole file is served then, as RFC 9110 allows.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length <= 0 or not size:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start > end and last:
+        raise ValueError(header)
+    if start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def not_modified(headers, etag, mtime):
+    """True if the client's cached copy is current (If-None-Match, else If-Modified-Since)"""
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def range_applies(headers, etag, mtime):
+    """If-Range: honour the Range header only if the client's copy is still this file"""
+    if_range = headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    try:
+        return int(mtime) == int(parsedate_to_datetime(if_range).timestamp())
+    except (TypeError, ValueError):
+        return False
+
+
+class AudioHandler(BaseHTTPRequestHandler):
+    """Catalogue, audio files with ranges and (optionally) the static web-ui"""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive: a player issues many range requests
+    server_version = "ContemplativeAudio/1.0"
+    catalogue: Catalogue = None
+    static_dir: Path = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request(head_only=False)
+
+    def do_HEAD(self):
+        self.handle_request(head_only=True)
+
+    def handle_request(self, head_only):
+        path = unquote(urlsplit(self.path).path)
+        if path == CATALOGUE_URL:
+            self.send_catalogue(head_only)
+        elif path.startswith(AUDIO_URL_PREFIX):
+            self.send_file(self.resolve(self.catalogue.audio_dir, path[len(AUDIO_URL_PREFIX):]), head_only)
+        elif self.static_dir is not None:
+            self.send_file(self.resolve(self.static_dir, path.lstrip("/") or "index.html"), head_only)
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    @staticmethod
+    def resolve(root, relative):
+        """File under root, or None if it does not exist or the path escapes root"""
+        root = root.resolve()
+        path = (root / relative).resolve()
+        if root not in path.parents or not path.is_file():
+            return None
+        return path
+
+    def send_catalogue(self, head_only):
+        body, etag = self.catalogue.get()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")  # Always revalidated: new variants show up at once
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def send_file(self, path, head_only):
+        if path is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        stat = path.stat()
+        size = stat.st_size
+        etag = file_etag(stat)
+        validators = {"ETag": etag, "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+                      "Cache-Control": f"public, max-age={CACHE_MAX_AGE}"}
+        if not_modified(self.headers, etag, stat.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        start, end, status = 0, size - 1, HTTPStatus.OK
+        range_header = self.headers.get("Range")
+        if range_header and range_applies(self.headers, etag, stat.st_mtime):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                byte_range = (0, size - 1)
+            if byte_range is None:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range != (0, size - 1):
+                (start, end), status = byte_range, HTTPStatus.PARTIAL_CONTENT
+        length = max(0, end - start + 1)
+
+        self.send_response(status)
+        self.send_header("Content-Type", CONTENT_TYPES.get(path.suffix.lower(), "application/octet-stream"))
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        for name, value in validators.items():
+            self.send_header(name, value)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if head_only or not length:
+            return
+        with open(path, "rb") as f:
+            self.wfile.flush()
+            # Kernel-to-socket copy (os.sendfile); falls back to plain sends where unsupported
+            self.connection.sendfile(f, start, length)
+
+
+def make_server(audio_dir=AUDIO_DIR, host="127.0.0.1", port=8001, static_dir=None):
+    """ThreadingHTTPServer for the catalogue in audio_dir (port 0 picks a free port)"""
+    handler = type("Handler", (AudioHandler,), {
+        "catalogue": Catalogue(audio_dir),
+        "static_dir": Path(static_dir) if static_dir else None,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def write_synthetic_catalogue(audio_dir, minutes=(5, 10), sample_rate=24000):
+    """Tone-filled stand-ins for every catalogue file, for load tests without a real catalogue"""
+    import soundfile as sf
+
+    audio_dir = Path(audio_dir)
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    for duration in minutes:
+        t = np.arange(duration * 60 * sample_rate, dtype=np.float32) / sample_rate
+        audio = (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        for level in ("principiante", "avanzado"):
+            for music in ("con_musica", "mute"):
+                sf.write(str(audio_dir / f"meditacion_kokoro_{duration}_{level}_{music}.wav"), audio, sample_rate)
+
+
+def load_test(base_url, clients=16, requests_per_client=100, range_bytes=LOADTEST_RANGE_BYTES, seed=0):
+    """Simulated players: each keeps one connection and seeks with ranged GETs
+
+    Every tenth request is a catalogue fetch. Returns throughput and latency
+    percentiles; any unexpected status or short body counts as an error.
+    """
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    connection.request("GET", CATALOGUE_URL)
+    catalogue = json.loads(connection.getresponse().read())
+    connection.close()
+    files = [f for variant in catalogue["variants"] for f in variant["files"]]
+    if not files:
+        raise RuntimeError(f"The catalogue at {base_url} is empty")
+
+    latencies, errors, transferred = [], [0], [0]
+    lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed + index)
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        local_latencies, local_errors, local_bytes = [], 0, 0
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            if i % 10 == 0:
+                conn.request("GET", CATALOGUE_URL)
+                response = conn.getresponse()
+                body = response.read()
+                ok = response.status == 200
+            else:
+                f = rng.choice(files)
+                first = rng.randrange(0, max(1, f["bytes"] - range_bytes))
+                last = min(f["bytes"], first + range_bytes) - 1
+                conn.request("GET", f["url"], headers={"Range": f"bytes={first}-{last}"})
+                response = conn.getresponse()
+                body = response.read()
+                ok = response.status == 206 and len(body) == last - first + 1
+            local_latencies.append(time.perf_counter() - start)
+            local_bytes += len(body)
+            local_errors += not ok
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+            transferred[0] += local_bytes
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "seconds": wall_time,
+        "throughput_rps": len(latencies) / wall_time,
+        "throughput_mb_s": transferred[0] / wall_time / 1e6,
+        "latency_ms": {"p50": float(np.percentile(latencies_ms, 50)), "p99": float(np.percentile(latencies_ms, 99))},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the meditation audio catalogue, or load-test a server")
+    parser.add_argument("command", choices=["serve", "loadtest"])
+    parser.add_argument("--dir", default=AUDIO_DIR, help="Catalogue directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--static", help="Also serve this directory (e.g. web-ui/build) at /")
+    parser.add_argument("--url", help="loadtest: server to test (default: start one locally)")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=100, help="loadtest: requests per client")
+    parser.add_argument("--range-bytes", type=int, default=LOADTEST_RANGE_BYTES)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = make_server(args.dir, args.host, args.port, args.static)
+        print(f"Serving {args.dir} on http://{args.host}:{args.port}{AUDIO_URL_PREFIX} "
+              f"(catalogue: {CATALOGUE_URL})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        server = synthetic_dir = None
+        url = args.url
+        if url is None:
+            audio_dir = args.dir
+            if not Catalogue(audio_dir).scan():
+                audio_dir = synthetic_dir = tempfile.mkdtemp(prefix="audio_catalogue_")
+                print(f"No catalogue in {args.dir}, writing synthetic files to {audio_dir}")
+                write_synthetic_catalogue(audio_dir)
+            server = make_server(audio_dir, args.host, 0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://{args.host}:{server.server_address[1]}"
+        print(f"Load test: {args.clients} clients x {args.requests} requests against {url}")
+        result = load_test(url, args.clients, args.requests, args.range_bytes)
+        print(f"  {result['requests']} requests in {result['seconds']:.2f}s: "
+              f"{result['throughput_rps']:.0f} req/s, {result['throughput_mb_s']:.1f} MB/s, "
+              f"p50 {result['latency_ms']['p50']:.2f} ms, p99 {result['latency_ms']['p99']:.2f} ms, "
+              f"{result['errors']} errors")
+        if server is not None:
+            server.shutdown()
+        if synthetic_dir is not None:
+            shutil.rmtree(synthetic_dir, ignore_errors=True)
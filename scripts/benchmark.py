@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark
+
+Times every stage of the pipeline on synthetic corpora, offline and on CPU:
+1. Builds a packed store of N chunks (random unit vectors, Zipf-distributed
+   text with Pali terms, per-file character offsets) for each requested size
+2. Times chunking, store load, query encoding (stub encoder), search in every
+   mode (exact, IVF, int8, binary, BM25), context assembly, a streamed LLM
+   answer from a fake Ollama server and TTS rendering with a stub synthesiser
+3. Reports throughput and p50/p95/p99 latency per stage as JSON, with the
+   process's peak RSS so far (cumulative: it never goes down between stages)
+4. Optionally compares the results against a stored baseline and exits
+   non-zero when a stage got slower than the tolerance allows
+
+    python benchmark.py run --sizes 10k 100k 1m --output bench.json
+    python benchmark.py run --sizes 10k --baseline bench.json
+    python benchmark.py compare new.json bench.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ann_index import IVFIndex, exact_search, sample_queries
+from context_builder import build_context
+from embedding_store import EmbeddingStoreWriter, open_embedding_store
+from lexical_index import LexicalIndex
+from ollama_client import FakeOllamaServer, OllamaClient
+from quantization import QuantizedIndex
+from tts_renderer import SAMPLE_RATE, iter_audio, parse_guide, write_audio
+
+DIM = 384  # all-MiniLM-L6-v2
+WORDS_PER_CHUNK = 60
+CHUNKS_PER_FILE = 200
+WRITE_BATCH_ROWS = 50000
+TOP_K = 10
+CONTEXT_CANDIDATES = 20
+DEFAULT_QUERIES = 200
+DEFAULT_TOLERANCE = 0.15  # Allowed slowdown before compare reports a regression
+PALI_TERMS = ["satipaṭṭhāna", "jhāna", "nibbāna", "dukkha", "anattā", "sāriputta", "mettā", "vipassanā"]
+LLM_TOKENS = ["Respira ", "suavemente. ", "[Pausa 3 segundos] ", "Observa ", "la ", "mente. "] * 20
+
+
+def parse_size(text: str) -> int:
+    text = text.lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (over all stages run until now, not just the last)"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies, items, wall_time):
+    """Throughput and latency percentiles of one stage"""
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "items": items,
+        "wall_s": wall_time,
+        "throughput_per_s": items / wall_time if wall_time else 0.0,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else 0.0,
+        "p95_ms": float(np.percentile(latencies_ms, 95)) if len(latencies_ms) else 0.0,
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else 0.0,
+        "cumulative_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def timed(calls, items_per_call=1):
+    """Run every callable in `calls`, timing each one"""
+    latencies = []
+    start = time.perf_counter()
+    for call in calls:
+        call_start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, len(latencies) * items_per_call, time.perf_counter() - start)
+
+
+class SyntheticText:
+    """Zipf-distributed words with a sprinkle of Pali terms"""
+
+    def __init__(self, vocabulary_size=20000, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.words = np.array([f"w{i}" for i in range(vocabulary_size)] + PALI_TERMS)
+        weights = 1.0 / np.arange(1, len(self.words) + 1)
+        self.weights = weights / weights.sum()
+
+    def sentences(self, n_words):
+        words = self.rng.choice(self.words, n_words, p=self.weights)
+        return ". ".join(" ".join(words[i:i + 12]) for i in range(0, n_words, 12)) + "."
+
+
+class StubEncoder:
+    """Deterministic stand-in for SentenceTransformer: hashes text to a unit vector"""
+
+    def __init__(self, dim=DIM):
+        self.dim = dim
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=32):
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dim)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_corpus(store_dir, rows, dim=DIM, seed=0):
+    """Write a synthetic packed store; chunks of a file overlap like the real chunker's"""
+    rng = np.random.default_rng(seed)
+    text = SyntheticText(seed=seed)
+    writer = EmbeddingStoreWriter(store_dir, dim)
+    for start in range(0, rows, WRITE_BATCH_ROWS):
+        n = min(WRITE_BATCH_ROWS, rows - start)
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        texts, metadata = [], []
+        for row in range(start, start + n):
+            chunk = text.sentences(WORDS_PER_CHUNK)
+            offset = (row % CHUNKS_PER_FILE) * (len(chunk) - 40)  # ~40 characters of overlap
+            texts.append(chunk)
+            metadata.append({"filename": f"file_{row // CHUNKS_PER_FILE}.txt", "chunk_id": row % CHUNKS_PER_FILE,
+                             "start_char": offset, "end_char": offset + len(chunk)})
+        writer.add(vectors, texts, metadata)
+    writer.close()
+
+
+def bench_chunking(n_documents=50, words_per_document=5000):
+    try:
+        from generate_embeddings import iter_chunks
+    except ImportError as e:  # generate_embeddings needs sentence_transformers and qdrant_client
+        return {"skipped": str(e)}
+    text = SyntheticText(seed=1)
+    documents = [text.sentences(words_per_document) for _ in range(n_documents)]
+    return timed([lambda d=d: list(iter_chunks(d)) for d in documents])
+
+
+def bench_size(rows, work_dir, n_queries, log):
+    """All stages for one corpus size"""
+    results = {}
+    store_dir = os.path.join(work_dir, f"store_{rows}")
+
+    start = time.perf_counter()
+    build_corpus(store_dir, rows)
+    results["build_store"] = summarize([time.perf_counter() - start], rows, time.perf_counter() - start)
+    log(f"built store with {rows} chunks")
+
+    def load():
+        store = open_embedding_store(store_dir)
+        # Touch every page, as the first full scan of a cold store would
+        for block_start in range(0, len(store), WRITE_BATCH_ROWS):
+            float(np.asarray(store.embeddings[block_start:block_start + WRITE_BATCH_ROWS]).sum())
+    results["load"] = timed([load], rows)
+    store = open_embedding_store(store_dir)
+    embeddings = store.embeddings
+
+    encoder = StubEncoder()
+    query_texts = [SyntheticText(seed=2 + i).sentences(12) for i in range(n_queries)]
+    results["encode"] = timed([lambda q=q: encoder.encode([q]) for q in query_texts])
+    queries = sample_queries(embeddings, n_queries)
+
+    results["search.exact"] = timed([lambda q=q: exact_search(embeddings, q, TOP_K) for q in queries])
+    log("exact search done")
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(embeddings, nlist=max(1, int(np.sqrt(rows))))
+    results["index.ivf"] = summarize([time.perf_counter() - start], rows, time.perf_counter() - start)
+    results["search.ivf"] = timed([lambda q=q: ivf.search(embeddings, q, TOP_K) for q in queries])
+
+    for kind in ("int8", "binary"):
+        start = time.perf_counter()
+        quantized = QuantizedIndex.build(embeddings, kind)
+        results[f"index.{kind}"] = summarize([time.perf_counter() - start], rows, time.perf_counter() - start)
+        results[f"search.{kind}"] = timed([lambda q=q, index=quantized: index.search(embeddings, q, TOP_K)
+                                           for q in queries])
+    log("approximate search done")
+
+    start = time.perf_counter()
+    lexical = LexicalIndex.build(store.texts)
+    results["index.bm25"] = summarize([time.perf_counter() - start], rows, time.perf_counter() - start)
+    results["search.bm25"] = timed([lambda t=t: lexical.search(t, TOP_K) for t in query_texts])
+    log("lexical search done")
+
+    candidates = [exact_search(embeddings, q, CONTEXT_CANDIDATES)[0][1] for q in queries]
+    results["context"] = timed([
+        lambda q=q, ids=ids: build_context(q, [(store.texts[i], store.metadata[i]) for i in ids],
+                                           np.asarray(embeddings[ids]))
+        for q, ids in zip(queries, candidates)
+    ])
+    return results
+
+
+def bench_llm(n_requests=20):
+    """Streamed generation against the fake Ollama server: client overhead and time to first token"""
+    with FakeOllamaServer(LLM_TOKENS) as server:
+        client = OllamaClient(server.url)
+        first_tokens = []
+
+        def generate():
+            stats = {}
+            client.generate("prompt " * 500, "stub", stats=stats)
+            first_tokens.append(stats["time_to_first_token"])
+        result = timed([generate] * n_requests)
+        client.close()
+    result["ttft_p50_ms"] = float(np.percentile(first_tokens, 50) * 1000)
+    return result
+
+
+def bench_tts(work_dir, n_guides=5):
+    """Guide -> WAV through the renderer with a stub synthesiser (0.5 s of audio per segment)"""
+    def synthesize(texto, voice, speed, lang_code):
+        return np.full(SAMPLE_RATE // 2, 0.01, dtype=np.float32)
+
+    guide = "".join(LLM_TOKENS)
+    path = os.path.join(work_dir, "bench.wav")
+    return timed([lambda: write_audio(iter_audio(parse_guide(guide), synthesize=synthesize), path)] * n_guides)
+
+
+def run(sizes, n_queries=DEFAULT_QUERIES, work_dir=None, log=print):
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="contemplative-bench-")
+    try:
+        report = {
+            "meta": {
+                "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "queries": n_queries,
+            },
+            "pipeline": {"chunking": bench_chunking(), "llm": bench_llm(), "tts": bench_tts(work_dir)},
+            "sizes": {},
+        }
+        for rows in sizes:
+            log(f"--- {rows} chunks ---")
+            report["sizes"][str(rows)] = bench_size(rows, work_dir, n_queries, log)
+            shutil.rmtree(os.path.join(work_dir, f"store_{rows}"), ignore_errors=True)
+        return report
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def iter_stages(report):
+    """(name, stage result) for every timed stage in a report"""
+    for name, result in report["pipeline"].items():
+        yield name, result
+    for rows, stages in report["sizes"].items():
+        for name, result in stages.items():
+            yield f"{rows}/{name}", result
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Print per-stage changes against a baseline; returns the names of stages that regressed"""
+    baseline_stages = dict(iter_stages(baseline))
+    regressions = []
+    print(f"{'stage':<28} {'p50 ms':>10} {'baseline':>10} {'change':>8}   {'per s':>10} {'change':>8}")
+    for name, result in iter_stages(report):
+        before = baseline_stages.get(name)
+        if before is None or "p50_ms" not in result or "p50_ms" not in before:
+            continue
+        latency_change = result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        throughput_change = result["throughput_per_s"] / before["throughput_per_s"] - 1 \
+            if before["throughput_per_s"] else 0.0
+        regressed = latency_change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {result['p50_ms']:>10.3f} {before['p50_ms']:>10.3f} {latency_change:>+7.0%}   "
+              f"{result['throughput_per_s']:>10.1f} {throughput_change:>+7.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def print_report(report):
+    for name, result in iter_stages(report):
+        if "skipped" in result:
+            print(f"  {name:<28} skipped ({result['skipped']})")
+            continue
+        print(f"  {name:<28} {result['throughput_per_s']:>12.1f}/s  p50 {result['p50_ms']:>9.3f} ms  "
+              f"p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  "
+              f"peak RSS so far {result['cumulative_peak_rss_mb']:>7.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval, generation and TTS stages offline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--sizes", nargs="+", default=["10k"], help="Corpus sizes, e.g. 10k 100k 1m")
+    run_parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES)
+    run_parser.add_argument("--output", help="Write the results to this JSON file")
+    run_parser.add_argument("--baseline", help="Compare against this JSON file")
+    run_parser.add_argument("--work-dir", help="Where the synthetic stores are written (default: a temp dir)")
+    run_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run([parse_size(size) for size in args.sizes], args.queries, args.work_dir)
+        print_report(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {args.output}")
+        baseline_path = args.baseline
+    else:
+        with open(args.results, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        baseline_path = args.baseline
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} stages slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Meditation Catalogue Builder
+
+Generates every audio file the web-ui player can request
+(meditacion_kokoro_{duracion}_{nivel}_{musica}.wav) from a declarative matrix
+of durations x levels x music options:
+1. Works out which variants are missing; everything already on disk is skipped
+2. Retrieves context once per distinct prompt, all prompts in one batch
+3. Generates guides with Ollama, with at most MAX_LLM_IN_FLIGHT calls running
+4. Renders each guide's narration as soon as it arrives, while the next guides
+   are still being generated
+5. Derives the "mute" and "con_musica" files from that single narration, in
+   the same pass that synthesises it: the blocks are mixed with the ducked
+   music bed and written as WAV plus compressed copies (OUTPUT_EXTENSIONS)
+
+Guides and narrations are kept in WORK_DIR, so an interrupted run picks up
+where it stopped. Run from the repository root:
+    python scripts/build_catalogue.py [--matrix catalogue.json] [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import rag_system
+from audio_mix import MusicBed, read_blocks, write_variants
+from meditation_prompts import crear_prompt_con_contexto, instruccion_meditacion
+from ollama_client import get_client
+from tts_cache import SegmentCache
+from tts_renderer import SAMPLE_RATE, iter_audio, parse_guide
+
+# Configuration
+OUTPUT_DIR = "web-ui/public/data/audio"  # Served by the web-ui as /data/audio/...
+WORK_DIR = "data/catalogue"  # Generated guides and narrations (resume state)
+TTS_CACHE_DIR = "data/cache/tts"
+MUSIC_PATH = "data/music/fondo.wav"  # Mono background track at SAMPLE_RATE
+OLLAMA_MODEL = "gemma3:27b"
+TOP_K = 10  # Context chunks retrieved per prompt
+MAX_LLM_IN_FLIGHT = 2  # Guides generated concurrently
+VOICE = "em_alex"
+SPEED = 0.7
+FILENAME_TEMPLATE = "meditacion_kokoro_{duracion}_{nivel}_{musica}.wav"
+OUTPUT_EXTENSIONS = (".wav", ".opus")  # Every variant in each format; Opus is ~10x smaller than the WAV
+
+# Same options as web-ui/src/App.tsx
+DEFAULT_MATRIX = {
+    "durations": [5, 10],
+    "levels": ["principiante", "avanzado"],
+    "music": ["con_musica", "mute"],
+}
+MUSIC_VARIANTS = {"con_musica": True, "mute": False}  # Option -> mixed with music
+
+
+class StageTimer:
+    """Items handled and busy time of one stage (thread-safe)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, started):
+        with self._lock:
+            self.items += items
+            self.busy += time.perf_counter() - started
+
+    def report(self, wall_time):
+        utilisation = 100 * self.busy / wall_time if wall_time else 0.0
+        print(f"  {self.name:<10} {self.items:>4} items  {self.busy:>8.1f}s busy  "
+              f"{utilisation:5.1f}% of wall time")
+
+
+class Guide:
+    """One distinct prompt and the catalogue files that come from its narration"""
+
+    def __init__(self, duracion, nivel):
+        self.duracion = duracion
+        self.nivel = nivel
+        self.instruction = instruccion_meditacion(duracion, nivel)
+        raw = "\x1f".join([self.instruction, OLLAMA_MODEL, str(TOP_K)])
+        self.key = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+        self.variants = {}  # musica -> missing output paths
+
+    @property
+    def name(self):
+        return f"{self.duracion}_{self.nivel}"
+
+    def guide_path(self, work_dir):
+        return Path(work_dir) / "guides" / f"{self.name}_{self.key}.txt"
+
+    def narration_path(self, work_dir):
+        return Path(work_dir) / "narrations" / f"{self.name}_{self.key}.wav"
+
+
+def load_matrix(path=None):
+    matrix = dict(DEFAULT_MATRIX)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            matrix.update(json.load(f))
+    unknown = set(matrix["music"]) - set(MUSIC_VARIANTS)
+    if unknown:
+        raise ValueError(f"Unknown music options: {sorted(unknown)} (known: {list(MUSIC_VARIANTS)})")
+    return matrix
+
+
+def pending_guides(matrix, output_dir):
+    """Guides with at least one missing catalogue file"""
+    guides = {}
+    for duracion in matrix["durations"]:
+        for nivel in matrix["levels"]:
+            for musica in matrix["music"]:
+                path = Path(output_dir) / FILENAME_TEMPLATE.format(duracion=duracion, nivel=nivel, musica=musica)
+                missing = [path.with_suffix(ext) for ext in OUTPUT_EXTENSIONS if not path.with_suffix(ext).exists()]
+                if not missing:
+                    continue
+                guide = guides.setdefault((duracion, nivel), Guide(duracion, nivel))
+                guide.variants[musica] = missing
+    return list(guides.values())
+
+
+def partial_path(path: Path) -> Path:
+    """Temporary name in the same directory, keeping the extension soundfile needs"""
+    return path.with_name(f"{path.stem}.partial{path.suffix}")
+
+
+def write_text_atomic(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = partial_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def retrieve_contexts(guides):
+    """Context for every guide (built as rag_system.rag_query does), with one batched encode and search"""
+    embeddings, texts, metadata, embedding_model = rag_system.load_embeddings_and_texts()
+    index = rag_system.load_search_index()
+    lexical = rag_system.load_lexical_search()
+    cache = rag_system.load_query_cache()
+    try:
+        results = rag_system.query_contexts([guide.instruction for guide in guides], embeddings, texts, metadata,
+                                            embedding_model, TOP_K, index, cache, lexical)
+    finally:
+        cache.close()
+    return {guide.key: context for guide, (_, context, _) in zip(guides, results)}
+
+
+def generate_guide(guide, context, work_dir, timer):
+    started = time.perf_counter()
+    client = get_client(rag_system.OLLAMA_BASE_URL, rag_system.OLLAMA_CONNECT_TIMEOUT, rag_system.OLLAMA_READ_TIMEOUT)
+    text = client.generate(crear_prompt_con_contexto(guide.instruction, context), OLLAMA_MODEL).strip()
+    if not parse_guide(text):
+        raise RuntimeError("the model returned an empty guide")
+    write_text_atomic(guide.guide_path(work_dir), text)
+    timer.add(1, started)
+    return guide
+
+
+def render_variants(guide, work_dir, tts_cache, music_path, timers):
+    """Write every missing file of a guide in one pass over its narration
+
+    The narration streams from the TTS, and is kept in work_dir for resumed
+    runs, unless it is already there. Mute files get the voice alone and
+    con_musica files the voice over the ducked music bed.
+    """
+    started = time.perf_counter()
+    narration = guide.narration_path(work_dir)
+    outputs = {}  # Final path -> mixed with music
+    if narration.exists():
+        blocks = read_blocks(narration)
+        stage = "variants"
+    else:
+        with open(guide.guide_path(work_dir), "r", encoding="utf-8") as f:
+            text = f.read()
+        blocks = iter_audio(parse_guide(text), voice=VOICE, speed=SPEED, cache=tts_cache)
+        outputs[narration] = False
+        stage = "tts"
+    for musica, paths in guide.variants.items():
+        outputs.update((path, MUSIC_VARIANTS[musica]) for path in paths)
+
+    for path in outputs:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    music = MusicBed(music_path, SAMPLE_RATE) if any(outputs.values()) else None
+    try:
+        write_variants(blocks, {partial_path(path): with_music for path, with_music in outputs.items()}, music,
+                       sample_rate=SAMPLE_RATE)
+    finally:
+        if music is not None:
+            music.close()
+    for path in outputs:
+        os.replace(partial_path(path), path)
+    timers[stage].add(1, started)
+    return guide
+
+
+def build_catalogue(matrix, output_dir=OUTPUT_DIR, work_dir=WORK_DIR, music_path=MUSIC_PATH,
+                    llm_workers=MAX_LLM_IN_FLIGHT, dry_run=False):
+    """Generate every missing catalogue file; returns the number of guides that failed"""
+    guides = pending_guides(matrix, output_dir)
+    if not guides:
+        print("Catalogue is complete, nothing to do")
+        return 0
+
+    to_generate = [guide for guide in guides if not guide.guide_path(work_dir).exists()]
+    missing = sum(len(paths) for guide in guides for paths in guide.variants.values())
+    print(f"{missing} files missing from {len(guides)} guides "
+          f"({len(guides) - len(to_generate)} guides already generated)")
+    for guide in guides:
+        print(f"  {guide.name}: {', '.join(sorted(guide.variants))}")
+    if dry_run:
+        return 0
+
+    if any(MUSIC_VARIANTS[musica] for guide in guides for musica in guide.variants) and not Path(music_path).exists():
+        raise FileNotFoundError(f"Background music not found: {music_path}")
+
+    timers = {name: StageTimer(name) for name in ("retrieval", "llm", "tts", "variants")}
+    wall_start = time.perf_counter()
+    failed = 0
+
+    contexts = {}
+    if to_generate:
+        started = time.perf_counter()
+        contexts = retrieve_contexts(to_generate)
+        timers["retrieval"].add(len(to_generate), started)
+
+    tts_cache = SegmentCache(TTS_CACHE_DIR)
+    # One render at a time: iter_audio already spreads a guide over its own worker pool
+    with ThreadPoolExecutor(max_workers=llm_workers) as llm_pool, \
+            ThreadPoolExecutor(max_workers=1) as tts_pool:
+        renders = [tts_pool.submit(render_variants, guide, work_dir, tts_cache, music_path, timers)
+                   for guide in guides if guide not in to_generate]
+        generations = {llm_pool.submit(generate_guide, guide, contexts[guide.key], work_dir, timers["llm"]): guide
+                       for guide in to_generate}
+        for future in as_completed(generations):
+            try:
+                guide = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"✗ {generations[future].name}: generation failed: {e}")
+                continue
+            print(f"✓ Guide {guide.name} generated, rendering audio")
+            renders.append(tts_pool.submit(render_variants, guide, work_dir, tts_cache, music_path, timers))
+
+        for future in as_completed(renders):
+            try:
+                guide = future.result()
+                print(f"✓ {guide.name}: {', '.join(str(path) for paths in guide.variants.values() for path in paths)}")
+            except Exception as e:
+                failed += 1
+                print(f"✗ Rendering failed: {e}")
+
+    wall_time = time.perf_counter() - wall_start
+    print(f"\nCatalogue build finished in {wall_time:.1f}s ({failed} guides failed)")
+    for timer in timers.values():
+        timer.report(wall_time)
+    print(f"  TTS cache: {tts_cache.hits} segments reused, {tts_cache.misses} synthesised")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate every missing meditation in the web-ui catalogue")
+    parser.add_argument("--matrix", help="JSON file with 'durations', 'levels' and/or 'music' lists")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="Directory the web-ui serves audio from")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--music", default=MUSIC_PATH, help="Background music for the con_musica variants")
+    parser.add_argument("--llm-workers", type=int, default=MAX_LLM_IN_FLIGHT)
+    parser.add_argument("--dry-run", action="store_true", help="Only list the missing files")
+    args = parser.parse_args()
+
+    failures = build_catalogue(load_matrix(args.matrix), args.output, args.work_dir, args.music,
+                               args.llm_workers, args.dry_run)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Packed Embedding Store
+
+A single on-disk layout for chunk embeddings, chunk texts and chunk metadata:
+
+    store.json         - header: row count, dimension, version, column schema
+    vectors.f32        - contiguous float32 matrix (rows x dim), opened with np.memmap
+    texts.bin          - UTF-8 chunk texts, concatenated
+    text_offsets.npy   - int64 offsets into texts.bin (rows + 1 entries)
+    meta/<column>.npy  - one array per metadata column (strings are dictionary-encoded)
+
+Opening a store only reads the small header; vectors, texts and numeric columns
+are memory-mapped, so the pages are shared by every process that opens the
+same store.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+HEADER_FILE = "store.json"
+VECTORS_FILE = "vectors.f32"
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "text_offsets.npy"
+META_DIR = "meta"
+
+
+def store_exists(store_dir) -> bool:
+    """Return True if store_dir contains a packed embedding store"""
+    return (Path(store_dir) / HEADER_FILE).exists()
+
+
+class ChunkTexts:
+    """Read-only sequence of chunk texts backed by texts.bin"""
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return bytes(self._data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ChunkMetadata:
+    """Read-only sequence of per-chunk metadata dicts built from the columns"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        return {name: self._store.value(name, idx) for name in self._store.columns}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class EmbeddingStore:
+    """Memory-mapped view over a packed embedding store"""
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / HEADER_FILE, "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+
+        if self.header.get("format") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store format: {self.header.get('format')}")
+
+        self.rows = self.header["rows"]
+        self.dim = self.header["dim"]
+        self.version = self.header["version"]
+        self._schema = self.header["columns"]
+        self._columns = {}
+        self._codes = {}
+
+        if self.rows:
+            self.embeddings = np.memmap(self.store_dir / VECTORS_FILE, dtype=np.float32,
+                                        mode="r", shape=(self.rows, self.dim))
+        else:
+            self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+
+        offsets = np.load(self.store_dir / OFFSETS_FILE, mmap_mode="r")
+        if offsets[-1]:
+            data = np.memmap(self.store_dir / TEXTS_FILE, dtype=np.uint8, mode="r")
+        else:
+            data = np.zeros(0, dtype=np.uint8)
+        self.texts = ChunkTexts(data, offsets)
+        self.metadata = ChunkMetadata(self)
+
+    def __len__(self):
+        return self.rows
+
+    # Pickle only the path so worker processes re-map the same pages instead
+    # of receiving a copy of the matrix.
+    def __getstate__(self):
+        return {"store_dir": str(self.store_dir)}
+
+    def __setstate__(self, state):
+        self.__init__(state["store_dir"])
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._schema)
+
+    def column(self, name):
+        """Return a metadata column as a numpy array"""
+        if name not in self._columns:
+            if self._schema[name]["kind"] == "category":
+                codes, values = self.codes(name)
+                self._columns[name] = np.asarray(values, dtype=object)[codes]
+            else:
+                self._columns[name] = np.load(self.store_dir / META_DIR / f"{name}.npy", mmap_mode="r")
+        return self._columns[name]
+
+    def codes(self, name):
+        """Return the dictionary codes and values of a string column"""
+        spec = self._schema[name]
+        if spec["kind"] != "category":
+            raise ValueError(f"Column '{name}' is not a string column")
+        if name not in self._codes:
+            self._codes[name] = np.load(self.store_dir / META_DIR / f"{name}.npy", mmap_mode="r")
+        return self._codes[name], spec["values"]
+
+    def value(self, name, idx):
+        """Return a single metadata value as a plain Python object"""
+        if self._schema[name]["kind"] == "category":
+            codes, values = self.codes(name)
+            return values[int(codes[idx])]
+        return self.column(name)[idx].item()
+
+
+def open_embedding_store(store_dir) -> EmbeddingStore:
+    """Open a packed embedding store (only the header is read eagerly)"""
+    return EmbeddingStore(store_dir)
+
+
+class EmbeddingStoreWriter:
+    """Append-only writer that produces a packed embedding store
+
+    Rows are streamed to a staging directory and the store is swapped into
+    place atomically by close(), so readers never see a half-written store.
+    """
+
+    def __init__(self, store_dir, dim: Optional[int] = None):
+        self.store_dir = Path(store_dir)
+        self.staging_dir = self.store_dir.with_name(f"{self.store_dir.name}.tmp-{os.getpid()}")
+        if self.staging_dir.exists():
+            shutil.rmtree(self.staging_dir)
+        self.staging_dir.mkdir(parents=True)
+
+        self.dim = dim
+        self.rows = 0
+        self._vectors = open(self.staging_dir / VECTORS_FILE, "wb")
+        self._texts = open(self.staging_dir / TEXTS_FILE, "wb")
+        self._offsets = [0]
+        self._columns: Dict[str, list] = {}
+        self._hash = hashlib.sha256()
+
+    def add(self, embeddings, texts, metadata):
+        """Append a batch of rows: an (n, dim) matrix, n texts and n metadata dicts"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) != len(texts) or len(texts) != len(metadata):
+            raise ValueError("embeddings, texts and metadata must have the same number of rows")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected dimension {self.dim}, got {embeddings.shape[1]}")
+
+        buf = embeddings.tobytes()
+        self._vectors.write(buf)
+        self._hash.update(buf)
+
+        for text, meta in zip(texts, metadata):
+            encoded = text.encode("utf-8")
+            self._texts.write(encoded)
+            self._hash.update(encoded)
+            self._offsets.append(self._offsets[-1] + len(encoded))
+
+            for name in meta:
+                if name not in self._columns:
+                    self._columns[name] = [None] * self.rows
+            for name, values in self._columns.items():
+                values.append(meta.get(name))
+            self.rows += 1
+
+    def close(self) -> Path:
+        """Finish writing and atomically replace store_dir with the new store"""
+        self._vectors.close()
+        self._texts.close()
+
+        np.save(self.staging_dir / OFFSETS_FILE, np.asarray(self._offsets, dtype=np.int64))
+        (self.staging_dir / META_DIR).mkdir()
+        schema = {name: _write_column(self.staging_dir / META_DIR / f"{name}.npy", values)
+                  for name, values in self._columns.items()}
+
+        header = {
+            "format": STORE_FORMAT_VERSION,
+            "rows": self.rows,
+            "dim": self.dim or 0,
+            "version": self._hash.hexdigest()[:16],
+            "columns": schema,
+        }
+        with open(self.staging_dir / HEADER_FILE, "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+
+        old_dir = None
+        if self.store_dir.exists():
+            old_dir = self.store_dir.with_name(f"{self.store_dir.name}.old-{os.getpid()}")
+            os.replace(self.store_dir, old_dir)
+        os.replace(self.staging_dir, self.store_dir)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        return self.store_dir
+
+    def abort(self):
+        """Discard everything written so far"""
+        self._vectors.close()
+        self._texts.close()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def _write_column(path, values):
+    """Write one metadata column and return its schema entry"""
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        np.save(path, np.asarray([bool(v) for v in values]))
+        return {"kind": "bool"}
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present) \
+            and len(present) == len(values):
+        np.save(path, np.asarray(values, dtype=np.int64))
+        return {"kind": "int"}
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        np.save(path, np.asarray([np.nan if v is None else v for v in values], dtype=np.float64))
+        return {"kind": "float"}
+
+    # Everything else is stored as dictionary-encoded strings
+    lookup = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        key = "" if value is None else str(value)
+        codes[i] = lookup.setdefault(key, len(lookup))
+    np.save(path, codes)
+    return {"kind": "category", "values": list(lookup)}
+
+
+def write_embedding_store(store_dir, embeddings, texts, metadata) -> Path:
+    """Write a complete store in one call"""
+    writer = EmbeddingStoreWriter(store_dir, dim=np.asarray(embeddings).shape[1])
+    try:
+        writer.add(embeddings, texts, metadata)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def pack_legacy_directory(embeddings_dir, texts_dir, store_dir) -> Path:
+    """Convert a directory of per-chunk .npy/.json files into a packed store
+
+    `store_dir` must be outside `embeddings_dir`: the writer replaces the whole
+    store directory on close, which would delete the files being converted.
+    """
+    embeddings_dir = Path(embeddings_dir)
+    store_dir = Path(store_dir)
+    source, target = embeddings_dir.resolve(), store_dir.resolve()
+    if source == target or target in source.parents:
+        raise ValueError(f"Store directory {store_dir} would replace the legacy files in {embeddings_dir}; "
+                         f"write the store somewhere else")
+    sutta_texts = {}
+    writer = None
+
+    for embedding_file in sorted(embeddings_dir.glob("*.npy")):
+        embedding = np.load(embedding_file).astype(np.float32).reshape(1, -1)
+
+        metadata_file = embedding_file.with_suffix(".json")
+        if metadata_file.exists():
+            with open(metadata_file, "r") as f:
+                meta = json.load(f)
+        else:
+            meta = {"filename": embedding_file.stem, "chunk_id": 0}
+
+        # Legacy chunks have no stored text, fall back to the whole sutta
+        text = meta.pop("text", None)
+        if text is None:
+            filename = meta["filename"]
+            if filename not in sutta_texts:
+                text_file = Path(texts_dir) / f"{Path(filename).stem}.txt"
+                if text_file.exists():
+                    with open(text_file, "r", encoding="utf-8") as f:
+                        sutta_texts[filename] = f.read()
+                else:
+                    sutta_texts[filename] = f"Text from {filename}"
+            text = sutta_texts[filename]
+
+        if writer is None:
+            writer = EmbeddingStoreWriter(store_dir, dim=embedding.shape[1])
+        writer.add(embedding, [text], [meta])
+
+    if writer is None:
+        raise FileNotFoundError(f"No .npy embeddings found in {embeddings_dir}")
+    return writer.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "pack-legacy":
+        out = pack_legacy_directory(sys.argv[2], sys.argv[3], sys.argv[4])
+        store = open_embedding_store(out)
+        print(f"Packed {len(store)} embeddings (dim: {store.dim}) into {out}")
+    elif len(sys.argv) == 3 and sys.argv[1] == "info":
+        store = open_embedding_store(sys.argv[2])
+        print(f"Rows: {len(store)}")
+        print(f"Dimension: {store.dim}")
+        print(f"Version: {store.version}")
+        print(f"Columns: {', '.join(store.columns)}")
+    else:
+        print("Usage:")
+        print("  python embedding_store.py pack-legacy <embeddings_dir> <texts_dir> <store_dir>")
+        print("  python embedding_store.py info <store_dir>")
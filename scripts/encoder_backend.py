@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Encoder Backend
+
+CPU inference backends for the sentence-transformers embedding models:
+1. "torch": the reference fp32 PyTorch model
+2. "int8": the same model with its Linear layers dynamically quantized to int8
+3. "onnx": the model exported to an ONNX graph and run by ONNX Runtime
+   (needs: pip install "sentence-transformers[onnx]")
+
+Every backend is wrapped in an Encoder that sorts the inputs by token length
+and cuts them into dynamic batches of at most TOKENS_PER_BATCH padded tokens,
+so short chunks are never padded to the length of long ones. Encoder keeps
+the SentenceTransformer interface (encode, tokenizer, max_seq_length...), so
+it is a drop-in replacement.
+
+Check that a backend stays close to the reference and compare throughput:
+    python encoder_backend.py bench --model all-mpnet-base-v2 --backends torch int8 onnx --threads 8
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+BACKENDS = ("torch", "int8", "onnx")
+ENCODER_THREADS = None  # Intra-op threads; None keeps the library default (one per core)
+TOKENS_PER_BATCH = 8192  # Padded tokens per forward pass (batch size x longest input)
+MAX_BATCH_SIZE = 128  # Inputs per forward pass, whatever their length
+PARITY_THRESHOLD = 0.99  # Minimum cosine similarity to the reference model's vectors
+
+
+class Encoder:
+    """SentenceTransformer with length-bucketed dynamic batching"""
+
+    def __init__(self, model, backend="torch", tokens_per_batch=TOKENS_PER_BATCH, max_batch_size=MAX_BATCH_SIZE):
+        self.model = model
+        self.backend = backend
+        self.tokens_per_batch = tokens_per_batch
+        self.max_batch_size = max_batch_size
+
+    def __getattr__(self, name):
+        # tokenizer, max_seq_length, get_sentence_embedding_dimension... come from the model
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def token_lengths(self, texts):
+        """Input length of every text in tokens, as the model will see it (truncated)"""
+        ids = self.model.tokenizer(texts, add_special_tokens=True, truncation=True,
+                                   max_length=self.model.max_seq_length)["input_ids"]
+        return np.fromiter(map(len, ids), dtype=np.int64, count=len(texts))
+
+    def batches(self, lengths):
+        """Index lists of similar-length inputs, each within the padded-token budget"""
+        batches, current = [], []
+        for i in np.argsort(lengths, kind="stable").tolist():
+            # Inputs come in increasing length, so the newest one sets the padded width
+            if current and (len(current) >= self.max_batch_size
+                            or (len(current) + 1) * lengths[i] > self.tokens_per_batch):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def encode(self, sentences, batch_size=None, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        """Embeddings of one text or a list of texts, in input order (batch_size is ignored)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        kwargs.pop("show_progress_bar", None)
+        embeddings = np.zeros((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        if texts:
+            for batch in self.batches(self.token_lengths(texts)):
+                embeddings[batch] = self.model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                                      convert_to_numpy=True, show_progress_bar=False,
+                                                      normalize_embeddings=normalize_embeddings, **kwargs)
+        return embeddings[0] if single else embeddings
+
+
+def set_threads(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def load_model(model_name, backend="torch", threads=ENCODER_THREADS):
+    """The bare SentenceTransformer for a backend, on the CPU"""
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    if threads:
+        set_threads(threads)
+
+    if backend == "onnx":
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError('The onnx backend needs: pip install "sentence-transformers[onnx]"') from e
+        if threads:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            model_kwargs["session_options"] = options
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+        # Weights of every Linear layer become int8; activations are quantized on the fly
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def load_encoder(model_name, backend="torch", threads=ENCODER_THREADS, tokens_per_batch=TOKENS_PER_BATCH):
+    """Encoder for model_name on the given backend"""
+    return Encoder(load_model(model_name, backend, threads), backend, tokens_per_batch)
+
+
+def model_key(model_name, backend="torch"):
+    """Name under which a backend's vectors are cached (they differ slightly from the reference)"""
+    return model_name if backend == "torch" else f"{model_name}:{backend}"
+
+
+def parity(reference, candidate, texts):
+    """Cosine similarity between the two encoders' vectors of the same texts"""
+    a = np.asarray(reference.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    b = np.asarray(candidate.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    cosine = np.sum(a * b, axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    return {"min": float(cosine.min()), "mean": float(cosine.mean())}
+
+
+def sentences_per_second(encoder, texts, repeats=1):
+    encoder.encode(texts[:8], convert_to_numpy=True)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        encoder.encode(texts, convert_to_numpy=True)
+    return repeats * len(texts) / (time.perf_counter() - start)
+
+
+def sample_texts(n, store_dir=None, seed=0):
+    """Chunks from a packed store, or synthetic texts of mixed lengths"""
+    rng = np.random.default_rng(seed)
+    if store_dir:
+        from embedding_store import open_embedding_store
+        store = open_embedding_store(store_dir)
+        return [store.texts[i] for i in rng.choice(len(store), min(n, len(store)), replace=False)]
+    words = ("the mind breath body feeling calm insight mindfulness suffering release "
+             "attention awareness concentration craving peace monks blessed one said").split()
+    return [" ".join(rng.choice(words, int(rng.integers(5, 300)))) for _ in range(n)]
+
+
+def benchmark(model_name, backends=BACKENDS, texts=(), threads=ENCODER_THREADS, threshold=PARITY_THRESHOLD):
+    """Sentences/sec and parity with the fp32 reference for every backend
+
+    The first row is the reference model with its default batching, the
+    baseline the bucketed backends are compared with.
+    """
+    texts = list(texts)
+    reference = load_model(model_name, "torch", threads)
+    rows = [{"backend": "torch (default batching)", "sentences_per_second": sentences_per_second(reference, texts),
+             "min_cosine": 1.0, "mean_cosine": 1.0, "ok": True}]
+    for backend in backends:
+        try:
+            encoder = load_encoder(model_name, backend, threads)
+        except ImportError as e:
+            print(f"  {backend}: skipped ({e})")
+            continue
+        similarity = parity(reference, encoder, texts)
+        rows.append({"backend": backend, "sentences_per_second": sentences_per_second(encoder, texts),
+                     "min_cosine": similarity["min"], "mean_cosine": similarity["mean"],
+                     "ok": similarity["min"] >= threshold})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare encoder backends: throughput and parity with fp32")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--model", default="all-mpnet-base-v2")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=ENCODER_THREADS)
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--store", help="Packed store to sample real chunks from (default: synthetic texts)")
+    parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD)
+    args = parser.parse_args()
+
+    texts = sample_texts(args.sentences, args.store)
+    print(f"{args.model}: {len(texts)} texts, threads={args.threads or 'default'}")
+    rows = benchmark(args.model, args.backends, texts, args.threads, args.threshold)
+    baseline = rows[0]["sentences_per_second"]
+    for row in rows:
+        print(f"  {row['backend']:<26} {row['sentences_per_second']:>8.1f} sentences/s "
+              f"({row['sentences_per_second'] / baseline:4.2f}x)  "
+              f"cosine min {row['min_cosine']:.4f} mean {row['mean_cosine']:.4f}"
+              f"{'' if row['ok'] else f'  BELOW {args.threshold}'}")
+    sys.exit(0 if all(row["ok"] for row in rows) else 1)
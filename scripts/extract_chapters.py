@@ -1,26 +1,185 @@
 import os
-from bs4 import BeautifulSoup
-
-# Directories
-mn_dir = '../data/tipitaka/mn'
-out_dir = '../data/texts/tripitaka/mn'
-
-# Ensure output directory exists
-os.makedirs(out_dir, exist_ok=True)
-
-# Iterate through all files in mn_dir
-for filename in os.listdir(mn_dir):
-    if filename.endswith('.html'):
-        in_path = os.path.join(mn_dir, filename)
-        out_path = os.path.join(out_dir, os.path.splitext(filename)[0] + '.txt')
-        with open(in_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f, 'html.parser')
-            chapter_div = soup.find('div', class_='chapter')
-            if chapter_div:
-                text = chapter_div.get_text(separator='\n', strip=True)
-                with open(out_path, 'w', encoding='utf-8') as out_f:
-                    out_f.write(text)
-            else:
-                # If no chapter div, write a note or skip
-                with open(out_path, 'w', encoding='utf-8') as out_f:
-                    out_f.write('[No <div class="chapter"> found]') 
\ No newline at end of file
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer, builder_registry
+
+# Directories: one sub-directory per collection (Nikāya) under each root
+html_root = '../data/tipitaka'
+texts_root = '../data/texts/tripitaka'
+collections = ('mn', 'dn', 'sn', 'an', 'kn')
+
+# Records input mtime/size/hash so unchanged files are skipped on the next run
+MANIFEST_NAME = '.extract_manifest.json'
+NO_CHAPTER_TEXT = '[No <div class="chapter"> found]'
+SLOWEST_FILES_SHOWN = 5
+# lxml is faster but its text can differ (it drops NUL characters); opt in with --parser lxml [verify]
+DEFAULT_PARSER = 'html.parser'
+SUBDIR_SEPARATOR = '__'  # Joins kn sub-directories into flat text names (see sharded_index.translator_of)
+
+
+def resolve_parser(parser):
+    """The requested BeautifulSoup parser, or html.parser (with a warning) if it is not installed"""
+    parser = parser or DEFAULT_PARSER
+    if builder_registry.lookup(parser) is None:
+        print(f"Parser '{parser}' is not installed, falling back to html.parser")
+        return 'html.parser'
+    return parser
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def chapter_text(html, parser, chapter_only=False):
+    """Text of the <div class="chapter">, one line per text node
+
+    chapter_only=True builds just the chapter's tree, skipping the rest of the page.
+    """
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer('div', class_='chapter') if chapter_only else None)
+    chapter_div = soup.find('div', class_='chapter')
+    if chapter_div:
+        return chapter_div.get_text(separator='\n', strip=True)
+    # If no chapter div, write a note
+    return NO_CHAPTER_TEXT
+
+
+def extract_chapter(in_path, out_path, parser, verify=False):
+    """Write the chapter text of one HTML file
+
+    With verify=True the result is compared against html.parser, and the
+    html.parser text is written if the two backends disagree. The check
+    reuses the file already read and the first parse's text; its html.parser
+    pass only builds the chapter div.
+    Returns (seconds taken, whether the backends disagreed).
+    """
+    start = time.perf_counter()
+    with open(in_path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    text = chapter_text(html, parser)
+    mismatch = False
+    if verify and parser != 'html.parser':
+        reference = chapter_text(html, 'html.parser', chapter_only=True)
+        if reference != text:
+            mismatch = True
+            text = reference
+    with open(out_path, 'w', encoding='utf-8') as out_f:
+        out_f.write(text)
+    return time.perf_counter() - start, mismatch
+
+
+def load_manifest(out_dir):
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest, out_dir):
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def html_files(html_dir):
+    """(relative path, path) of every HTML file under html_dir; kn keeps its books in sub-directories
+
+    The relative path uses '/' on every platform and keys the manifest, since
+    file names repeat across sub-directories (e.g. each book's index.html).
+    """
+    found = []
+    for dirpath, _, filenames in os.walk(html_dir):
+        for filename in filenames:
+            if filename.endswith('.html'):
+                path = os.path.join(dirpath, filename)
+                found.append((os.path.relpath(path, html_dir).replace(os.sep, '/'), path))
+    return sorted(found)
+
+
+def text_name(rel_path):
+    """Flat output name of an HTML file: dhp/dhp.01.than.html -> dhp__dhp.01.than.txt
+
+    The texts directory stays flat so generate_embeddings.py finds every file.
+    Directories are joined with SUBDIR_SEPARATOR, so the leaf name (which
+    carries the translator code) stays recognisable.
+    """
+    return os.path.splitext(rel_path)[0].replace('/', SUBDIR_SEPARATOR) + '.txt'
+
+
+def extract_all(collection='mn', workers=None, parser=None, force=False, verify=False):
+    """Extract every changed HTML file of one collection using a process pool"""
+    parser = resolve_parser(parser)
+    html_dir = os.path.join(html_root, collection)
+    out_dir = os.path.join(texts_root, collection)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if force else load_manifest(out_dir)
+    new_manifest = {}
+
+    jobs = []
+    skipped = 0
+    for filename, in_path in html_files(html_dir):
+        out_path = os.path.join(out_dir, text_name(filename))
+        stat = os.stat(in_path)
+        entry = manifest.get(filename)
+        if entry and os.path.exists(out_path):
+            if entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                new_manifest[filename] = entry
+                skipped += 1
+                continue
+            # Touched but identical content
+            digest = file_hash(in_path)
+            if entry['hash'] == digest:
+                new_manifest[filename] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': digest}
+                skipped += 1
+                continue
+        jobs.append((filename, in_path, out_path, stat))
+
+    print(f"{collection}: extracting {len(jobs)} files with {parser} ({skipped} unchanged)")
+    timings = []
+    mismatches = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(job, pool.submit(extract_chapter, job[1], job[2], parser, verify)) for job in jobs]
+        for (filename, in_path, _, stat), future in futures:
+            try:
+                seconds, mismatch = future.result()
+                timings.append((seconds, filename))
+                if mismatch:
+                    mismatches.append(filename)
+                new_manifest[filename] = {'mtime': stat.st_mtime, 'size': stat.st_size,
+                                          'hash': file_hash(in_path)}
+            except Exception as e:
+                print(f"Error extracting {filename}: {e}")
+    wall_time = time.perf_counter() - start
+
+    save_manifest(new_manifest, out_dir)
+
+    if timings:
+        total = sum(t for t, _ in timings)
+        print(f"Extracted {len(timings)} files in {wall_time:.2f}s "
+              f"(cpu {total:.2f}s, mean {total / len(timings) * 1000:.1f} ms/file)")
+        print("Slowest files:")
+        for seconds, filename in sorted(timings, reverse=True)[:SLOWEST_FILES_SHOWN]:
+            print(f"  {filename}: {seconds * 1000:.1f} ms")
+    if mismatches:
+        print(f"{parser} output differed from html.parser for: {', '.join(mismatches)} (html.parser kept)")
+    return timings
+
+
+if __name__ == '__main__':
+    # Usage: python extract_chapters.py [mn dn ...] [force] [verify] [--parser html.parser|lxml] [--workers N]
+    args = sys.argv[1:]
+    parser = args[args.index('--parser') + 1] if '--parser' in args else None
+    workers = int(args[args.index('--workers') + 1]) if '--workers' in args else None
+    selected = [arg for arg in args if arg in collections] or collections
+    for collection in selected:
+        if not os.path.isdir(os.path.join(html_root, collection)):
+            print(f"{collection}: no HTML in {os.path.join(html_root, collection)}, skipped")
+            continue
+        extract_all(collection, workers=workers, parser=parser, force='force' in args, verify='verify' in args)
@@ -1,52 +1,154 @@
 import os
+import copy
 import json
 import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
 import re
 import uuid
+import hashlib
+import queue
+import shutil
+import threading
+import time
+from typing import NamedTuple
+
+from ann_index import build_index
+from encoder_backend import load_encoder
+from embedding_store import EmbeddingStoreWriter, open_embedding_store, store_exists
+from lexical_index import build_lexical_index
+from quantization import build_quantized
+from sharded_index import COLLECTIONS, shard_fields
+from vector_store import ID_FIELD, open_vector_store
 
 # Configuration
 MODEL_NAME = "all-MiniLM-L6-v2"  # Small, fast embedding model
-TEXTS_DIR = "../data/texts/tripitaka/mn"
-COLLECTION_NAME = "buddhist_texts_mn"
-CHUNK_SIZE = 512  # Maximum tokens per chunk
-CHUNK_OVERLAP = 50  # Overlap between chunks
+ENCODER_BACKEND = "torch"  # "torch", "int8" or "onnx" (see encoder_backend.py); changing it re-embeds everything
+ENCODER_THREADS = None  # CPU threads for encoding; None = one per core
+TEXTS_ROOT = "../data/texts/tripitaka"  # Texts of each collection (mn, dn, sn, an, kn) in a sub-directory
+STORE_ROOT = "../data/embeddings/tripitaka"  # One packed store (shard) per collection, read by rag_system.py
+BUILD_ANN_INDEX = False  # Build the IVF index next to the packed store (rag_system.USE_ANN_INDEX must be on to use it)
+BUILD_LEXICAL_INDEX = True  # Build the BM25 index used by hybrid search (see lexical_index.py)
+BUILD_QUANTIZED = ("int8", "binary")  # Quantized codes built next to the packed store (see quantization.py)
+MANIFEST_TEMPLATE = "../data/embeddings/tripitaka/{collection}_manifest.json"  # Per-file hashes for incremental runs
+POINT_ID_NAMESPACE = uuid.UUID("6f1c8d2e-3b0a-5c47-9e21-7d4b8a90c3f5")  # Namespace for point ids
+CHUNK_SIZE = 512  # Maximum tokens (or characters in "chars" mode) per chunk, capped by the model's max_seq_length
+CHUNK_OVERLAP = 50  # Overlap between chunks (tokens, or words in "chars" mode)
+CHUNK_UNIT = "tokens"  # "tokens" sizes chunks with the model tokenizer, "chars" is the legacy character mode
+SENTENCE_PATTERN = re.compile(r'[^.!?]+')
+WORD_PATTERN = re.compile(r'\S+')
+ENCODE_BATCH_SIZE = 128  # Chunks per model.encode call, drawn across file boundaries
+UPLOAD_BATCH_SIZE = 1024  # Rows per upload to the mirror store
+QUEUE_SIZE = 16  # Items buffered between pipeline stages
 
-# Qdrant configuration
-QDRANT_HOST = "localhost"
-QDRANT_PORT = 6333
+# The packed store is the project's vector store and needs no server. Changed chunks can
+# also be mirrored to a server store (see vector_store.py), one per collection, e.g.
+# "qdrant:buddhist_texts_{collection}@localhost:6333"
+MIRROR_STORE = None
 
-def split_text_into_chunks(text, max_length=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    """Split text into overlapping chunks"""
-    # Clean and normalize text
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Split into sentences first (rough approximation)
-    sentences = re.split(r'[.!?]+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        # If adding this sentence would exceed max_length
-        if len(current_chunk + " " + sentence) > max_length and current_chunk:
-            chunks.append(current_chunk.strip())
-            # Start new chunk with overlap
-            words = current_chunk.split()
-            overlap_words = words[-overlap:] if len(words) > overlap else words
-            current_chunk = " ".join(overlap_words) + " " + sentence
+class TextChunk(NamedTuple):
+    """A chunk of text and the character span it covers in the source text"""
+    text: str
+    start_char: int
+    end_char: int
+    length: int  # In characters or tokens, depending on the chunk unit
+
+def iter_sentences(text):
+    """Yield the (start, end) word spans of each sentence, in order
+    
+    Sentences are split on runs of . ! ? and words on whitespace, so joining
+    a chunk's words with single spaces gives the same text as the original
+    whitespace-normalising splitter.
+    """
+    for sentence in SENTENCE_PATTERN.finditer(text):
+        offset = sentence.start()
+        words = [(offset + m.start(), offset + m.end()) for m in WORD_PATTERN.finditer(sentence.group())]
+        if words:
+            yield words
+
+def token_counter(tokenizer):
+    """Return a function giving the number of word-pieces of each word (cached per word)"""
+    cache = {}
+    
+    def count(words):
+        missing = [w for w in set(words) if w not in cache]
+        if missing:
+            ids = tokenizer(missing, add_special_tokens=False)["input_ids"]
+            cache.update(zip(missing, map(len, ids)))
+        return [cache[w] for w in words]
+    
+    return count
+
+def iter_chunks(text, max_length=CHUNK_SIZE, overlap=CHUNK_OVERLAP, tokenizer=None):
+    """Yield overlapping TextChunks in a single pass over the sentences
+    
+    Without a tokenizer, max_length is measured in characters and overlap in
+    words (the legacy behaviour). With a tokenizer both are measured in
+    word-pieces, and sentences longer than max_length are split at word
+    boundaries so nothing is lost to the model's truncation.
+    """
+    count_tokens = token_counter(tokenizer) if tokenizer is not None else None
+    
+    # Current chunk: word spans, their sizes and the running total
+    words, sizes, total = [], [], 0
+    
+    def make_chunk():
+        chunk_text = " ".join(text[start:end] for start, end in words)
+        return TextChunk(chunk_text, words[0][0], words[-1][1],
+                         total if count_tokens else len(chunk_text))
+    
+    def overlap_tail(room):
+        """Trailing words kept as the start of the next chunk"""
+        if count_tokens is None:
+            keep = min(overlap, len(words)) if overlap > 0 else 0
         else:
-            current_chunk += " " + sentence if current_chunk else sentence
+            # Never let the overlap push the next chunk past max_length
+            keep, budget = 0, min(overlap, room)
+            while keep < len(sizes) and sizes[-1 - keep] <= budget:
+                budget -= sizes[-1 - keep]
+                keep += 1
+        return keep
     
-    # Add the last chunk if it exists
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    for sentence in iter_sentences(text):
+        if count_tokens is None:
+            # Characters, including the joining spaces
+            sentence_sizes = [end - start + 1 for start, end in sentence]
+            pieces = [(sentence, sentence_sizes)]
+        else:
+            sentence_sizes = count_tokens([text[start:end] for start, end in sentence])
+            pieces = split_long_sentence(sentence, sentence_sizes, max_length)
+        
+        for piece, piece_sizes in pieces:
+            piece_total = sum(piece_sizes)
+            # In characters this equals len(current_chunk + " " + sentence)
+            projected = total + piece_total - (0 if count_tokens else 1)
+            if words and projected > max_length:
+                yield make_chunk()
+                keep = overlap_tail(max_length - piece_total)
+                words, sizes = (words[-keep:], sizes[-keep:]) if keep else ([], [])
+                total = sum(sizes)
+            words.extend(piece)
+            sizes.extend(piece_sizes)
+            total += piece_total
     
-    return chunks
+    if words:
+        yield make_chunk()
+
+def split_long_sentence(words, sizes, max_length):
+    """Split a sentence into word runs that each fit in max_length tokens"""
+    if sum(sizes) <= max_length:
+        return [(words, sizes)]
+    pieces, start, running = [], 0, 0
+    for i, size in enumerate(sizes):
+        if running + size > max_length and i > start:
+            pieces.append((words[start:i], sizes[start:i]))
+            start, running = i, 0
+        running += size
+    pieces.append((words[start:], sizes[start:]))
+    return pieces
+
+def split_text_into_chunks(text, max_length=CHUNK_SIZE, overlap=CHUNK_OVERLAP, tokenizer=None):
+    """Split text into overlapping chunks"""
+    return [chunk.text for chunk in iter_chunks(text, max_length, overlap, tokenizer)]
 
 def get_embeddings(text_chunks, model):
     """Get embeddings for multiple text chunks"""
@@ -57,148 +159,510 @@ def get_embeddings(text_chunks, model):
         print(f"Error getting embeddings: {e}")
         return None
 
-def setup_qdrant_collection(client, collection_name, vector_size):
-    """Setup Qdrant collection with proper configuration"""
-    try:
-        # Check if collection exists
-        collections = client.get_collections()
-        collection_names = [col.name for col in collections.collections]
-        
-        if collection_name in collection_names:
-            print(f"Collection '{collection_name}' already exists")
-            return True
-        else:
-            # Create new collection
-            client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=vector_size,
-                    distance=Distance.COSINE
-                )
-            )
-            print(f"Created collection '{collection_name}' with vector size {vector_size}")
-            return True
-    except Exception as e:
-        print(f"Error setting up Qdrant collection: {e}")
-        return False
+def point_id(filename, chunk_id):
+    """Deterministic row id, so re-runs replace rows instead of duplicating them"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{filename}:{chunk_id}"))
 
-def store_embeddings_in_qdrant(client, collection_name, embeddings, chunks, metadata):
-    """Store embeddings and metadata in Qdrant"""
-    try:
-        points = []
-        for i, (embedding, chunk) in enumerate(zip(embeddings, chunks)):
-            point = PointStruct(
-                id=str(uuid.uuid4()),
-                vector=embedding.tolist(),
-                payload={
-                    "text": chunk,
-                    "chunk_id": i,
-                    "filename": metadata["filename"],
-                    "original_text_length": metadata["original_text_length"],
-                    "chunk_size": metadata["chunk_size"],
-                    "chunk_overlap": metadata["chunk_overlap"],
-                    "model": metadata["model"],
-                    "chunk_length": len(chunk)
-                }
-            )
-            points.append(point)
-        
-        # Upload points to Qdrant
-        client.upsert(
-            collection_name=collection_name,
-            points=points
-        )
-        
-        print(f"✓ Stored {len(points)} embeddings in Qdrant collection '{collection_name}'")
-        return True
-    except Exception as e:
-        print(f"Error storing embeddings in Qdrant: {e}")
-        return False
+class StageStats:
+    """Chunks handled and busy time of one pipeline stage"""
+    
+    def __init__(self, name):
+        self.name = name
+        self.chunks = 0
+        self.busy = 0.0
+    
+    def add(self, chunks, started):
+        self.chunks += chunks
+        self.busy += time.perf_counter() - started
+    
+    def report(self, wall_time):
+        rate = self.chunks / self.busy if self.busy else 0.0
+        utilisation = 100 * self.busy / wall_time if wall_time else 0.0
+        print(f"  {self.name:<8} {self.chunks:>7} chunks  {rate:>9.1f} chunks/s busy  "
+              f"{utilisation:5.1f}% of wall time")
 
-def process_text_files():
-    """Process all text files and generate embeddings"""
+class StoreUploader(threading.Thread):
+    """Background thread that batches rows and uploads them to a vector store while encoding continues"""
     
-    # Initialize Qdrant client
-    print(f"Connecting to Qdrant at {QDRANT_HOST}:{QDRANT_PORT}")
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    def __init__(self, store, batch_size=UPLOAD_BATCH_SIZE):
+        super().__init__(daemon=True)
+        self.store = store
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.stats = StageStats("upload")
+        self.failed = set()  # Filenames whose rows could not be stored
+        self._ids, self._vectors, self._texts, self._payloads, self._files = [], [], [], [], set()
+        self._buffered = 0
     
-    # Load the embedding model
-    print(f"Loading model: {MODEL_NAME}")
-    model = SentenceTransformer(MODEL_NAME)
+    def upsert(self, embeddings, chunks, payloads):
+        if len(payloads):
+            self.queue.put(("upsert", embeddings, chunks, payloads))
     
-    # Get all text files
-    texts_path = Path(TEXTS_DIR)
-    text_files = list(texts_path.glob("*.txt"))
+    def delete(self, filename, chunk_ids):
+        if len(chunk_ids):
+            self.queue.put(("delete", filename, chunk_ids))
     
-    print(f"Found {len(text_files)} text files to process")
+    def close(self):
+        """Flush what is left and wait for the thread to finish"""
+        self.queue.put(None)
+        self.join()
     
-    # Process each file
-    for text_file in text_files:
-        print(f"Processing {text_file.name}...")
-        
-        # Read text content
-        try:
-            with open(text_file, 'r', encoding='utf-8') as f:
-                text_content = f.read().strip()
-            
-            # Skip empty files or files with placeholder content
-            if not text_content or text_content == '[No <div class="chapter"> found]':
-                print(f"Skipping {text_file.name} - empty or no chapter content")
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if item[0] == "delete":
+                _, filename, chunk_ids = item
+                if not self._delete_rows(filename, chunk_ids):
+                    self.failed.add(filename)
                 continue
-            
-            # Split text into chunks
-            chunks = split_text_into_chunks(text_content)
-            print(f"  Split into {len(chunks)} chunks")
-            
-            # Get embeddings for all chunks
-            embeddings = get_embeddings(chunks, model)
-            
-            if embeddings is not None:
-                # Setup Qdrant collection if this is the first file
-                if text_file == text_files[0]:
-                    if not setup_qdrant_collection(client, COLLECTION_NAME, embeddings.shape[1]):
-                        print("Failed to setup Qdrant collection. Exiting.")
-                        return
+            _, embeddings, chunks, payloads = item
+            self._ids.extend(p[ID_FIELD] for p in payloads)
+            self._vectors.append(np.asarray(embeddings, dtype=np.float32))
+            self._texts.extend(chunks)
+            self._payloads.extend(payloads)
+            self._files.update(p["filename"] for p in payloads)
+            self._buffered += len(payloads)
+            if self._buffered >= self.batch_size:
+                self._flush()
+        self._flush()
+    
+    def _flush(self):
+        if not self._buffered:
+            return
+        started = time.perf_counter()
+        try:
+            self.store.add(self._ids, np.vstack(self._vectors), self._texts, self._payloads)
+        except Exception as e:
+            print(f"Error storing {self._buffered} embeddings in the mirror store: {e}")
+            self.failed.update(self._files)
+        self.stats.add(self._buffered, started)
+        self._ids, self._vectors, self._texts, self._payloads, self._files = [], [], [], [], set()
+        self._buffered = 0
+    
+    def _delete_rows(self, filename, chunk_ids):
+        """Delete the rows of stale chunks"""
+        ids = [point_id(filename, chunk_id) for chunk_id in chunk_ids]
+        try:
+            self.store.delete(ids)
+            print(f"✓ Deleted {len(ids)} stale chunks of {filename}")
+            return True
+        except Exception as e:
+            print(f"Error deleting stale chunks of {filename}: {e}")
+            return False
+
+def collection_paths(collection):
+    """Texts directory, packed store and manifest of one collection"""
+    return (f"{TEXTS_ROOT}/{collection}", f"{STORE_ROOT}/{collection}",
+            MANIFEST_TEMPLATE.format(collection=collection))
+
+def open_mirror(collection, dim):
+    """The MIRROR_STORE of one collection, or None when only the packed store is written"""
+    if MIRROR_STORE is None:
+        return None
+    spec = MIRROR_STORE.format(collection=collection)
+    print(f"Mirroring changed chunks to {spec}")
+    return open_vector_store(spec, dim)
+
+def chunk_payloads(chunks, metadata):
+    """Build the per-chunk payload shared by the packed store and the mirror store
+    
+    start_char/end_char locate the chunk in the source .txt file; collection
+    and translator are the fields searches filter on.
+    """
+    fields = shard_fields(metadata["filename"], metadata["collection"])
+    return [
+        {
+            ID_FIELD: point_id(metadata["filename"], i),
+            "chunk_id": i,
+            "filename": metadata["filename"],
+            **fields,
+            "original_text_length": metadata["original_text_length"],
+            "chunk_size": metadata["chunk_size"],
+            "chunk_overlap": metadata["chunk_overlap"],
+            "model": metadata["model"],
+            "chunk_length": len(chunk.text),
+            "start_char": chunk.start_char,
+            "end_char": chunk.end_char
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+def embedding_params():
+    """Parameters that change the chunks or their vectors; any change forces a full rebuild"""
+    params = {"model": MODEL_NAME, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+              "chunk_unit": CHUNK_UNIT}
+    if ENCODER_BACKEND != "torch":
+        params["backend"] = ENCODER_BACKEND
+    return params
+
+def content_hash(text):
+    """Hash of a text together with the embedding parameters"""
+    key = json.dumps(embedding_params(), sort_keys=True) + "\n" + text
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def load_manifest(path):
+    """Load the manifest of the previous run, discarding it if the parameters changed"""
+    empty = {"params": embedding_params(), "files": {}}
+    if not os.path.exists(path):
+        return empty
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("params") != embedding_params():
+        print("Embedding parameters changed since the last run, re-embedding everything")
+        return empty
+    return manifest
+
+def save_manifest(manifest, path):
+    """Atomically write the manifest"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+def previous_store_rows(store_dir):
+    """Open the previous packed store and map each filename to its rows in chunk order"""
+    if not store_exists(store_dir):
+        return None, {}
+    store = open_embedding_store(store_dir)
+    if not len(store) or "filename" not in store.columns:
+        return store, {}
+    codes, values = store.codes("filename")
+    chunk_ids = np.asarray(store.column("chunk_id"))
+    order = np.lexsort((chunk_ids, codes))
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+    rows = {}
+    for group in np.split(order, boundaries):
+        rows[values[codes[group[0]]]] = group
+    return store, rows
+
+def copy_previous_rows(store_writer, previous_store, rows, collection):
+    """Copy an unchanged file's chunks from the previous store without re-encoding"""
+    metadata = [previous_store.metadata[r] for r in rows]
+    # Rows written before the filter fields and row ids existed get them here
+    store_writer.add(previous_store.embeddings[rows],
+                     [previous_store.texts[r] for r in rows],
+                     [{**meta, **shard_fields(meta["filename"], collection),
+                       ID_FIELD: point_id(meta["filename"], meta["chunk_id"])} for meta in metadata])
+
+def read_and_chunk(text_files, old_manifest, previous_store, previous_rows, dim, jobs, stats,
+                   tokenizer=None, max_length=CHUNK_SIZE, collection="mn"):
+    """Reader stage: decide what each file needs and chunk the changed ones
+    
+    Puts one job dict per file on `jobs`, then None when done (also if the
+    reader itself fails). A file that cannot be read gets a "failed" job.
+    """
+    try:
+        for text_file in text_files:
+            try:
+                started = time.perf_counter()
+                entry = old_manifest["files"].get(text_file.name)
+                stat = text_file.stat()
+                rows = previous_rows.get(text_file.name)
+                has_rows = entry is not None and rows is not None and len(rows) == entry["num_chunks"]
+                
+                # Unchanged since the last run: copy its rows from the previous store
+                if has_rows and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    jobs.put({"kind": "copy", "filename": text_file.name, "rows": rows, "entry": entry})
+                    continue
+                
+                with open(text_file, 'r', encoding='utf-8') as f:
+                    raw_text = f.read()
+                text_content = raw_text.strip()
+                
+                file_hash = content_hash(text_content)
+                file_entry = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": file_hash}
+                
+                # Skip empty files or files with placeholder content
+                if not text_content or text_content == '[No <div class="chapter"> found]':
+                    print(f"Skipping {text_file.name} - empty or no chapter content")
+                    jobs.put({"kind": "empty", "filename": text_file.name,
+                              "stale": range(entry["num_chunks"]) if entry else range(0),
+                              "entry": {**file_entry, "num_chunks": 0, "chunk_hashes": []}})
+                    continue
+                
+                # Touched but identical content: only the manifest needs updating
+                if has_rows and entry["hash"] == file_hash:
+                    jobs.put({"kind": "copy", "filename": text_file.name, "rows": rows,
+                              "entry": {**entry, **file_entry}})
+                    continue
+                
+                # Split text into chunks
+                # Chunk the raw text so chunk offsets index the file as stored on disk
+                text_chunks = list(iter_chunks(raw_text, max_length, CHUNK_OVERLAP, tokenizer))
+                chunks = [chunk.text for chunk in text_chunks]
+                chunk_hashes = [content_hash(chunk) for chunk in chunks]
+                
+                # Reuse the vectors of chunks whose text did not change
+                old_hashes = entry["chunk_hashes"] if has_rows else []
+                changed = [i for i, h in enumerate(chunk_hashes)
+                           if i >= len(old_hashes) or old_hashes[i] != h]
+                reused = sorted(set(range(len(chunks))) - set(changed))
+                embeddings = np.zeros((len(chunks), dim), dtype=np.float32)
+                if reused:
+                    embeddings[reused] = previous_store.embeddings[rows[reused]]
                 
                 # Prepare metadata
                 metadata = {
                     "filename": text_file.name,
+                    "collection": collection,
                     "original_text_length": len(text_content),
                     "num_chunks": len(chunks),
                     "chunk_size": CHUNK_SIZE,
                     "chunk_overlap": CHUNK_OVERLAP,
-                    "embedding_dimension": embeddings.shape[1],
+                    "embedding_dimension": dim,
                     "model": MODEL_NAME,
                     "chunk_lengths": [len(chunk) for chunk in chunks]
                 }
                 
-                # Store embeddings in Qdrant
-                success = store_embeddings_in_qdrant(client, COLLECTION_NAME, embeddings, chunks, metadata)
-                
-                if success:
-                    print(f"✓ Processed {text_file.name} ({len(chunks)} chunks, dim: {embeddings.shape[1]})")
-                else:
-                    print(f"✗ Failed to store embeddings for {text_file.name}")
-            else:
-                print(f"✗ Failed to get embeddings for {text_file.name}")
-                
-        except Exception as e:
-            print(f"Error processing {text_file.name}: {e}")
+                jobs.put({
+                    "kind": "encode",
+                    "filename": text_file.name,
+                    "chunks": chunks,
+                    "payloads": chunk_payloads(text_chunks, metadata),
+                    "embeddings": embeddings,
+                    "changed": changed,
+                    "remaining": len(changed),
+                    "stale": range(len(chunks), entry["num_chunks"]) if entry else range(0),
+                    "entry": {**file_entry, "num_chunks": len(chunks), "chunk_hashes": chunk_hashes}
+                })
+                stats.add(len(chunks), started)
+            except Exception as e:
+                print(f"Error processing {text_file.name}: {e}")
+                jobs.put({"kind": "failed", "filename": text_file.name})
+    finally:
+        jobs.put(None)
+
+def process_text_files(full=False, collection="mn", model=None):
+    """Process all text files of one collection and generate embeddings
+    
+    Runs as a three-stage pipeline: a reader thread chunks files into a queue,
+    the main thread encodes fixed-size batches drawn across file boundaries, and
+    a background thread uploads large batches to the mirror store (if any) while
+    encoding continues.
+    
+    Only files whose content (or the embedding parameters) changed since the last
+    run are re-chunked; within those, only chunks whose text changed are re-encoded.
+    When no file was added, changed or removed, the packed store and its indexes
+    are left untouched. Pass full=True to ignore the manifest and re-embed everything.
+    """
+    texts_dir, store_dir, manifest_path = collection_paths(collection)
+    
+    # Load the embedding model
+    if model is None:
+        print(f"Loading model: {MODEL_NAME}")
+        model = load_encoder(MODEL_NAME, ENCODER_BACKEND, ENCODER_THREADS)
+    dim = model.get_sentence_embedding_dimension()
+    
+    # Size chunks in word-pieces, leaving room for the [CLS]/[SEP] tokens the model adds.
+    # The reader thread gets its own tokenizer copy: fast tokenizers must not be shared
+    # with the encoding thread.
+    tokenizer = None
+    max_length = CHUNK_SIZE
+    if CHUNK_UNIT == "tokens":
+        tokenizer = copy.deepcopy(model.tokenizer)
+        max_length = min(CHUNK_SIZE, model.max_seq_length - 2)
+        print(f"Chunking to at most {max_length} tokens (model max_seq_length: {model.max_seq_length})")
     
-    # Print collection statistics
     try:
-        collection_info = client.get_collection(COLLECTION_NAME)
-        print(f"\nCollection '{COLLECTION_NAME}' statistics:")
-        print(f"  Vector count: {collection_info.points_count}")
+        mirror = open_mirror(collection, dim)
+        # A full rebuild also drops rows left behind by earlier runs
+        if full and mirror is not None:
+            mirror.clear()
     except Exception as e:
-        print(f"Error getting collection info: {e}")
+        print(f"Error setting up the mirror store: {e}")
+        return
+    
+    # Get all text files
+    texts_path = Path(texts_dir)
+    text_files = sorted(texts_path.glob("*.txt"))
     
-    print(f"\nEmbedding generation complete! Check Qdrant collection '{COLLECTION_NAME}' for results.")
+    print(f"Found {len(text_files)} text files to process")
+    
+    old_manifest = {"params": embedding_params(), "files": {}} if full else load_manifest(manifest_path)
+    new_manifest = {"params": embedding_params(), "files": {}}
+    previous_store, previous_rows = (None, {}) if full else previous_store_rows(store_dir)
+    
+    # The packed store is swapped in once all files are done
+    store_writer = EmbeddingStoreWriter(store_dir)
+    read_stats = StageStats("read")
+    encode_stats = StageStats("encode")
+    uploader = StoreUploader(mirror) if mirror is not None else None
+    jobs = queue.Queue(maxsize=QUEUE_SIZE)
+    reader = threading.Thread(
+        target=read_and_chunk,
+        args=(text_files, old_manifest, previous_store, previous_rows, dim, jobs, read_stats,
+              tokenizer, max_length, collection),
+        daemon=True
+    )
+    
+    carried = []  # Rows kept from the previous store, copied only if the store is rewritten
+    updated = []  # Files whose rows differ from the previous store
+    seen = set()
+    
+    def finish(job):
+        """All chunks of a file are encoded: write it to the store and queue the upload"""
+        changed = job["changed"]
+        store_writer.add(job["embeddings"], job["chunks"], job["payloads"])
+        updated.append(job["filename"])
+        if uploader is not None:
+            uploader.upsert(job["embeddings"][changed], [job["chunks"][i] for i in changed],
+                            [job["payloads"][i] for i in changed])
+            uploader.delete(job["filename"], job["stale"])
+        new_manifest["files"][job["filename"]] = job["entry"]
+        print(f"✓ Processed {job['filename']} ({len(job['chunks'])} chunks, {len(changed)} re-encoded)")
+    
+    def keep_previous(filename):
+        """A file failed: carry its previous rows over and leave it out of the manifest so it is retried"""
+        rows = previous_rows.get(filename)
+        if rows is not None:
+            carried.append(rows)
+        print(f"✗ Kept the previous chunks of {filename}" if rows is not None else f"✗ Skipped {filename}")
+    
+    def encode(batch):
+        """Encode one batch of (job, chunk index) pairs and scatter the vectors back"""
+        started = time.perf_counter()
+        embeddings = get_embeddings([job["chunks"][i] for job, i in batch], model)
+        encode_stats.add(len(batch), started)
+        for (job, i), embedding in zip(batch, embeddings if embeddings is not None else []):
+            job["embeddings"][i] = embedding
+        for job, _ in batch:
+            job["remaining"] -= 1
+            if embeddings is None:
+                job["failed"] = True
+            if job["remaining"] == 0:
+                if job.get("failed"):
+                    keep_previous(job["filename"])
+                else:
+                    finish(job)
+    
+    wall_start = time.perf_counter()
+    reader.start()
+    if uploader is not None:
+        uploader.start()
+    skipped = 0
+    pending = []
+    
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        seen.add(job["filename"])
+        if job["kind"] == "copy":
+            carried.append(job["rows"])
+            new_manifest["files"][job["filename"]] = job["entry"]
+            skipped += 1
+        elif job["kind"] == "empty":
+            if uploader is not None:
+                uploader.delete(job["filename"], job["stale"])
+            if job["filename"] in previous_rows:
+                updated.append(job["filename"])
+            new_manifest["files"][job["filename"]] = job["entry"]
+        elif job["kind"] == "failed":
+            keep_previous(job["filename"])
+        elif not job["changed"]:
+            finish(job)
+        else:
+            pending.extend((job, i) for i in job["changed"])
+        
+        # Encode full batches as soon as enough chunks are queued, across file boundaries
+        while len(pending) >= ENCODE_BATCH_SIZE:
+            encode(pending[:ENCODE_BATCH_SIZE])
+            pending = pending[ENCODE_BATCH_SIZE:]
+    if pending:
+        encode(pending)
+    
+    # Files that disappeared since the last run
+    if uploader is not None:
+        for filename, entry in old_manifest["files"].items():
+            if filename not in new_manifest["files"] and not (texts_path / filename).exists():
+                uploader.delete(filename, range(entry["num_chunks"]))
+        uploader.close()
+        mirror.persist()
+    wall_time = time.perf_counter() - wall_start
+    
+    # Files whose upload failed are retried on the next run
+    for filename in uploader.failed if uploader is not None else ():
+        new_manifest["files"].pop(filename, None)
+    
+    print(f"\n{skipped} files unchanged, {encode_stats.chunks} chunks encoded in {wall_time:.1f}s")
+    read_stats.report(wall_time)
+    encode_stats.report(wall_time)
+    if uploader is not None:
+        uploader.stats.report(wall_time)
+    
+    removed = set(previous_rows) - seen
+    # Rows written before the filter fields and row ids existed get them in a rewrite
+    outdated = previous_store is not None and ID_FIELD not in previous_store.columns
+    if not updated and not removed and not outdated and store_exists(store_dir):
+        store_writer.abort()
+        print(f"✓ No file added, changed or removed: kept the packed store and indexes in {store_dir}")
+    else:
+        for rows in carried:
+            copy_previous_rows(store_writer, previous_store, rows, collection)
+        # Release the previous store's memory maps before it is replaced
+        previous_store = None
+        previous_rows = None
+        write_store(store_writer, store_dir)
+    save_manifest(new_manifest, manifest_path)
+    
+    # Print mirror statistics
+    if mirror is not None:
+        try:
+            print("\nMirror store statistics:")
+            print(f"  Vector count: {len(mirror)}")
+        except Exception as e:
+            print(f"Error getting mirror store info: {e}")
+    
+    print(f"\nEmbedding generation complete! Packed store: {store_dir}")
+
+def write_store(store_writer, store_dir):
+    """Swap the new packed store in and build its indexes; with no rows left the old store is deleted"""
+    if store_writer.rows:
+        store_writer.close()
+        print(f"✓ Wrote packed store with {store_writer.rows} chunks to {store_dir}")
+        if BUILD_ANN_INDEX:
+            index = build_index(store_dir)
+            print(f"✓ Built IVF index with {index.nlist} lists")
+        if BUILD_LEXICAL_INDEX:
+            lexical = build_lexical_index(store_dir)
+            print(f"✓ Built lexical index with {len(lexical.vocabulary)} terms")
+        for kind in BUILD_QUANTIZED:
+            codes = build_quantized(store_dir, kind)
+            print(f"✓ Built {kind} codes ({codes.nbytes / 1e6:.1f} MB)")
+    else:
+        store_writer.abort()
+        # Every file was removed or emptied: a stale store would keep serving their chunks
+        if store_exists(store_dir):
+            shutil.rmtree(store_dir)
+            print(f"✓ No chunks left, removed the packed store {store_dir}")
+
+def process_collections(collections=COLLECTIONS, full=False):
+    """Embed every collection that has a texts directory, sharing one model"""
+    collections = [c for c in collections if Path(collection_paths(c)[0]).is_dir()]
+    if not collections:
+        print(f"No collection texts found in {TEXTS_ROOT} (expected sub-directories {', '.join(COLLECTIONS)})")
+        return
+    print(f"Loading model: {MODEL_NAME}")
+    model = load_encoder(MODEL_NAME, ENCODER_BACKEND, ENCODER_THREADS)
+    for collection in collections:
+        print(f"\n=== {collection}: {collection_paths(collection)[1]} ===")
+        process_text_files(full, collection, model)
 
 if __name__ == "__main__":
-    print(f"Using model: {MODEL_NAME}")
-    print(f"Chunk size: {CHUNK_SIZE} characters")
-    print(f"Chunk overlap: {CHUNK_OVERLAP} characters")
-    print(f"Qdrant collection: {COLLECTION_NAME}")
+    import sys
+    
+    # Usage: python generate_embeddings.py [full] [mn dn ...]
+    args = sys.argv[1:]
+    full = "full" in args
+    collections = [arg for arg in args if arg != "full"] or COLLECTIONS
+    
+    print(f"Using model: {MODEL_NAME} ({ENCODER_BACKEND} backend)")
+    print(f"Chunk size: {CHUNK_SIZE} {CHUNK_UNIT}")
+    print(f"Chunk overlap: {CHUNK_OVERLAP} {'tokens' if CHUNK_UNIT == 'tokens' else 'words'}")
+    print(f"Collections: {', '.join(collections)}")
+    print(f"Mode: {'full' if full else 'incremental'}")
     
-    process_text_files() 
\ No newline at end of file
+    process_collections(collections, full=full)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Instrumentation
+
+Lightweight tracing and metrics for the RAG -> LLM -> TTS pipeline:
+1. span("name") times a block; durations go to the histogram name_seconds
+   and, with a JSON-lines file configured, one event per span (with its parent
+   span, so nested stages can be reconstructed)
+2. count() and observe() update counters and fixed-bucket histograms
+3. prometheus_text() renders everything in the Prometheus text format, and
+   start_http_server() serves it on /metrics
+
+Disabled by default: span() then returns a shared no-op context manager and
+count()/observe() return after one flag check. Enable with enable(), or with
+the CONTEMPLATIVE_METRICS=1 environment variable
+(CONTEMPLATIVE_METRICS_FILE=path.jsonl adds the event log).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "contemplative_"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_enabled = False
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_event_file = None
+_local = threading.local()
+_NO_SPAN = nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(jsonl_path=None):
+    """Start recording; with jsonl_path every finished span is appended to that file"""
+    global _enabled, _event_file
+    with _lock:
+        if _event_file is not None:
+            _event_file.close()
+        _event_file = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+            _event_file = open(jsonl_path, "a", encoding="utf-8")
+        _enabled = True
+
+
+def disable():
+    global _enabled, _event_file
+    with _lock:
+        _enabled = False
+        if _event_file is not None:
+            _event_file.close()
+            _event_file = None
+
+
+def reset():
+    """Forget every counter and histogram"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def count(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Add one value to a histogram"""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * len(DEFAULT_BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def _write_event(event):
+    with _lock:
+        if _event_file is not None:
+            _event_file.write(json.dumps(event, ensure_ascii=False) + "\n")
+            _event_file.flush()
+
+
+@contextmanager
+def _span(name, labels):
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    wall_start = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        observe(f"{name}_seconds", duration, **labels)
+        if _event_file is not None:
+            _write_event({"type": "span", "name": name, "parent": parent, "start": wall_start,
+                          "duration_s": duration, "thread": threading.current_thread().name,
+                          "labels": labels})
+
+
+def span(name, **labels):
+    """Context manager timing a pipeline stage (a no-op while disabled)"""
+    if not _enabled:
+        return _NO_SPAN
+    return _span(name, labels)
+
+
+def _escape_label(value) -> str:
+    """Label value escaped as the exposition format requires (backslash, quote, newline)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+def prometheus_text() -> str:
+    """All counters and histograms in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(values)) for key, values in _histograms.items())
+    typed = set()
+    for (name, labels), value in counters:
+        metric = f"{METRIC_PREFIX}{name}"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for (name, labels), values in histograms:
+        metric = f"{METRIC_PREFIX}{name}"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        for bound, bucket in zip(DEFAULT_BUCKETS, values):
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {bucket}")
+        lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {values[-2]}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Counters and histogram summaries as plain dicts"""
+    with _lock:
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in _counters.items()],
+            "histograms": [{"name": name, "labels": dict(labels), "count": values[-1], "sum": values[-2],
+                            "buckets": dict(zip(map(str, DEFAULT_BUCKETS), values[:len(DEFAULT_BUCKETS)]))}
+                           for (name, labels), values in _histograms.items()],
+        }
+
+
+def dump_jsonl(path):
+    """Append the current metrics to a JSON-lines file, one line per metric"""
+    data = snapshot()
+    now = time.time()
+    with open(path, "a", encoding="utf-8") as f:
+        for kind in ("counters", "histograms"):
+            for metric in data[kind]:
+                f.write(json.dumps({"type": kind[:-1], "time": now, **metric}, ensure_ascii=False) + "\n")
+
+
+def start_http_server(port=9464, host="127.0.0.1"):
+    """Serve prometheus_text() on http://host:port/metrics from a daemon thread"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if os.environ.get("CONTEMPLATIVE_METRICS", "") not in ("", "0"):
+    enable(os.environ.get("CONTEMPLATIVE_METRICS_FILE") or None)
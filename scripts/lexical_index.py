@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Lexical Index
+
+A BM25 inverted index over the chunks of the packed embedding store, for the
+Pali terms and proper names the embedding model handles poorly:
+1. Tokenises diacritic-insensitively (satipaṭṭhāna == satipatthana) and case-folded
+2. Stores, per term, the sorted chunk ids (uint32) and precomputed BM25 impacts
+   (float16), so a query only adds up postings
+3. Prunes with MaxScore: once the k-th best score beats what the remaining
+   terms could add, those terms are only looked up for the current candidates
+4. Fuses lexical and dense rankings with reciprocal-rank fusion
+
+The index is saved in the store directory and tagged with the store version.
+
+    python lexical_index.py build <store_dir>
+    python lexical_index.py search <store_dir> "satipaṭṭhāna jhāna"
+"""
+
+import argparse
+import json
+import re
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import top_k_from_scores
+from embedding_store import open_embedding_store
+
+INDEX_DIR = "lexical"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Rank offset in reciprocal-rank fusion
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Lower-case text with diacritics removed"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str):
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+class LexicalIndex:
+    """BM25 postings with precomputed impacts"""
+
+    def __init__(self, vocabulary, offsets, doc_ids, impacts, max_impacts, num_docs, store_version=None):
+        self.vocabulary = vocabulary  # term -> term id
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.max_impacts = max_impacts
+        self.num_docs = num_docs
+        self.store_version = store_version
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B, store_version=None):
+        """Tokenise every chunk and lay out the postings term by term"""
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                tfs.append(tf)
+            doc_ids.extend([doc_id] * len(counts))
+
+        num_docs = len(lengths)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.uint32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        # Postings grouped by term; doc ids stay sorted inside every group
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        df = np.bincount(term_ids, minlength=len(vocabulary))
+        offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+
+        idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_length = lengths.mean() if num_docs else 1.0
+        norm = k1 * (1 - b + b * lengths[doc_ids] / max(avg_length, 1e-9))
+        impacts = (idf[term_ids] * tfs * (k1 + 1) / (tfs + norm)).astype(np.float16)
+
+        # Every term has at least one posting, so each group is non-empty
+        max_impacts = np.maximum.reduceat(impacts.astype(np.float32), offsets[:-1]) if len(impacts) \
+            else np.zeros(0, dtype=np.float32)
+        return cls(vocabulary, offsets, doc_ids, impacts, max_impacts, num_docs, store_version)
+
+    def save(self, store_dir):
+        path = Path(store_dir) / INDEX_DIR
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "offsets.npy", self.offsets)
+        np.save(path / "doc_ids.npy", self.doc_ids)
+        np.save(path / "impacts.npy", self.impacts)
+        np.save(path / "max_impacts.npy", self.max_impacts)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path / "index.json", "w", encoding="utf-8") as f:
+            json.dump({"store_version": self.store_version, "num_docs": self.num_docs, "terms": terms},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, store_dir):
+        path = Path(store_dir) / INDEX_DIR
+        with open(path / "index.json", "r", encoding="utf-8") as f:
+            header = json.load(f)
+        vocabulary = {term: i for i, term in enumerate(header["terms"])}
+        return cls(vocabulary, np.load(path / "offsets.npy"), np.load(path / "doc_ids.npy", mmap_mode="r"),
+                   np.load(path / "impacts.npy", mmap_mode="r"), np.load(path / "max_impacts.npy"),
+                   header["num_docs"], header["store_version"])
+
+    def postings(self, term_id):
+        start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.doc_ids[start:stop], self.impacts[start:stop]
+
+    def search(self, query: str, top_k: int, rows=None):
+        """BM25 top-k for one query as (scores, ids), best first
+
+        Terms are processed from the highest to the lowest score bound. Each
+        term is added in full while untouched chunks could still reach the
+        top-k; after that, the remaining terms are only looked up (binary
+        search) for the surviving candidates.
+
+        With `rows` (sorted chunk ids, e.g. from a metadata filter) only those
+        chunks are ranked: every term is looked up for each of them, without
+        pruning, since the bounds assume the whole collection competes.
+
+        Scores are held only for the chunks the postings touch (or the given
+        rows), never in an array sized by the collection.
+        """
+        term_ids = sorted({self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary},
+                          key=lambda t: -self.max_impacts[t])
+        if not term_ids or top_k <= 0 or (rows is not None and not len(rows)):
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            scores = np.zeros(len(rows))
+            for term_id in term_ids:
+                lookup_postings(rows, scores, *self.postings(term_id))
+            keep = scores > 0
+            return top_k_from_scores(scores[keep].astype(np.float32), rows[keep], top_k)
+
+        bounds = self.max_impacts[term_ids]
+        remaining = np.concatenate((np.cumsum(bounds[::-1])[::-1][1:], [0.0]))  # Bound of the terms after i
+
+        # Scores are only held for the chunks the postings touched, as (sorted ids, scores)
+        ids, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+        pruning = False
+        for i, term_id in enumerate(term_ids):
+            docs, impacts = self.postings(term_id)
+            if not pruning:
+                # Essential term: every posting can still change the top-k
+                ids, scores = add_postings(ids, scores, docs, impacts)
+                if len(ids) >= top_k:
+                    threshold = np.partition(scores, len(ids) - top_k)[len(ids) - top_k]
+                    pruning = threshold > remaining[i]
+            else:
+                # Non-essential term: only candidates can still make the top-k
+                lookup_postings(ids, scores, docs, impacts)
+            if pruning:
+                threshold = np.partition(scores, len(ids) - top_k)[len(ids) - top_k]
+                keep = scores + remaining[i] >= threshold
+                ids, scores = ids[keep], scores[keep]
+
+        return top_k_from_scores(scores.astype(np.float32), ids, top_k)
+
+    def search_batch(self, queries, top_k, rows=None):
+        return [self.search(query, top_k, rows) for query in queries]
+
+
+def add_postings(ids, scores, docs, impacts):
+    """Add one term's postings to the sparse scores (sorted ids, scores) of the touched chunks"""
+    ids, inverse = np.unique(np.concatenate((ids, docs)), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate((scores, impacts)), minlength=len(ids))
+    return ids, scores
+
+
+def lookup_postings(ids, scores, docs, impacts):
+    """Add one term's impacts to scores[i] for the sorted ids it has a posting for (binary search)"""
+    positions = np.searchsorted(docs, ids)
+    positions[positions == len(docs)] = 0
+    found = docs[positions] == ids
+    scores[found] += impacts[positions[found]]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Fuse ranked id lists (best first) into (scores, ids) by sum of 1 / (k + rank)"""
+    fused = {}
+    for ids in rankings:
+        for rank, idx in enumerate(np.asarray(ids).tolist(), 1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (k + rank)
+    if not fused:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    ids = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+    return top_k_from_scores(scores, ids, top_k)
+
+
+def build_lexical_index(store_dir):
+    """Build and save the lexical index for a packed store"""
+    store = open_embedding_store(store_dir)
+    index = LexicalIndex.build(store.texts, store_version=store.version)
+    index.save(store_dir)
+    return index
+
+
+def load_lexical_index(store_dir, store_version=None):
+    """Load the saved index, or return None if missing or built for another store version"""
+    if not (Path(store_dir) / INDEX_DIR / "index.json").exists():
+        return None
+    index = LexicalIndex.load(store_dir)
+    if store_version is not None and index.store_version != store_version:
+        print(f"Lexical index in {store_dir} is stale (store changed), rebuild with: "
+              f"python scripts/lexical_index.py build {store_dir}")
+        return None
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index of an embedding store")
+    parser.add_argument("command", choices=["build", "search"])
+    parser.add_argument("store_dir")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        index = build_lexical_index(args.store_dir)
+        print(f"Indexed {index.num_docs} chunks, {len(index.vocabulary)} terms, {len(index.doc_ids)} postings "
+              f"in {time.perf_counter() - start:.1f}s")
+    else:
+        store = open_embedding_store(args.store_dir)
+        index = load_lexical_index(args.store_dir, store.version) or LexicalIndex.build(store.texts)
+        start = time.perf_counter()
+        scores, ids = index.search(args.query, args.top_k)
+        print(f"{len(ids)} results in {(time.perf_counter() - start) * 1000:.2f} ms")
+        for score, idx in zip(scores, ids):
+            print(f"  {score:7.3f}  {store.metadata[idx].get('filename', '?')}: {store.texts[idx][:100]}...")
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Meditation Prompts
+
+Instrucciones para el LLM compartidas por RAG.py y build_catalogue.py, de modo
+que una guía generada a mano y una del catálogo salgan del mismo prompt.
+"""
+
+PALABRAS_POR_MINUTO = 150  # Ritmo de narración usado para estimar la extensión de la guía
+
+# Indicaciones adicionales por nivel del oyente (None = sin indicación, como en RAG.py)
+INDICACIONES_NIVEL = {
+    "principiante": (
+        "El oyente es principiante: explica cada paso con sencillez, guía la postura y la respiración "
+        "desde el inicio y evita términos técnicos. "
+    ),
+    "avanzado": (
+        "El oyente tiene experiencia: reduce las instrucciones básicas, deja más espacio al silencio "
+        "y profundiza en la observación de la mente. "
+    ),
+}
+
+
+def instruccion_meditacion(duracion_minutos: int, nivel: str = None) -> str:
+    """Instrucción principal para el LLM para una guía de `duracion_minutos` minutos"""
+    if nivel is not None and nivel not in INDICACIONES_NIVEL:
+        raise ValueError(f"Nivel desconocido: {nivel} (opciones: {', '.join(INDICACIONES_NIVEL)})")
+    palabras_esperadas = duracion_minutos * PALABRAS_POR_MINUTO
+    return (
+        f"Eres un guía de meditación con profundo conocimiento de las enseñanzas budistas. "
+        f"Usa el siguiente contexto (en inglés) como fuente de inspiración para crear una guía de meditación paso a paso. "
+        f"Escríbela completamente en español, con un tono calmado, contemplativo, suave y claro. "
+        f"No traduzcas literalmente el contexto ni lo menciones directamente. "
+        f"La guía debe estar diseñada para ser narrada en voz alta, con una extensión aproximada de {palabras_esperadas} palabras. "
+        f"{INDICACIONES_NIVEL.get(nivel, '')}"
+        f"Divide el texto en secciones breves, con frases cortas y comprensibles. "
+        f"Al final de cada sección, incluye una pausa sugerida en el formato: [Pausa X segundos], donde X debe estar entre 3 y 12 segundos. "
+        f"La duración total estimada del texto completo con pausas debe ser de aproximadamente {duracion_minutos} minutos. "
+        f"No uses más de 10 pausas de más de 10 segundos. "
+        f"Evita pausas excesivamente largas o innecesarias. "
+        f"Utiliza silencios y respiraciones conscientes como herramienta para la calma, sin exagerar. "
+        f"El objetivo es lograr una experiencia pausada pero fluida, sin estancamientos. "
+        f"Escribe solo la guía de meditación, sin explicaciones externas ni avisos."
+    )
+
+
+def crear_prompt_con_contexto(pregunta: str, contexto: str) -> str:
+    return (
+        f"A continuación tienes un contexto basado en textos de meditación:\n\n"
+        f"{contexto}\n\n"
+        f"Basado en el contexto anterior, responde la siguiente pregunta de forma clara y útil:\n"
+        f"{pregunta}\n\n"
+        f"Respuesta:"
+    )
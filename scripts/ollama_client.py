@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Ollama Client
+
+Shared HTTP client for the Ollama /api/generate endpoint:
+1. One keep-alive requests.Session with a connection pool, reused by every call
+2. A streaming generator that yields tokens as the NDJSON chunks arrive
+3. Separate connect/read timeouts (the read timeout applies between chunks)
+4. Time-to-first-token and tokens/sec computed from Ollama's eval counters
+
+A fake Ollama server is included so the streaming path can be exercised
+without a model: python ollama_client.py --fake
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import count, observe
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+CONNECT_TIMEOUT = 5.0  # Seconds to establish the TCP connection
+READ_TIMEOUT = 300.0  # Seconds without data before giving up (between chunks when streaming)
+POOL_SIZE = 8  # Keep-alive connections kept open to the server
+
+
+class OllamaClient:
+    """Pooled client for Ollama's generate API"""
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, pool_size: int = POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Retry only failed connection attempts; a started generation is never replayed
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def stream_generate(self, prompt: str, model: str, options: Optional[Dict] = None,
+                        stats: Optional[Dict] = None) -> Iterator[str]:
+        """Yield response tokens as they are generated
+
+        If a dict is passed as `stats` it is filled with timing counters once
+        the final chunk arrives (see generation_stats).
+        """
+        payload = {"model": model, "prompt": prompt, "stream": True}
+        if options:
+            payload["options"] = options
+
+        start = time.perf_counter()
+        first_token = None
+        with self.session.post(f"{self.base_url}/api/generate", json=payload,
+                               stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    yield token
+                if chunk.get("done"):
+                    final = generation_stats(chunk, first_token, time.perf_counter() - start)
+                    if stats is not None:
+                        stats.update(final)
+                    record_generation(final, model)
+                    break
+
+    def generate(self, prompt: str, model: str, options: Optional[Dict] = None,
+                 stats: Optional[Dict] = None) -> str:
+        """Return the complete response (streamed internally so long generations never time out)"""
+        return "".join(self.stream_generate(prompt, model, options, stats))
+
+    def close(self):
+        self.session.close()
+
+
+def generation_stats(final_chunk: Dict, time_to_first_token: Optional[float], total_time: float) -> Dict:
+    """Timing counters from Ollama's final chunk (durations are reported in nanoseconds)"""
+    eval_count = final_chunk.get("eval_count", 0)
+    eval_seconds = final_chunk.get("eval_duration", 0) / 1e9
+    prompt_count = final_chunk.get("prompt_eval_count", 0)
+    prompt_seconds = final_chunk.get("prompt_eval_duration", 0) / 1e9
+    return {
+        "time_to_first_token": time_to_first_token,
+        "total_time": total_time,
+        "load_time": final_chunk.get("load_duration", 0) / 1e9,
+        "prompt_eval_count": prompt_count,
+        "prompt_eval_time": prompt_seconds,
+        "prompt_tokens_per_second": prompt_count / prompt_seconds if prompt_seconds else 0.0,
+        "eval_count": eval_count,
+        "eval_time": eval_seconds,
+        "tokens_per_second": eval_count / eval_seconds if eval_seconds else 0.0,
+    }
+
+
+def record_generation(stats: Dict, model: str):
+    """Feed generation_stats into the instrumentation counters and histograms"""
+    count("llm_requests_total", model=model)
+    count("llm_prompt_tokens_total", stats["prompt_eval_count"], model=model)
+    count("llm_generated_tokens_total", stats["eval_count"], model=model)
+    if stats["time_to_first_token"] is not None:
+        observe("llm_time_to_first_token_seconds", stats["time_to_first_token"], model=model)
+    observe("llm_total_seconds", stats["total_time"], model=model)
+
+
+def format_stats(stats: Dict) -> str:
+    """One-line summary of generation_stats for logging"""
+    if not stats:
+        return "no stats"
+    ttft = stats["time_to_first_token"]
+    ttft_text = f"{ttft:.2f}s" if ttft is not None else "n/a"
+    return (f"TTFT {ttft_text}, total {stats['total_time']:.2f}s, "
+            f"prompt {stats['prompt_eval_count']} tok @ {stats['prompt_tokens_per_second']:.1f} tok/s, "
+            f"generated {stats['eval_count']} tok @ {stats['tokens_per_second']:.1f} tok/s")
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client(base_url: str = OLLAMA_BASE_URL, connect_timeout: float = CONNECT_TIMEOUT,
+               read_timeout: float = READ_TIMEOUT) -> OllamaClient:
+    """Process-wide shared client, so every caller reuses the same connection pool"""
+    global _default_client
+    with _default_client_lock:
+        if (_default_client is None or _default_client.base_url != base_url.rstrip("/")
+                or _default_client.timeout != (connect_timeout, read_timeout)):
+            _default_client = OllamaClient(base_url, connect_timeout, read_timeout)
+        return _default_client
+
+
+class FakeOllamaServer:
+    """Local stand-in for Ollama that streams a fixed list of tokens as NDJSON
+
+    Used to exercise the client (and anything built on it) without a model.
+    If `error` is set, an error chunk is sent after the tokens instead of the final one.
+    """
+
+    def __init__(self, tokens, token_delay: float = 0.0, error: Optional[str] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.tokens = list(tokens)
+        self.token_delay = token_delay
+        self.error = error
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                server.requests.append(body)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                start = time.perf_counter()
+                for token in server.tokens:
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                    self._chunk({"model": body.get("model"), "response": token, "done": False})
+                elapsed = int((time.perf_counter() - start) * 1e9)
+                if server.error is not None:
+                    self._chunk({"error": server.error})
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                self._chunk({"model": body.get("model"), "response": "", "done": True,
+                             "prompt_eval_count": len(body.get("prompt", "").split()),
+                             "prompt_eval_duration": 1_000_000, "eval_count": len(server.tokens),
+                             "eval_duration": max(elapsed, 1)})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data):
+                line = json.dumps(data).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a completion from Ollama and report timings")
+    parser.add_argument("prompt", nargs="?", default="Describe mindfulness of breathing in two sentences.")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--url", default=OLLAMA_BASE_URL)
+    parser.add_argument("--fake", action="store_true", help="Run against a local fake Ollama server")
+    args = parser.parse_args()
+
+    def run(url):
+        client = OllamaClient(url)
+        stats = {}
+        for token in client.stream_generate(args.prompt, args.model, stats=stats):
+            print(token, end="", flush=True)
+        print()
+        print(format_stats(stats))
+
+    if args.fake:
+        with FakeOllamaServer(["Breathe ", "in. ", "Breathe ", "out. "] * 5, token_delay=0.02) as fake:
+            run(fake.url)
+    else:
+        run(args.url)
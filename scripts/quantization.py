@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Quantized Embeddings
+
+Compact copies of the packed store's vectors, used to pick a shortlist that is
+then rescored exactly against the float32 vectors:
+1. int8   - per-dimension symmetric scalar quantization (4x smaller)
+2. binary - one sign bit per dimension, compared by Hamming distance (32x smaller)
+
+Codes are saved inside the store directory and tagged with the store version.
+Only the codes are scanned; the float vectors stay memory-mapped and only the
+shortlisted rows are read from them.
+
+    python quantization.py build <store_dir> [--kind int8|binary|all]
+    python quantization.py bench <store_dir> [--queries 200] [--top-k 10]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import SCORE_BLOCK_ELEMENTS, blocked_top_k, sample_queries, top_k_from_scores
+from embedding_store import open_embedding_store
+
+KINDS = ("int8", "binary")
+OVERSAMPLE = {"int8": 4, "binary": 16}  # Shortlist size = top_k * OVERSAMPLE
+CODES_FILE = "quantized_{kind}.npy"
+HEADER_FILE = "quantized_{kind}.json"
+BLOCK_ROWS = 65536  # Rows quantized or scored at once
+
+# Bits set in every 16-bit value, for Hamming distances on packed codes
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_POPCOUNT16 = _BYTE_POPCOUNT[np.arange(65536) & 0xFF] + _BYTE_POPCOUNT[np.arange(65536) >> 8]
+
+
+def popcount_rows(packed):
+    """Number of set bits in every row of a packed uint8 matrix (rows padded to 8 bytes)"""
+    if hasattr(np, "bitwise_count"):  # NumPy 2
+        return np.bitwise_count(packed.view(np.uint64)).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT16[packed.view(np.uint16)].sum(axis=1, dtype=np.int32)
+
+
+def int8_scales(embeddings):
+    """Per-dimension scale mapping the largest absolute value to 127"""
+    peak = np.zeros(embeddings.shape[1], dtype=np.float32)
+    for start in range(0, len(embeddings), BLOCK_ROWS):
+        block = np.abs(np.asarray(embeddings[start:start + BLOCK_ROWS], dtype=np.float32))
+        np.maximum(peak, block.max(axis=0), out=peak)
+    peak[peak == 0] = 1.0
+    return peak / 127.0
+
+
+def quantize_int8(vectors, scales):
+    return np.clip(np.rint(np.asarray(vectors, dtype=np.float32) / scales), -127, 127).astype(np.int8)
+
+
+def binary_width(dim):
+    """Bytes per binary code, padded to whole 64-bit words (padding bits are always 0)"""
+    return (dim + 63) // 64 * 8
+
+
+def quantize_binary(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors))
+    packed = np.packbits(vectors > 0, axis=-1)
+    padded = np.zeros((len(vectors), binary_width(vectors.shape[1])), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded
+
+
+class QuantizedIndex:
+    """Shortlist search over int8 or binary codes, rescored with the float vectors"""
+
+    def __init__(self, kind, codes, scales=None, store_version=None, oversample=None):
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        self.kind = kind
+        self.codes = codes
+        self.scales = scales
+        self.store_version = store_version
+        self.oversample = oversample or OVERSAMPLE[kind]
+
+    @classmethod
+    def build(cls, embeddings, kind, store_version=None):
+        """Quantize every row, block by block"""
+        scales = int8_scales(embeddings) if kind == "int8" else None
+        width = embeddings.shape[1] if kind == "int8" else binary_width(embeddings.shape[1])
+        codes = np.empty((len(embeddings), width), dtype=np.int8 if kind == "int8" else np.uint8)
+        for start in range(0, len(embeddings), BLOCK_ROWS):
+            block = embeddings[start:start + BLOCK_ROWS]
+            codes[start:start + len(block)] = quantize_int8(block, scales) if kind == "int8" else quantize_binary(block)
+        return cls(kind, codes, scales, store_version)
+
+    def save(self, store_dir):
+        np.save(Path(store_dir) / CODES_FILE.format(kind=self.kind), self.codes)
+        header = {
+            "kind": self.kind,
+            "store_version": self.store_version,
+            "scales": self.scales.tolist() if self.scales is not None else None,
+        }
+        with open(Path(store_dir) / HEADER_FILE.format(kind=self.kind), "w", encoding="utf-8") as f:
+            json.dump(header, f)
+
+    @classmethod
+    def load(cls, store_dir, kind):
+        with open(Path(store_dir) / HEADER_FILE.format(kind=kind), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        codes = np.load(Path(store_dir) / CODES_FILE.format(kind=kind), mmap_mode="r")
+        scales = np.asarray(header["scales"], dtype=np.float32) if header["scales"] is not None else None
+        return cls(kind, codes, scales, header["store_version"])
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def label(self, nprobe=None):
+        """Search mode tag used to key cached results"""
+        return f"{self.kind}:{self.oversample}"
+
+    def shortlist(self, query_vectors, size, block_elements=SCORE_BLOCK_ELEMENTS):
+        """Best `size` rows per query by approximate score, as (scores, ids) pairs"""
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        # Blocks are converted to float32 (int8) or expanded per query (binary), so they stay small
+        block_rows = max(size, min(block_elements // len(query_vectors), BLOCK_ROWS), 1)
+
+        if self.kind == "int8":
+            # codes * scales ~ vectors, so scores are codes @ (query * scales)
+            weights = query_vectors * self.scales
+
+            def score_block(start, stop):
+                return weights @ np.asarray(self.codes[start:stop], dtype=np.float32).T
+        else:
+            query_bits = quantize_binary(query_vectors)
+
+            def score_block(start, stop):
+                block = np.asarray(self.codes[start:stop])
+                # Fewer differing bits = more similar
+                return np.stack([-popcount_rows(block ^ bits).astype(np.float32) for bits in query_bits])
+
+        return blocked_top_k(score_block, len(self.codes), len(query_vectors), size, block_rows)
+
+    def search(self, embeddings, query_vectors, top_k, nprobe=None):
+        """Top-k search: shortlist on the codes, then exact scores for the shortlisted rows
+
+        Returns a list with one (scores, ids) pair per query, best first.
+        """
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        results = []
+        for query_vector, (_, ids) in zip(query_vectors, self.shortlist(query_vectors, top_k * self.oversample)):
+            ids = np.sort(ids)  # Sequential reads from the memmap
+            scores = np.asarray(embeddings[ids], dtype=np.float32) @ query_vector
+            results.append(top_k_from_scores(scores, ids, top_k))
+        return results
+
+
+def build_quantized(store_dir, kind):
+    """Build and save the quantized codes of a packed store"""
+    store = open_embedding_store(store_dir)
+    index = QuantizedIndex.build(store.embeddings, kind, store_version=store.version)
+    index.save(store_dir)
+    return index
+
+
+def load_quantized(store_dir, kind, store_version=None):
+    """Load saved codes, or return None if missing or built for another store version"""
+    if not (Path(store_dir) / HEADER_FILE.format(kind=kind)).exists():
+        return None
+    index = QuantizedIndex.load(store_dir, kind)
+    if store_version is not None and index.store_version != store_version:
+        print(f"{kind} codes in {store_dir} are stale (store changed), rebuild with: "
+              f"python scripts/quantization.py build {store_dir} --kind {kind}")
+        return None
+    return index
+
+
+def benchmark(embeddings, indexes, query_vectors, top_k=10):
+    """Memory, queries/sec and recall@k of every index against exact float search"""
+    from ann_index import exact_search
+
+    start = time.perf_counter()
+    truth = [set(ids.tolist()) for _, ids in exact_search(embeddings, query_vectors, top_k)]
+    exact_seconds = time.perf_counter() - start
+    report = [{"mode": "float32", "bytes": embeddings.nbytes, "recall": 1.0,
+               "qps": len(query_vectors) / exact_seconds}]
+
+    for index in indexes:
+        start = time.perf_counter()
+        found = index.search(embeddings, query_vectors, top_k)
+        seconds = time.perf_counter() - start
+        hits = sum(len(truth[i] & set(ids.tolist())) for i, (_, ids) in enumerate(found))
+        report.append({
+            "mode": index.label(),
+            "bytes": index.nbytes,
+            "recall": hits / sum(len(t) for t in truth),
+            "qps": len(query_vectors) / seconds,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or benchmark quantized codes for an embedding store")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("store_dir")
+    parser.add_argument("--kind", choices=[*KINDS, "all"], default="all")
+    parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries for bench")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+    kinds = KINDS if args.kind == "all" else (args.kind,)
+
+    if args.command == "build":
+        for kind in kinds:
+            start = time.perf_counter()
+            index = build_quantized(args.store_dir, kind)
+            print(f"Built {kind} codes ({index.nbytes / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+    else:
+        store = open_embedding_store(args.store_dir)
+        indexes = []
+        for kind in kinds:
+            index = load_quantized(args.store_dir, kind, store.version)
+            indexes.append(index if index is not None else QuantizedIndex.build(store.embeddings, kind))
+        queries = sample_queries(store.embeddings, args.queries)
+        print(f"recall@{args.top_k} over {len(queries)} queries, {len(store)} rows")
+        for row in benchmark(store.embeddings, indexes, queries, args.top_k):
+            print(f"  {row['mode']:<10} {row['bytes'] / 1e6:>9.1f} MB  recall={row['recall']:.3f}  "
+                  f"{row['qps']:>9.1f} queries/s")
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Query Cache
+
+Caches, per (embedding model, normalized query):
+1. The query vector, so repeated questions skip the transformer forward pass
+2. The top-k hit ids and scores, so repeated searches skip scoring entirely
+
+Entries live in an in-memory LRU and, optionally, in a size-bounded SQLite
+file shared across runs. Hits are tagged with the version of the vector store
+they were computed against and are dropped as soon as that version changes;
+query vectors only depend on the model and are kept. Every disk write is
+committed at once, so processes sharing the file never wait on each other's
+open transactions; a write that still finds the file locked is skipped.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+MAX_MEMORY_ENTRIES = 1024  # Per table, in the in-memory LRU
+MAX_DISK_ENTRIES = 100000  # Per table, in the SQLite file
+EVICT_FRACTION = 0.1  # Share of the oldest disk entries dropped when the limit is hit
+EVICT_CHECK_INTERVAL = 64  # Disk writes between size checks
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and Unicode-form-insensitive form of a query"""
+    return " ".join(unicodedata.normalize("NFC", query).casefold().split())
+
+
+def directory_version(path) -> str:
+    """Cheap version tag for a directory (file names, sizes and mtimes)"""
+    digest = hashlib.sha256()
+    for file in sorted(Path(path).rglob("*")):
+        if file.is_file():
+            stat = file.stat()
+            digest.update(f"{file.relative_to(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_entries:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+
+class QueryCache:
+    """LRU cache of query vectors and search hits with optional SQLite persistence"""
+
+    def __init__(self, model_name, store_version=None, path=None,
+                 max_memory_entries=MAX_MEMORY_ENTRIES, max_disk_entries=MAX_DISK_ENTRIES):
+        self.model_name = model_name
+        self.store_version = store_version
+        self.max_disk_entries = max_disk_entries
+        self._vectors = _LRU(max_memory_entries)
+        self._hits = _LRU(max_memory_entries)
+        self._lock = threading.Lock()
+        self.stats = {"vector_hits": 0, "vector_misses": 0, "search_hits": 0, "search_misses": 0}
+
+        self._db = None
+        self._puts = 0
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB, last_used REAL);
+                CREATE TABLE IF NOT EXISTS hits (key TEXT PRIMARY KEY, ids BLOB, scores BLOB, last_used REAL);
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            """)
+            self._check_store_version()
+
+    def _check_store_version(self):
+        """Drop every cached hit if the vector store changed since they were written"""
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'store_version'").fetchone()
+        if row is None or row[0] != (self.store_version or ""):
+            self._db.execute("DELETE FROM hits")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('store_version', ?)",
+                             (self.store_version or "",))
+            self._db.commit()
+
+    def set_store_version(self, store_version):
+        """Invalidate cached hits when the store is rebuilt while the cache is open"""
+        with self._lock:
+            if store_version == self.store_version:
+                return
+            self.store_version = store_version
+            self._hits.clear()
+            if self._db is not None:
+                self._check_store_version()
+
+    def _key(self, query, *extra):
+        raw = "\x1f".join([self.model_name, normalize_query(query), *map(str, extra)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _db_get(self, table, key):
+        if self._db is None:
+            return None
+        columns = "vector" if table == "vectors" else "ids, scores"
+        try:
+            row = self._db.execute(f"SELECT {columns} FROM {table} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            return None  # Locked by another process: a miss
+        if row is not None:
+            self._db_write([(f"UPDATE {table} SET last_used = ? WHERE key = ?", (time.time(), key))])
+        return row
+
+    def _db_write(self, statements):
+        """Run (sql, params) statements in one committed transaction; False if the file is busy"""
+        try:
+            for sql, params in statements:
+                self._db.execute(sql, params)
+            self._db.commit()
+            return True
+        except sqlite3.OperationalError as e:
+            self._db.rollback()
+            print(f"Query cache write skipped: {e}")
+            return False
+
+    def _db_put(self, table, key, values):
+        if self._db is None:
+            return
+        placeholders = ", ".join("?" * (len(values) + 2))
+        statements = [(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", (key, *values, time.time()))]
+        self._puts += 1
+        if self._puts % EVICT_CHECK_INTERVAL == 0:
+            try:
+                count = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.OperationalError:
+                count = 0
+            if count > self.max_disk_entries:
+                evict = max(1, int(self.max_disk_entries * EVICT_FRACTION)) + count - self.max_disk_entries
+                statements.append((f"DELETE FROM {table} WHERE key IN "
+                                   f"(SELECT key FROM {table} ORDER BY last_used LIMIT ?)", (evict,)))
+        self._db_write(statements)
+
+    def get_vector(self, query):
+        key = self._key(query)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                row = self._db_get("vectors", key)
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._vectors.put(key, vector)
+            self.stats["vector_hits" if vector is not None else "vector_misses"] += 1
+            return vector
+
+    def put_vector(self, query, vector):
+        key = self._key(query)
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        with self._lock:
+            self._vectors.put(key, vector)
+            self._db_put("vectors", key, (vector.tobytes(),))
+
+    def get_hits(self, query, top_k, mode):
+        """Cached (scores, ids) for this query, top_k and search mode, or None"""
+        key = self._key(query, top_k, mode)
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                row = self._db_get("hits", key)
+                if row is not None:
+                    hits = (np.frombuffer(row[1], dtype=np.float32), np.frombuffer(row[0], dtype=np.int64))
+                    self._hits.put(key, hits)
+            self.stats["search_hits" if hits is not None else "search_misses"] += 1
+            return hits
+
+    def put_hits(self, query, top_k, mode, scores, ids):
+        key = self._key(query, top_k, mode)
+        scores = np.asarray(scores, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            self._hits.put(key, (scores, ids))
+            self._db_put("hits", key, (ids.tobytes(), scores.tobytes()))
+
+    def encode(self, queries, embedding_model, **encode_kwargs):
+        """Encode queries, running the model only on the ones not cached yet"""
+        vectors = [self.get_vector(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = embedding_model.encode([queries[i] for i in missing], convert_to_numpy=True,
+                                             **encode_kwargs)
+            for i, vector in zip(missing, encoded):
+                self.put_vector(queries[i], vector)
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        return np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
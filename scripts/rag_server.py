@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+RAG HTTP Service
+
+A long-lived FastAPI service around rag_system that:
+1. Loads the embedding model, packed store, ANN index and query cache once
+2. Coalesces concurrent requests into micro-batches (max MAX_BATCH_SIZE queries,
+   or whatever arrived within MAX_WAIT_MS) that are encoded with one
+   SentenceTransformer.encode call and scored with one matrix product
+3. Runs encoding and scoring in a worker thread, off the event loop
+4. Streams generated answers back as Server-Sent Events
+5. Exposes per-stage timings on /metrics (Prometheus text format) with --metrics
+
+Run from the repository root:
+    python scripts/rag_server.py [--host 0.0.0.0] [--port 8000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, StrictStr
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+import instrumentation
+import rag_system
+from sharded_index import filter_key
+
+MAX_BATCH_SIZE = 32  # Queries encoded together at most
+MAX_WAIT_MS = 5  # How long the first query of a batch waits for company
+LATENCY_WINDOW = 2048  # Recent requests kept for the percentile report
+CORS_ORIGINS = ["http://localhost:3000"]  # web-ui dev server
+
+
+class RangeFilter(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+# A value, a list of accepted values, or a numeric {"min": ..., "max": ...} range
+FilterValue = Union[StrictStr, int, float, List[Union[StrictStr, int, float]], RangeFilter]
+
+
+class QueryRequest(BaseModel):
+    query: str
+    top_k: int = rag_system.TOP_K
+    generate: bool = True
+    filters: Optional[Dict[str, FilterValue]] = None  # e.g. {"collection": "mn", "translator": "than"}
+
+    def search_filters(self):
+        """Filters as the plain dict sharded_index expects"""
+        if not self.filters:
+            return None
+        return {field: value.model_dump(exclude_none=True) if isinstance(value, RangeFilter) else value
+                for field, value in self.filters.items()}
+
+
+class MicroBatcher:
+    """Collects concurrent searches and runs them as one batch in a worker thread"""
+
+    def __init__(self, search_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.search_batch = search_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-batch")
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self._task = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def search(self, query: str, top_k: int, filters=None):
+        """Queue one search and wait for its batch to finish"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, top_k, filters, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batch_sizes.append(len(batch))
+            # Queries with the same filter and top_k are searched together
+            groups = {}
+            for item in batch:
+                groups.setdefault((filter_key(item[2]), item[1]), []).append(item)
+            for group in groups.values():
+                queries = [query for query, _, _, _ in group]
+                top_k = group[0][1]
+                try:
+                    results = await loop.run_in_executor(self.executor, self.search_batch, queries, top_k,
+                                                         group[0][2])
+                except Exception as e:
+                    for _, _, _, future in group:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, _, future), result in zip(group, results):
+                    if not future.done():
+                        future.set_result(result)
+
+
+class RagService:
+    """Everything loaded once at startup and shared by all requests"""
+
+    def __init__(self):
+        self.embeddings, self.texts, self.metadata, self.embedding_model = rag_system.load_embeddings_and_texts()
+        self.index = rag_system.load_search_index()
+        self.lexical = rag_system.load_lexical_search()
+        self.cache = rag_system.load_query_cache()
+        self.batcher = MicroBatcher(self.search_batch)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.started = time.time()
+
+    def search_batch(self, queries: List[str], top_k: int, filters=None):
+        """(retrieved chunks, context, report) per query, built as rag_system.rag_query does"""
+        return rag_system.query_contexts(queries, self.embeddings, self.texts, self.metadata, self.embedding_model,
+                                         top_k, self.index, self.cache, self.lexical, filters)
+
+    def record(self, seconds: float):
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    def stats(self):
+        latencies = np.asarray(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        uptime = time.time() - self.started
+        return {
+            "requests": self.requests,
+            "throughput_rps": self.requests / uptime if uptime else 0.0,
+            "search_latency_ms": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p99": float(np.percentile(latencies, 99)),
+            },
+            "mean_batch_size": float(np.mean(self.batcher.batch_sizes)) if self.batcher.batch_sizes else 0.0,
+            "cache": dict(self.cache.stats),
+        }
+
+
+def chunks_to_json(similar_chunks):
+    return [
+        {"text": text, "score": float(score), "metadata": dict(meta)}
+        for text, score, meta in similar_chunks
+    ]
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+service: Optional[RagService] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global service
+    service = await run_in_threadpool(RagService)
+    service.batcher.start()
+    yield
+    await service.batcher.stop()
+    service.cache.close()
+
+
+app = FastAPI(title="Contemplative AI RAG", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"])
+
+
+async def retrieve(request: QueryRequest):
+    """The top_k retrieved chunks, and the context packed from all candidates"""
+    start = time.perf_counter()
+    try:
+        similar_chunks, context, _ = await service.batcher.search(request.query, request.top_k,
+                                                                    request.search_filters())
+    except (TypeError, ValueError) as e:
+        # Unknown filter field, or a value the field cannot be compared with
+        raise HTTPException(status_code=400, detail=str(e))
+    service.record(time.perf_counter() - start)
+    return similar_chunks[:request.top_k], context
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "chunks": len(service.embeddings)}
+
+
+@app.get("/stats")
+async def stats():
+    return service.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text format; empty unless instrumentation is enabled (CONTEMPLATIVE_METRICS=1)"""
+    return instrumentation.prometheus_text()
+
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    similar_chunks, context = await retrieve(request)
+    result = {"query": request.query, "retrieved_chunks": chunks_to_json(similar_chunks)}
+    if request.generate:
+        generation_stats = {}
+        result["response"] = await run_in_threadpool(
+            rag_system.generate_response_with_ollama, request.query, context, None, generation_stats
+        )
+        result["generation_stats"] = generation_stats
+    return result
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """SSE stream: one 'chunks' event, then 'token' events, then 'done' with timing stats"""
+    similar_chunks, context = await retrieve(request)
+
+    async def events():
+        yield sse("chunks", chunks_to_json(similar_chunks))
+        if not request.generate:
+            yield sse("done", {})
+            return
+        generation_stats = {}
+        try:
+            tokens = rag_system.stream_response_with_ollama(request.query, context, generation_stats)
+            async for token in iterate_in_threadpool(tokens):
+                yield sse("token", {"token": token})
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+        yield sse("done", generation_stats)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the RAG HTTP service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--metrics", action="store_true", help="Record stage timings, exported on GET /metrics")
+    parser.add_argument("--metrics-file", help="Also append every span to this JSON-lines file")
+    args = parser.parse_args()
+    if args.metrics or args.metrics_file:
+        instrumentation.enable(args.metrics_file)
+    uvicorn.run(app, host=args.host, port=args.port)
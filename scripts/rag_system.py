@@ -8,88 +8,277 @@ This script implements a Retrieval-Augmented Generation (RAG) system that:
 3. Generates responses using Ollama with the retrieved context
 """
 
-import os
-import json
 import numpy as np
 import requests
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Tuple
-import time
+from typing import List, Dict
+from functools import lru_cache
+
+from ann_index import DEFAULT_NPROBE, exact_search, load_index
+from context_builder import build_context, format_report
+from encoder_backend import load_encoder, model_key
+from instrumentation import count, span
+from lexical_index import load_lexical_index, reciprocal_rank_fusion
+from quantization import load_quantized
+from ollama_client import format_stats, get_client
+from query_cache import QueryCache
+from sharded_index import ShardedIndex, ShardedLexical, filter_key, open_sharded_corpus, parse_filters
 
 # Configuration
-EMBEDDINGS_DIR = "data/embeddings/tripitaka/mn"
-TEXTS_DIR = "data/texts/tripitaka/mn"
+EMBEDDINGS_ROOT = "data/embeddings/tripitaka"  # One packed store (shard) per collection: mn/, dn/, ...
+TEXTS_ROOT = "data/texts/tripitaka"
+COLLECTIONS = ("mn", "dn", "sn", "an", "kn")  # Shards searched; collections without a store are skipped
+SEARCH_FILTERS = None  # Default filter, e.g. {"collection": "mn"} or {"translator": "than"} (see sharded_index.py)
 OLLAMA_BASE_URL = "http://localhost:11434"
 MODEL_NAME = "mistral"  # Change this to your specific model
+OLLAMA_CONNECT_TIMEOUT = 5  # Seconds to connect to Ollama
+OLLAMA_READ_TIMEOUT = 300  # Seconds without a new token before giving up (long scripts are fine)
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = "torch"  # "torch", "int8" or "onnx" (see encoder_backend.py); check parity before switching
+ENCODER_THREADS = None  # CPU threads for query encoding; None = one per core
 TOP_K = 3  # Number of most similar chunks to retrieve
+USE_ANN_INDEX = False  # Use the IVF index when built; enable after checking recall with ann_index.py eval
+ANN_NPROBE = DEFAULT_NPROBE  # Inverted lists scanned per query: higher = better recall, slower
+QUANTIZATION = None  # "int8" or "binary": shortlist on quantized codes, rescore exactly (see quantization.py)
+HYBRID_SEARCH = True  # Fuse BM25 results (see lexical_index.py) with the dense ones when the index exists
+HYBRID_DEPTH = 50  # Results taken from each of the dense and lexical rankings before fusion
+USE_CONTEXT_BUILDER = True  # MMR + merged overlapping chunks + token budget (see context_builder.py)
+CONTEXT_CANDIDATES = 20  # Chunks retrieved for the context builder to choose from
+CONTEXT_TOKEN_BUDGET = 2048  # Context tokens given to MODEL_NAME
+QUERY_CACHE_PATH = "data/cache/query_cache.sqlite"  # Set to None for an in-memory cache only
+
+@lru_cache(maxsize=1)
+def load_corpus():
+    """Open the packed store of every collection in COLLECTIONS (one shard each)"""
+    corpus = open_sharded_corpus(EMBEDDINGS_ROOT, COLLECTIONS)
+    if not corpus.shards:
+        raise FileNotFoundError(
+            f"No embedding store found in {EMBEDDINGS_ROOT}/{{{','.join(COLLECTIONS)}}}. Run "
+            f"generate_embeddings.py, or move old .npy files to {EMBEDDINGS_ROOT}/mn-legacy and convert them "
+            f"with: python scripts/embedding_store.py pack-legacy {EMBEDDINGS_ROOT}/mn-legacy {TEXTS_ROOT}/mn "
+            f"{EMBEDDINGS_ROOT}/mn"
+        )
+    return corpus
 
 def load_embeddings_and_texts():
-    """Load all embeddings and their corresponding texts"""
-    embeddings = []
-    texts = []
-    metadata = []
-    
+    """Load all embeddings and their corresponding texts from the packed stores"""
     # Load embedding model for query encoding
     print("Loading embedding model...")
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    with span("embedding_model_load"):
+        embedding_model = load_encoder(EMBEDDING_MODEL, EMBEDDING_BACKEND, ENCODER_THREADS)
     
-    # Iterate through all embedding files
+    # Open the packed stores; vectors and texts stay memory-mapped
     print("Loading embeddings and texts...")
-    for embedding_file in Path(EMBEDDINGS_DIR).glob("*.npy"):
-        # Load embedding
-        embedding = np.load(embedding_file)
+    with span("corpus_load"):
+        corpus = load_corpus()
+    print(f"Collections: {', '.join(f'{shard.name} ({len(shard)} chunks)' for shard in corpus.shards)}")
+    
+    return corpus.embeddings, corpus.texts, corpus.metadata, embedding_model
+
+def load_shard_index(shard):
+    """Load the quantized codes or ANN index built for a shard's store, or None to search it exactly"""
+    version = shard.store.version
+    if QUANTIZATION is not None:
+        index = load_quantized(shard.store_dir, QUANTIZATION, version)
+        if index is not None:
+            print(f"Loaded {shard.name} {QUANTIZATION} codes ({index.nbytes / 1e6:.1f} MB, "
+                  f"shortlist x{index.oversample})")
+            return index
+    if not USE_ANN_INDEX:
+        return None
+    index = load_index(shard.store_dir, version)
+    if index is not None:
+        print(f"Loaded {shard.name} IVF index with {index.nlist} lists (nprobe={ANN_NPROBE})")
+    return index
+
+def load_search_index():
+    """Search over every shard, each with its quantized codes or ANN index when one is built"""
+    corpus = load_corpus()
+    for shard in corpus.shards:
+        shard.index = load_shard_index(shard)
+    return ShardedIndex(corpus)
+
+def load_lexical_search():
+    """Load the BM25 index of every shard, or None for dense-only retrieval"""
+    if not HYBRID_SEARCH:
+        return None
+    corpus = load_corpus()
+    for shard in corpus.shards:
+        shard.lexical = load_lexical_index(shard.store_dir, shard.store.version)
+        if shard.lexical is not None:
+            print(f"Loaded {shard.name} lexical index with {len(shard.lexical.vocabulary)} terms (hybrid search)")
+    if all(shard.lexical is None for shard in corpus.shards):
+        return None
+    return ShardedLexical(corpus)
+
+def load_query_cache():
+    """Open the query cache; cached hits are dropped automatically when any shard changes"""
+    return QueryCache(model_key(EMBEDDING_MODEL, EMBEDDING_BACKEND), store_version=load_corpus().version,
+                      path=QUERY_CACHE_PATH)
+
+def find_similar_chunks(query: str, embeddings, texts, metadata, embedding_model, top_k: int = TOP_K,
+                        index=None, nprobe: int = ANN_NPROBE, cache=None, lexical=None, filters=None):
+    """Find the most similar text chunks to the query
+    
+    With an index (IVF or quantized) the search is approximate; without one every
+    chunk is scored (exact mode). With a lexical index, BM25 and dense rankings
+    are fused and the returned score is the reciprocal-rank fusion score.
+    Filters (see sharded_index.py) restrict the search to matching chunks.
+    """
+    return find_similar_chunks_batch([query], embeddings, texts, metadata, embedding_model,
+                                     top_k, index, nprobe, cache, lexical, filters)[0]
+
+def encode_queries(queries: List[str], embedding_model, cache=None):
+    """Query vectors, taken from the cache when possible"""
+    if cache is not None:
+        return cache.encode(queries, embedding_model)
+    return embedding_model.encode(queries, convert_to_numpy=True)
+
+def find_similar_chunks_batch(queries: List[str], embeddings, texts, metadata, embedding_model,
+                              top_k: int = TOP_K, index=None, nprobe: int = ANN_NPROBE, cache=None,
+                              lexical=None, filters=None):
+    """Find the most similar text chunks for many queries at once
+    
+    All queries are encoded in a single batch and scored together; returns one
+    result list per query, in the same order as `queries`. With a cache, queries
+    seen before skip both encoding and scoring.
+    """
+    hits = search_ids_batch(queries, embeddings, embedding_model, top_k, index, nprobe, cache, lexical, filters)
+    results = []
+    for scores, top_indices in hits:
+        results.append([
+            (texts[idx], score, metadata[idx])
+            for idx, score in zip(top_indices, scores)
+        ])
+    
+    return results
+
+def search_ids_batch(queries: List[str], embeddings, embedding_model, top_k: int = TOP_K, index=None,
+                     nprobe: int = ANN_NPROBE, cache=None, lexical=None, filters=None, return_vectors=False):
+    """Top-k (scores, chunk ids) for every query, best first
+    
+    Filters need the sharded index returned by load_search_index. With
+    return_vectors=True, returns (hits, query vectors) so callers do not encode
+    the queries a second time.
+    """
+    queries = list(queries)
+    if filters and not isinstance(index, ShardedIndex):
+        raise ValueError("Search filters need the sharded index from load_search_index()")
+    search_mode = index.label(nprobe) if index is not None else "exact"
+    if lexical is not None:
+        search_mode += "+bm25"
+    # Cached hits are keyed by the filter too; the metrics label only says whether there was one
+    mode = f"{search_mode}|{filter_key(filters)}" if filters else search_mode
+    hits = [cache.get_hits(query, top_k, mode) for query in queries] if cache else [None] * len(queries)
+    missing = [i for i, hit in enumerate(hits) if hit is None]
+    vectors = [None] * len(queries)
+    count("queries_total", len(queries))
+    count("search_cache_hits_total", len(queries) - len(missing))
+    
+    if missing:
+        # Encode all remaining queries in one batch
+        missing_queries = [queries[i] for i in missing]
+        with span("query_encode"):
+            query_embeddings = encode_queries(missing_queries, embedding_model, cache)
         
-        # Load corresponding metadata
-        metadata_file = embedding_file.with_suffix('.json')
-        if metadata_file.exists():
-            with open(metadata_file, 'r') as f:
-                meta = json.load(f)
-        else:
-            meta = {"filename": embedding_file.stem, "chunk_id": 0}
+        depth = max(top_k, HYBRID_DEPTH) if lexical is not None else top_k
+        with span("search", mode=search_mode, filtered="true" if filters else "false"):
+            if filters:
+                found = index.search(embeddings, query_embeddings, depth, nprobe, filters=filters)
+            elif index is not None:
+                found = index.search(embeddings, query_embeddings, depth, nprobe)
+            else:
+                found = exact_search(embeddings, query_embeddings, depth)
+            
+            if lexical is not None:
+                lexical_found = (lexical.search_batch(missing_queries, depth, filters=filters) if filters
+                                 else lexical.search_batch(missing_queries, depth))
+                found = [reciprocal_rank_fusion([dense_ids, lexical_ids], top_k)
+                         for (_, dense_ids), (_, lexical_ids) in zip(found, lexical_found)]
         
-        # Load corresponding text
-        text_file = Path(TEXTS_DIR) / f"{meta['filename']}.txt"
+        for i, (scores, ids), vector in zip(missing, found, query_embeddings):
+            hits[i] = (scores, ids)
+            vectors[i] = vector
+            if cache is not None:
+                cache.put_hits(queries[i], top_k, mode, scores, ids)
+    
+    if return_vectors:
+        # Queries answered from the cache also have their vector cached
+        cached = [i for i, vector in enumerate(vectors) if vector is None]
+        if cached:
+            for i, vector in zip(cached, encode_queries([queries[i] for i in cached], embedding_model, cache)):
+                vectors[i] = vector
+        return hits, vectors
+    return hits
+
+@lru_cache(maxsize=64)
+def read_source_text(filename: str):
+    """Full text of a source .txt file, looked up in every collection, or None if it is not available"""
+    for collection in COLLECTIONS:
+        text_file = Path(TEXTS_ROOT) / collection / filename
+        if not text_file.suffix:
+            text_file = text_file.with_suffix(".txt")
         if text_file.exists():
             with open(text_file, 'r', encoding='utf-8') as f:
-                text_content = f.read()
-        else:
-            text_content = f"Text from {meta['filename']}"
-        
-        embeddings.append(embedding)
-        texts.append(text_content)
-        metadata.append(meta)
-    
-    return np.array(embeddings), texts, metadata, embedding_model
+                return f.read()
+    return None
 
-def find_similar_chunks(query: str, embeddings, texts, metadata, embedding_model, top_k: int = TOP_K):
-    """Find the most similar text chunks to the query"""
-    # Encode the query
-    query_embedding = embedding_model.encode([query])
-    
-    # Calculate cosine similarities
-    similarities = np.dot(embeddings, query_embedding.T).flatten()
-    
-    # Get top-k indices
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+def source_span(meta) -> str:
+    """Exact source text of a chunk, read from its .txt file using the stored character offsets"""
+    if "start_char" not in meta:
+        return ""
+    text = read_source_text(meta["filename"])
+    if text is None:
+        return ""
+    return text[meta["start_char"]:meta["end_char"]]
+
+def build_query_contexts(queries: List[str], embeddings, texts, metadata, embedding_model, index=None,
+                         cache=None, lexical=None, candidates: int = None, filters=None, token_budget: int = None):
+    """Retrieve `candidates` chunks per query and pack them into `token_budget` tokens
     
+    All queries are encoded and searched in one batch. Returns one
+    (retrieved chunks, context, report) per query. The defaults are
+    CONTEXT_CANDIDATES and CONTEXT_TOKEN_BUDGET.
+    """
+    if candidates is None:
+        candidates = CONTEXT_CANDIDATES
+    if token_budget is None:
+        token_budget = CONTEXT_TOKEN_BUDGET
+    hits, query_vectors = search_ids_batch(queries, embeddings, embedding_model, candidates, index,
+                                           cache=cache, lexical=lexical, filters=filters, return_vectors=True)
     results = []
-    for idx in top_indices:
-        results.append((
-            texts[idx],
-            similarities[idx],
-            metadata[idx]
-        ))
-    
+    for query_vector, (scores, ids) in zip(query_vectors, hits):
+        similar_chunks = [(texts[idx], score, metadata[idx]) for idx, score in zip(ids, scores)]
+        with span("context_build"):
+            context, _, report = build_context(query_vector, [(text, meta) for text, _, meta in similar_chunks],
+                                               np.asarray(embeddings[ids]), token_budget,
+                                               read_source=read_source_text)
+        results.append((similar_chunks, context, report))
     return results
 
-def generate_response_with_ollama(query: str, context: str) -> str:
-    """Generate a response using Ollama with the provided context"""
-    url = f"{OLLAMA_BASE_URL}/api/generate"
+def build_query_context(query: str, embeddings, texts, metadata, embedding_model, index=None,
+                        cache=None, lexical=None, candidates: int = None, filters=None, token_budget: int = None):
+    """build_query_contexts for a single query"""
+    return build_query_contexts([query], embeddings, texts, metadata, embedding_model, index, cache, lexical,
+                                candidates, filters, token_budget)[0]
+
+def query_contexts(queries: List[str], embeddings, texts, metadata, embedding_model, top_k: int = TOP_K,
+                   index=None, cache=None, lexical=None, filters=None):
+    """(retrieved chunks, context, report) for every query, the way rag_query builds its context
     
-    # Create a prompt that includes the context
-    prompt = f"""Based on the following Buddhist text context, please answer the question.
+    With USE_CONTEXT_BUILDER the context builder packs max(top_k, CONTEXT_CANDIDATES)
+    chunks; otherwise the top_k chunks are joined and the report is None.
+    """
+    if USE_CONTEXT_BUILDER:
+        return build_query_contexts(queries, embeddings, texts, metadata, embedding_model, index, cache, lexical,
+                                    max(top_k, CONTEXT_CANDIDATES), filters)
+    results = find_similar_chunks_batch(queries, embeddings, texts, metadata, embedding_model, top_k, index,
+                                        cache=cache, lexical=lexical, filters=filters)
+    return [(chunks, "\n\n".join(text for text, _, _ in chunks), None) for chunks in results]
+
+def build_prompt(query: str, context: str) -> str:
+    """Create a prompt that includes the context"""
+    return f"""Based on the following Buddhist text context, please answer the question.
 
 Context:
 {context}
@@ -97,65 +286,93 @@ Context:
 Question: {query}
 
 Please provide a thoughtful and accurate response based on the context provided:"""
+
+def stream_response_with_ollama(query: str, context: str, stats: Dict = None):
+    """Yield response tokens from Ollama as they are generated"""
+    client = get_client(OLLAMA_BASE_URL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+    with span("prompt_build"):
+        prompt = build_prompt(query, context)
+    yield from client.stream_generate(prompt, MODEL_NAME, stats=stats)
+
+def generate_response_with_ollama(query: str, context: str, on_token=None, stats: Dict = None) -> str:
+    """Generate a response using Ollama with the provided context
     
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False
-    }
-    
+    on_token, if given, is called with every token as it arrives.
+    """
+    tokens = []
     try:
-        response = requests.post(url, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result.get('response', 'No response generated')
+        for token in stream_response_with_ollama(query, context, stats):
+            tokens.append(token)
+            if on_token is not None:
+                on_token(token)
+        return "".join(tokens) or 'No response generated'
     
     except requests.exceptions.RequestException as e:
         return f"Error communicating with Ollama: {str(e)}"
     except Exception as e:
         return f"Error generating response: {str(e)}"
 
-def rag_query(query: str, embeddings, texts, metadata, embedding_model, top_k: int = TOP_K) -> Dict:
-    """Complete RAG pipeline: retrieve relevant texts and generate response"""
+def rag_query(query: str, embeddings, texts, metadata, embedding_model, top_k: int = TOP_K,
+              index=None, cache=None, stream: bool = False, lexical=None, filters=None) -> Dict:
+    """Complete RAG pipeline: retrieve relevant texts and generate response
+    
+    With stream=True the response is printed token by token as it is generated.
+    Without filters, SEARCH_FILTERS applies.
+    """
+    if filters is None:
+        filters = SEARCH_FILTERS
     print(f"Query: {query}")
     print("-" * 50)
     
     # Step 1: Find similar chunks
     print("Searching for relevant texts...")
-    similar_chunks = find_similar_chunks(query, embeddings, texts, metadata, embedding_model, top_k)
+    similar_chunks, context, report = query_contexts([query], embeddings, texts, metadata, embedding_model,
+                                                     top_k, index, cache, lexical, filters)[0]
     
     # Step 2: Display retrieved chunks
     print(f"\nRetrieved {len(similar_chunks)} relevant chunks:")
     for i, (text, similarity, meta) in enumerate(similar_chunks, 1):
         print(f"\n--- Chunk {i} (Similarity: {similarity:.4f}) ---")
-        print(f"Source: {meta.get('filename', 'Unknown')}")
+        char_span = f" [chars {meta['start_char']}-{meta['end_char']}]" if "start_char" in meta else ""
+        print(f"Source: {meta.get('filename', 'Unknown')}{char_span}")
         print(f"Text: {text[:200]}...")
     
     # Step 3: Combine context
-    context = "\n\n".join([text for text, _, _ in similar_chunks])
+    if report is not None:
+        print(f"\nContext: {format_report(report)}")
     
     # Step 4: Generate response
     print("\nGenerating response with Ollama...")
-    response = generate_response_with_ollama(query, context)
+    stats = {}
+    on_token = (lambda token: print(token, end="", flush=True)) if stream else None
+    response = generate_response_with_ollama(query, context, on_token, stats)
+    if stream:
+        print()
+    if stats:
+        print(f"Ollama: {format_stats(stats)}")
     
     return {
         "query": query,
         "retrieved_chunks": similar_chunks,
         "response": response,
-        "context": context
+        "context": context,
+        "generation_stats": stats
     }
 
 def interactive_rag():
     """Interactive interface for asking questions"""
     print("Buddhist Texts RAG System")
-    print("Type 'quit' to exit")
+    print("Type 'quit' to exit, 'filter collection=mn,translator=than' to restrict the search, 'filter' to clear it")
     print("-" * 40)
     
     # Load data
     embeddings, texts, metadata, embedding_model = load_embeddings_and_texts()
     print(f"Loaded {len(embeddings)} embeddings")
     print(f"Embedding dimension: {embeddings.shape[1]}")
+    index = load_search_index()
+    lexical = load_lexical_search()
+    cache = load_query_cache()
+    filters = SEARCH_FILTERS
     
     while True:
         query = input("\nEnter your question: ").strip()
@@ -167,12 +384,15 @@ def interactive_rag():
         if not query:
             continue
         
+        if query.split()[0] == "filter":
+            filters = parse_filters(query[len("filter"):].strip()) or {}
+            print(f"Search filter: {filter_key(filters) or 'none'}")
+            continue
+        
         try:
-            result = rag_query(query, embeddings, texts, metadata, embedding_model)
-            print("\n" + "="*60)
-            print("RESPONSE:")
-            print("="*60)
-            print(result['response'])
+            # The response is streamed to the terminal while it is generated
+            rag_query(query, embeddings, texts, metadata, embedding_model, index=index, cache=cache,
+                      stream=True, lexical=lexical, filters=filters)
             print("="*60)
         except Exception as e:
             print(f"Error: {str(e)}")
@@ -183,10 +403,14 @@ def test_rag():
     embeddings, texts, metadata, embedding_model = load_embeddings_and_texts()
     print(f"Loaded {len(embeddings)} embeddings")
     print(f"Embedding dimension: {embeddings.shape[1]}")
+    index = load_search_index()
+    lexical = load_lexical_search()
+    cache = load_query_cache()
     
     # Test query
     test_query = "What does the Buddha teach about mindfulness?"
-    result = rag_query(test_query, embeddings, texts, metadata, embedding_model)
+    result = rag_query(test_query, embeddings, texts, metadata, embedding_model, index=index, cache=cache,
+                       lexical=lexical)
     
     print("\n" + "="*60)
     print("FINAL RESPONSE:")
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Sharded Index
+
+Splits the corpus into one packed store per collection (mn, dn, sn, an, kn)
+and searches them together:
+1. Every shard keeps its own store, ANN/quantized index and lexical index
+2. A metadata index maps payload values (filename, translator, chunk_length...)
+   to row ids, so a filter pre-selects the candidate rows before any scoring;
+   a collection filter skips whole shards
+3. Shards are searched in parallel and their best-first results are combined
+   with a k-way top-k merge
+
+Rows are addressed by a global id: the shard's offset plus the row within it.
+
+Filters map a field to a value, a list of accepted values, or a
+{"min": ..., "max": ...} range:
+    {"collection": "mn", "translator": ["than", "bodh"], "chunk_length": {"min": 200}}
+
+    python sharded_index.py info data/embeddings/tripitaka
+    python sharded_index.py search data/embeddings/tripitaka "collection=mn,translator=than"
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import DEFAULT_NPROBE, exact_search, sample_queries
+from embedding_store import open_embedding_store, store_exists
+
+COLLECTIONS = ("mn", "dn", "sn", "an", "kn")  # Nikāyas of the Sutta Piṭaka, one shard each
+SHARD_WORKERS = len(COLLECTIONS)  # Shards searched concurrently (NumPy releases the GIL while scoring)
+
+
+def translator_of(filename: str) -> str:
+    """Translator code of an Access to Insight file name (mn.118.than.txt -> "than"), or ""
+
+    Only the leaf name counts: texts from kn sub-directories are named
+    <book>__<leaf>.txt by extract_chapters.py. A translation is named
+    <book>.<number>.<translator>, so index and intro pages have no translator.
+    """
+    parts = Path(filename).stem.rsplit("__", 1)[-1].split(".")
+    if len(parts) > 2 and parts[-1].isalpha() and any(part[:1].isdigit() for part in parts[1:-1]):
+        return parts[-1]
+    return ""
+
+
+def shard_fields(filename: str, collection: str):
+    """Payload fields used to filter across shards"""
+    return {"collection": collection, "translator": translator_of(filename)}
+
+
+def filter_key(filters) -> str:
+    """Stable text form of a filter, used to key cached results"""
+    return json.dumps(filters, sort_keys=True, ensure_ascii=False) if filters else ""
+
+
+def parse_filters(text: str):
+    """Filters from "field=value,field=a|b,field=min..max" (command-line form)"""
+    filters = {}
+    for item in filter(None, text.split(",")):
+        field, _, value = item.partition("=")
+        if ".." in value:
+            low, high = value.split("..")
+            filters[field] = {k: float(v) for k, v in (("min", low), ("max", high)) if v}
+        elif "|" in value:
+            filters[field] = value.split("|")
+        else:
+            filters[field] = value
+    return filters
+
+
+def merge_top_k(results, top_k):
+    """k-way merge of (scores, ids) lists that are each sorted best first"""
+    streams = (zip(scores.tolist(), ids.tolist()) for scores, ids in results)
+    best = list(islice(heapq.merge(*streams, key=lambda hit: (-hit[0], hit[1])), top_k))
+    return (np.asarray([score for score, _ in best], dtype=np.float32),
+            np.asarray([idx for _, idx in best], dtype=np.int64))
+
+
+class MetadataIndex:
+    """Row ids per metadata value of one store, built lazily per field"""
+
+    def __init__(self, store):
+        self.store = store
+        self._fields = {}
+
+    def _postings(self, field):
+        """(value -> code, row ids grouped by code, group offsets) of a string field"""
+        if field in self.store.columns:
+            codes, values = self.store.codes(field)
+            codes = np.asarray(codes)
+        elif field == "translator" and "filename" in self.store.columns:
+            # Stores written before the translator field existed
+            filename_codes, filenames = self.store.codes("filename")
+            values = sorted({translator_of(name) for name in filenames})
+            lookup = np.asarray([values.index(translator_of(name)) for name in filenames], dtype=np.int32)
+            codes = lookup[np.asarray(filename_codes)]
+        else:
+            raise ValueError(f"Unknown filter field '{field}' (fields: {', '.join(self.store.columns)})")
+        order = np.argsort(codes, kind="stable").astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(values)))))
+        return {value: code for code, value in enumerate(values)}, order, offsets
+
+    def _sorted_numeric(self, field):
+        """(row ids sorted by value, sorted values) of a numeric field"""
+        column = np.asarray(self.store.column(field))
+        order = np.argsort(column, kind="stable").astype(np.int64)
+        return order, column[order]
+
+    def _field(self, field):
+        if field not in self._fields:
+            numeric = field in self.store.columns and self.store.header["columns"][field]["kind"] != "category"
+            self._fields[field] = ("numeric", self._sorted_numeric(field)) if numeric \
+                else ("category", self._postings(field))
+        return self._fields[field]
+
+    def rows(self, field, condition):
+        """Sorted row ids whose `field` satisfies `condition`"""
+        kind, data = self._field(field)
+        if kind == "numeric":
+            order, values = data
+            if isinstance(condition, dict):
+                low = np.searchsorted(values, condition["min"], "left") if "min" in condition else 0
+                high = np.searchsorted(values, condition["max"], "right") if "max" in condition else len(values)
+                return np.sort(order[low:high])
+            accepted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+            return np.sort(order[np.isin(values, list(accepted))])
+
+        lookup, order, offsets = data
+        accepted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+        codes = [lookup[str(value)] for value in accepted if str(value) in lookup]
+        if not codes:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([order[offsets[code]:offsets[code + 1]] for code in codes]))
+
+    def select(self, filters):
+        """Sorted row ids matching every filter"""
+        selected = None
+        for field, condition in filters.items():
+            rows = self.rows(field, condition)
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+            if not len(selected):
+                break
+        return selected
+
+
+class Shard:
+    """One collection: its packed store, optional search indexes and metadata index"""
+
+    def __init__(self, name, store_dir, offset=0):
+        self.name = name
+        self.store_dir = Path(store_dir)
+        self.store = open_embedding_store(store_dir)
+        self.offset = offset
+        self.index = None  # IVF or quantized index; None scores every row
+        self.lexical = None
+        self.metadata_index = MetadataIndex(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def matches_collection(self, filters) -> bool:
+        accepted = (filters or {}).get("collection")
+        if accepted is None:
+            return True
+        return self.name in (accepted if isinstance(accepted, (list, tuple, set)) else [accepted])
+
+    def rows(self, filters):
+        """Row ids a filter allows in this shard, or None when it allows every row"""
+        if not self.matches_collection(filters):
+            return np.zeros(0, dtype=np.int64)
+        filters = {field: value for field, value in (filters or {}).items() if field != "collection"}
+        if not filters:
+            return None
+        return self.metadata_index.select(filters)
+
+    def _to_global(self, results):
+        return [(scores, ids + self.offset) for scores, ids in results]
+
+    def search(self, query_vectors, top_k, nprobe=DEFAULT_NPROBE, filters=None):
+        """Dense top-k per query as (scores, global ids)
+
+        With a filter only the selected rows are read and scored, so the cost
+        follows the size of the selection rather than the shard.
+        """
+        rows = self.rows(filters)
+        if rows is None:
+            if self.index is not None:
+                return self._to_global(self.index.search(self.store.embeddings, query_vectors, top_k, nprobe))
+            return self._to_global(exact_search(self.store.embeddings, query_vectors, top_k))
+        found = exact_search(np.asarray(self.store.embeddings[rows]), query_vectors, top_k)
+        return [(scores, rows[ids] + self.offset) for scores, ids in found]
+
+    def search_lexical(self, queries, top_k, filters=None):
+        rows = self.rows(filters)
+        return self._to_global(self.lexical.search(query, top_k, rows=rows) for query in queries)
+
+
+class ShardedRows:
+    """Read-only rows (vectors, texts or metadata) of several shards, addressed by global id"""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.offsets = np.concatenate(([0], np.cumsum([len(part) for part in parts]))).astype(np.int64)
+        self._arrays = all(isinstance(part, np.ndarray) for part in parts)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self):
+        return (len(self),) + self.parts[0].shape[1:]
+
+    @property
+    def dtype(self):
+        return self.parts[0].dtype
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1 or not self._arrays:
+                return self[np.arange(start, stop, step)]
+            pieces = [part[max(start - low, 0):max(stop - low, 0)]
+                      for part, low in zip(self.parts, self.offsets[:-1]) if stop > low and start < low + len(part)]
+            return np.concatenate([np.asarray(piece) for piece in pieces]) if pieces \
+                else np.zeros((0,) + self.shape[1:], dtype=self.dtype)
+        if np.ndim(idx) == 0:
+            idx = int(idx)
+            shard = int(np.searchsorted(self.offsets, idx, side="right")) - 1
+            if not 0 <= idx < len(self):
+                raise IndexError("row index out of range")
+            return self.parts[shard][idx - self.offsets[shard]]
+
+        ids = np.asarray(idx, dtype=np.int64)
+        shards = np.searchsorted(self.offsets, ids, side="right") - 1
+        local = ids - self.offsets[shards]
+        if not self._arrays:
+            return [self.parts[shard][row] for shard, row in zip(shards.tolist(), local.tolist())]
+        out = np.empty((len(ids),) + self.shape[1:], dtype=self.dtype)
+        for shard in np.unique(shards):
+            mask = shards == shard
+            out[mask] = self.parts[shard][local[mask]]
+        return out
+
+
+class ShardedCorpus:
+    """Every shard found under a root directory, with combined row views"""
+
+    def __init__(self, shards, workers=SHARD_WORKERS):
+        self.shards = shards
+        offset = 0
+        for shard in shards:
+            shard.offset = offset
+            offset += len(shard)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(shards))),
+                                       thread_name_prefix="shard")
+        stores = [shard.store for shard in shards]
+        if len(stores) == 1:
+            self.embeddings, self.texts, self.metadata = stores[0].embeddings, stores[0].texts, stores[0].metadata
+        else:
+            self.embeddings = ShardedRows([store.embeddings for store in stores])
+            self.texts = ShardedRows([store.texts for store in stores])
+            self.metadata = ShardedRows([store.metadata for store in stores])
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    @property
+    def version(self) -> str:
+        """Changes whenever any shard is rebuilt, added or removed"""
+        if len(self.shards) == 1:
+            return self.shards[0].store.version
+        joined = ",".join(f"{shard.name}:{shard.store.version}" for shard in self.shards)
+        return hashlib.sha256(joined.encode()).hexdigest()[:16]
+
+    def map(self, fn, filters=None):
+        """fn(shard) for every shard the filter can match, run in parallel"""
+        shards = [shard for shard in self.shards if shard.matches_collection(filters)]
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self.pool.map(fn, shards))
+
+
+class ShardedIndex:
+    """Dense search over every shard, with the same interface as IVFIndex and QuantizedIndex"""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def label(self, nprobe=DEFAULT_NPROBE):
+        """Search mode tag used to key cached results"""
+        return ",".join(f"{shard.name}={shard.index.label(nprobe) if shard.index is not None else 'exact'}"
+                        for shard in self.corpus.shards)
+
+    def search(self, embeddings, query_vectors, top_k, nprobe=DEFAULT_NPROBE, filters=None):
+        """Top-k per query over the shards a filter can match, as (scores, global ids) best first
+
+        `embeddings` is ignored: every shard scores its own store.
+        """
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        per_shard = self.corpus.map(lambda shard: shard.search(query_vectors, top_k, nprobe, filters), filters)
+        return [merge_top_k([found[i] for found in per_shard], top_k) for i in range(len(query_vectors))]
+
+
+class ShardedLexical:
+    """BM25 search over every shard that has a lexical index
+
+    BM25 statistics are per shard, so the merged scores are only comparable
+    within similarly sized shards; hybrid search fuses ranks, not scores.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def search_batch(self, queries, top_k, filters=None):
+        queries = list(queries)
+        per_shard = self.corpus.map(
+            lambda shard: shard.search_lexical(queries, top_k, filters) if shard.lexical is not None
+            else [(np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64))] * len(queries), filters)
+        return [merge_top_k([found[i] for found in per_shard], top_k) for i in range(len(queries))]
+
+
+def open_sharded_corpus(root, collections=COLLECTIONS, workers=SHARD_WORKERS) -> ShardedCorpus:
+    """Open root/<collection> for every collection that has a packed store"""
+    shards = [Shard(name, Path(root) / name) for name in collections if store_exists(Path(root) / name)]
+    return ShardedCorpus(shards, workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or query the per-collection shards")
+    parser.add_argument("command", choices=["info", "search"])
+    parser.add_argument("root", help="Directory with one packed store per collection")
+    parser.add_argument("filters", nargs="?", default="", help='e.g. "collection=mn,translator=than|bodh"')
+    parser.add_argument("--queries", type=int, default=50, help="Sampled queries for search")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    corpus = open_sharded_corpus(args.root)
+    if args.command == "info":
+        for shard in corpus.shards:
+            print(f"  {shard.name:<4} {len(shard):>8} rows  version {shard.store.version}  {shard.store_dir}")
+        print(f"{len(corpus)} rows in {len(corpus.shards)} shards")
+    else:
+        filters = parse_filters(args.filters)
+        index = ShardedIndex(corpus)
+        queries = sample_queries(corpus.embeddings, args.queries)
+        for label, active in [("unfiltered", None), (f"filter {filter_key(filters)}", filters)]:
+            start = time.perf_counter()
+            found = index.search(corpus.embeddings, queries, args.top_k, filters=active)
+            latency = (time.perf_counter() - start) * 1000 / len(queries)
+            print(f"{label}: {latency:.2f} ms/query")
+        for score, idx in zip(*found[0]):
+            meta = corpus.metadata[idx]
+            print(f"  {score:.4f}  {meta.get('filename', '?')}")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Streaming Pipeline
+
+Overlaps guide generation with narration instead of running them one after the other:
+1. SegmentParser reads the LLM token stream and emits a narration segment as
+   soon as the [Pausa X segundos] marker that closes it has arrived
+2. A producer thread drains the token stream into a queue, so the connection
+   to Ollama keeps being read while the writer waits on the TTS
+3. The segments go straight into iter_audio (tts_renderer.py), which
+   synthesises section 1 while the model is still writing section 5
+
+End-to-end time approaches max(LLM, TTS) instead of their sum. The segments
+are exactly those parse_guide would return for the finished text.
+
+Demo with a stub token stream and a stub TTS (no model needed):
+    python stream_pipeline.py
+"""
+
+import argparse
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from instrumentation import count, observe
+from tts_renderer import PAUSE_PATTERN, SAMPLE_RATE, Segment, iter_audio, parse_guide, write_audio
+
+_DONE = object()
+
+
+class SegmentParser:
+    """Incremental version of parse_guide: feed() tokens, get finished segments back"""
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, token: str) -> List[Segment]:
+        """Add a token; returns the segments closed by a pause marker within it"""
+        old_length = len(self._buffer)
+        self._buffer += token
+        # A marker completed by this token starts at the last "[" seen so far, or inside the token
+        start = self._buffer.rfind("[", 0, old_length)
+        if start < 0:
+            start = old_length
+        segments = []
+        consumed = 0
+        for match in PAUSE_PATTERN.finditer(self._buffer, start):
+            speech = self._buffer[consumed:match.start()].strip()
+            if speech:
+                segments.append(("speech", speech))
+            segments.append(("pause", int(match.group(1))))
+            consumed = match.end()
+        if consumed:
+            self._buffer = self._buffer[consumed:]
+        return segments
+
+    def close(self) -> List[Segment]:
+        """Segments left once the stream has ended (the text after the last marker)"""
+        speech, self._buffer = self._buffer.strip(), ""
+        return [("speech", speech)] if speech else []
+
+
+def iter_segments(tokens: Iterable[str]) -> Iterator[Segment]:
+    """Segments of a token stream, each one yielded as soon as it is complete"""
+    parser = SegmentParser()
+    for token in tokens:
+        yield from parser.feed(token)
+    yield from parser.close()
+
+
+class SegmentProducer:
+    """Reads a token stream on a background thread and yields its segments in order
+
+    The full generated text is available as .text once iteration is over.
+    Errors raised by the token stream are re-raised in the consuming thread.
+    """
+
+    def __init__(self, tokens: Iterable[str], on_token: Optional[Callable[[str], None]] = None):
+        self.tokens = tokens
+        self.on_token = on_token
+        self.parts = []
+        self.llm_time = None  # Seconds until the token stream ended
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="segment-producer", daemon=True)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            for segment in iter_segments(self._tee(self.tokens)):
+                count("stream_segments_total", kind=segment[0])
+                self._queue.put(segment)
+        except BaseException as e:
+            self._queue.put(e)
+        finally:
+            self.llm_time = time.perf_counter() - start
+            self._queue.put(_DONE)
+
+    def _tee(self, tokens):
+        for token in tokens:
+            self.parts.append(token)
+            if self.on_token is not None:
+                self.on_token(token)
+            yield token
+
+    def __iter__(self) -> Iterator[Segment]:
+        self._thread.start()
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+        self._thread.join()
+
+
+def stream_guide_to_audio(tokens: Iterable[str], path, on_token: Optional[Callable[[str], None]] = None,
+                          sample_rate: int = SAMPLE_RATE, **iter_audio_kwargs):
+    """Narrate a guide while it is being generated; returns (text, audio seconds, timings)
+
+    `tokens` is any iterable of text pieces, e.g. OllamaClient.stream_generate.
+    Keyword arguments are passed on to iter_audio (voice, speed, cache, ...).
+    """
+    producer = SegmentProducer(tokens, on_token)
+    start = time.perf_counter()
+    first_audio = []
+
+    def timed(blocks):
+        for block in blocks:
+            if not first_audio:
+                first_audio.append(time.perf_counter() - start)
+                observe("stream_first_audio_seconds", first_audio[0])
+            yield block
+
+    duration = write_audio(timed(iter_audio(producer, **iter_audio_kwargs)), path, sample_rate=sample_rate)
+    timings = {
+        "llm_time": producer.llm_time,
+        "first_audio": first_audio[0] if first_audio else None,
+        "total_time": time.perf_counter() - start,
+    }
+    return producer.text, duration, timings
+
+
+def format_timings(timings) -> str:
+    first_audio = timings["first_audio"]
+    first_text = f"{first_audio:.2f}s" if first_audio is not None else "n/a"
+    return (f"LLM {timings['llm_time']:.2f}s, first audio after {first_text}, "
+            f"total {timings['total_time']:.2f}s")
+
+
+def stub_tokens(text: str, token_delay: float) -> Iterator[str]:
+    """The text in small word pieces, one every token_delay seconds, like a streaming LLM"""
+    for word in text.split(" "):
+        time.sleep(token_delay)
+        yield word + " "
+
+
+def stub_synthesize(texto, voice=None, speed=None, lang_code=None, seconds_per_char=0.002):
+    """Stand-in for synthesize_segment: sleeps in proportion to the text, returns a tone"""
+    time.sleep(len(texto) * seconds_per_char)
+    t = np.arange(int(SAMPLE_RATE * len(texto) * 0.05), dtype=np.float32) / SAMPLE_RATE
+    return (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sequential and streamed narration with a stub LLM and TTS")
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--output", default="stream_demo.wav")
+    args = parser.parse_args()
+
+    section = ("Lleva la atención a la respiración y observa cómo el aire entra y sale "
+               "del cuerpo sin intentar cambiar nada. [Pausa 1 segundos] ")
+    guide = section * args.sections
+
+    start = time.perf_counter()
+    sequential_text = "".join(stub_tokens(guide, args.token_delay))
+    llm_only = time.perf_counter() - start
+    write_audio(iter_audio(parse_guide(sequential_text), synthesize=stub_synthesize), args.output)
+    sequential = time.perf_counter() - start
+    print(f"Sequential: LLM {llm_only:.2f}s, then TTS {sequential - llm_only:.2f}s, total {sequential:.2f}s")
+
+    text, duration, timings = stream_guide_to_audio(stub_tokens(guide, args.token_delay), args.output,
+                                                    synthesize=stub_synthesize)
+    assert text == sequential_text
+    print(f"Streaming:  {format_timings(timings)} ({duration:.1f}s of audio in {args.output})")
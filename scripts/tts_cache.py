@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+TTS Segment Cache
+
+Content-addressed on-disk cache of rendered narration segments.
+
+Each segment is stored as <sha256>.npy, keyed by the normalized text, lang_code,
+voice, speed and Kokoro version, as compact PCM16 (or float16) samples.
+The cache is bounded in bytes; when it grows past the limit the least recently
+used segments (by file mtime, refreshed on every hit) are removed.
+"""
+
+import hashlib
+import os
+import threading
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+CACHE_DIR = "../data/cache/tts"
+MAX_CACHE_BYTES = 2 * 1024 ** 3  # 2 GB
+EVICT_TO_FRACTION = 0.9  # Evict down to this share of MAX_CACHE_BYTES
+STORAGE_DTYPES = ("pcm16", "float16")
+
+
+def normalize_text(texto: str) -> str:
+    """Unicode- and whitespace-normalized text; differences here do not change the audio"""
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+
+def kokoro_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("kokoro")
+    except Exception:
+        return "unknown"
+
+
+class SegmentCache:
+    """Size-bounded LRU cache of synthesised segments"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, storage="pcm16", model_version=None):
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"storage must be one of {STORAGE_DTYPES}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.storage = storage
+        self.model_version = model_version or kokoro_version()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self.cache_dir.glob("*.npy"))
+
+    def key(self, texto: str, lang_code: str, voice: str, speed: float) -> str:
+        raw = "\x1f".join([normalize_text(texto), lang_code, voice, repr(float(speed)),
+                           self.model_version, self.storage])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npy"
+
+    def get(self, key: str):
+        """Cached audio as float32, or None"""
+        path = self._path(key)
+        try:
+            stored = np.load(path)
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        if stored.dtype == np.int16:
+            return stored.astype(np.float32) / 32767.0
+        return stored.astype(np.float32)
+
+    def put(self, key: str, audio: np.ndarray):
+        audio = np.asarray(audio, dtype=np.float32)
+        if self.storage == "pcm16":
+            stored = (np.clip(audio, -1.0, 1.0) * 32767.0).round().astype(np.int16)
+        else:
+            stored = audio.astype(np.float16)
+
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, "wb") as f:
+            np.save(f, stored)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += path.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used segments until the cache is under the target size"""
+        target = self.max_bytes * EVICT_TO_FRACTION
+        entries = []
+        for f in self.cache_dir.glob("*.npy"):
+            try:
+                stat = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, f))
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries, key=lambda entry: entry[0]):
+            if self._size <= target:
+                break
+            try:
+                f.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
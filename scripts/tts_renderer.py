@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+TTS Renderer
+
+Turns an LLM meditation guide into narrated audio:
+1. Splits the guide into narration segments and [Pausa X segundos] pauses
+2. Synthesises segments with Kokoro in a worker pool, a few segments ahead of playback
+3. Yields audio blocks strictly in guide order, as soon as each one is ready
+4. Streams them to disk through a soundfile write handle; pauses are written
+   from one shared block of zeros instead of allocating a new array each time
+
+Peak memory is bounded by the segments in flight, not by the length of the guide.
+Segments already rendered can be served from a SegmentCache (tts_cache.py).
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from instrumentation import count, observe, span
+
+SAMPLE_RATE = 24000
+LANG_CODE = 'e'
+VOICE = "em_alex"
+SPEED = 0.7
+MAX_WORKERS = 2  # Segments synthesised in parallel
+MAX_IN_FLIGHT = 4  # Segments synthesised ahead of the one being written
+SILENCE_BLOCK_SECONDS = 1
+
+# Patrón para detectar [Pausa X segundos]
+PAUSE_PATTERN = re.compile(r"\[Pausa (\d+) segundos\]")
+
+_SILENCE = np.zeros(SAMPLE_RATE * SILENCE_BLOCK_SECONDS, dtype=np.float32)
+_local = threading.local()
+
+Segment = Tuple[str, object]  # ("speech", text) or ("pause", seconds)
+
+
+def parse_guide(texto: str) -> List[Segment]:
+    """Split a guide into ("speech", text) and ("pause", seconds) segments, in order"""
+    segments = []
+    for i, part in enumerate(PAUSE_PATTERN.split(texto)):
+        if i % 2 == 0:
+            part = part.strip()
+            if part:
+                segments.append(("speech", part))
+        else:
+            segments.append(("pause", int(part)))
+    return segments
+
+
+def silence_blocks(seconds: float, sample_rate: int = SAMPLE_RATE) -> Iterator[np.ndarray]:
+    """Yield views of the shared zero block adding up to `seconds` of silence"""
+    remaining = int(sample_rate * seconds)
+    while remaining > 0:
+        block = _SILENCE[:min(remaining, len(_SILENCE))]
+        remaining -= len(block)
+        yield block
+
+
+def synthesize_segment(texto: str, voice: str = VOICE, speed: float = SPEED,
+                       lang_code: str = LANG_CODE) -> np.ndarray:
+    """Synthesise one narration segment with a pipeline owned by the calling worker"""
+    pipeline = getattr(_local, "pipeline", None)
+    if pipeline is None or _local.lang_code != lang_code:
+        from kokoro import KPipeline
+        with span("tts_model_load"):
+            pipeline = KPipeline(lang_code=lang_code)
+        _local.pipeline, _local.lang_code = pipeline, lang_code
+    with span("tts_segment"):
+        pieces = [np.asarray(audio, dtype=np.float32) for _, _, audio in pipeline(texto, voice=voice, speed=speed)]
+    return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+
+
+def iter_audio(segments: Iterable[Segment], voice: str = VOICE, speed: float = SPEED,
+               lang_code: str = LANG_CODE, max_workers: int = MAX_WORKERS,
+               max_in_flight: int = MAX_IN_FLIGHT, use_processes: bool = False,
+               synthesize=synthesize_segment, cache=None) -> Iterator[np.ndarray]:
+    """Yield the guide's audio block by block, in order
+
+    `segments` is consumed lazily, so it may be a generator that is still
+    being produced (e.g. by a streaming LLM). Threads share the process (torch
+    releases the GIL during inference); use_processes=True gives every worker
+    its own interpreter at the cost of one model copy per process.
+
+    With a SegmentCache (tts_cache.py), segments rendered before are read from
+    disk instead of being synthesised, and new ones are added to it.
+    """
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    pending = deque()
+    segments = iter(segments)
+    exhausted = False
+
+    with executor_class(max_workers=max_workers) as pool:
+        while True:
+            # Keep up to max_in_flight segments queued ahead of the writer
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    kind, value = next(segments)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if kind == "speech":
+                    key = cache.key(value, lang_code, voice, speed) if cache is not None else None
+                    audio = cache.get(key) if key is not None else None
+                    if audio is not None:
+                        count("tts_cache_hits_total")
+                        kind, value = "audio", audio
+                    else:
+                        value = (pool.submit(synthesize, value, voice, speed, lang_code), key)
+                pending.append((kind, value))
+
+            if not pending:
+                break
+            kind, value = pending.popleft()
+            if kind == "speech":
+                future, key = value
+                audio = future.result()
+                if key is not None:
+                    cache.put(key, audio)
+                yield audio
+            elif kind == "audio":
+                yield value
+            else:
+                yield from silence_blocks(value)
+
+
+def write_audio(blocks: Iterable[np.ndarray], path, sample_rate: int = SAMPLE_RATE, **sf_kwargs) -> float:
+    """Write audio blocks to `path` as they arrive; returns the duration in seconds"""
+    frames = 0
+    write_time = 0.0  # Time spent in the writes themselves, not waiting for blocks
+    with sf.SoundFile(path, 'w', samplerate=sample_rate, channels=1, **sf_kwargs) as out:
+        for block in blocks:
+            start = time.perf_counter()
+            out.write(block)
+            write_time += time.perf_counter() - start
+            frames += len(block)
+    observe("wav_write_seconds", write_time)
+    count("audio_seconds_written_total", frames / sample_rate)
+    return frames / sample_rate
+
+
+def render_guide(texto: str, path, **kwargs) -> float:
+    """Render a complete guide to an audio file; returns the duration in seconds"""
+    return write_audio(iter_audio(parse_guide(texto), **kwargs), path)
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Vector Store
+
+One interface for every place the project keeps vectors:
+1. VectorStore: bulk add, delete by id, top-k search, iteration and persistence
+   over (id, vector, text, metadata) rows
+2. LocalVectorStore: the embedded default, backed by the packed embedding store
+   (embedding_store.py) that rag_system.py reads; no server needed
+3. QdrantVectorStore and ChromaVectorStore: adapters for an existing Qdrant
+   collection or Chroma DB (qdrant-client / chromadb are only imported when used)
+4. migrate: bulk copy from one store to another
+
+Stores are named by a spec:
+    local:<directory>
+    qdrant:<collection>[@host:port]
+    chroma:<directory>[#collection]   (LangChain's default collection is "langchain")
+
+    python vector_store.py migrate qdrant:buddhist_texts_mn local:../data/embeddings/tripitaka/mn
+    python vector_store.py migrate "chroma:C:\\...\\Base de datos vectorial" "local:C:\\...\\Almacen vectorial"
+    python vector_store.py info local:../data/embeddings/tripitaka/mn
+"""
+
+import argparse
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Sequence
+
+import numpy as np
+
+from ann_index import DEFAULT_NPROBE, build_index, exact_search, index_path, load_index
+from embedding_store import EmbeddingStoreWriter, open_embedding_store, store_exists
+from lexical_index import INDEX_DIR as LEXICAL_DIR, build_lexical_index
+from quantization import HEADER_FILE as QUANTIZED_HEADER, KINDS as QUANTIZED_KINDS, build_quantized
+from sharded_index import merge_top_k
+
+ID_FIELD = "point_id"  # Metadata column holding the row id in the packed store
+PERSIST_BATCH_ROWS = 8192  # Rows copied at once when a local store is rewritten
+MIGRATE_BATCH_SIZE = 1024  # Rows read and written per batch by migrate
+QDRANT_ID_NAMESPACE = uuid.UUID("6f1c8d2e-3b0a-5c47-9e21-7d4b8a90c3f5")  # Maps non-UUID ids to Qdrant ids
+
+
+class SearchHit(NamedTuple):
+    id: str
+    score: float
+    text: str
+    metadata: Dict
+
+
+class VectorStore(ABC):
+    """Rows of (id, vector, text, metadata); ids are strings"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def add(self, ids: Sequence[str], vectors, texts: Sequence[str], metadata: Sequence[Dict]):
+        """Insert or replace rows in bulk"""
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]):
+        """Remove rows by id (unknown ids are ignored)"""
+
+    @abstractmethod
+    def search(self, query_vectors, top_k: int) -> List[List[SearchHit]]:
+        """Best top_k rows for every query vector, best first"""
+
+    @abstractmethod
+    def iter_batches(self, batch_size: int = MIGRATE_BATCH_SIZE) -> Iterator:
+        """Every row as (ids, vectors, texts, metadata) batches"""
+
+    @abstractmethod
+    def clear(self):
+        """Remove every row"""
+
+    def persist(self):
+        """Make the changes durable (a no-op for server-backed stores)"""
+
+    def close(self):
+        self.persist()
+
+
+class LocalVectorStore(VectorStore):
+    """File-backed store on top of a packed embedding store directory
+
+    Changes are kept in memory until persist(), which rewrites the packed
+    store (swapped in atomically) and rebuilds whichever of the IVF, lexical
+    and quantized indexes existed. Searches see unpersisted changes.
+    """
+
+    def __init__(self, path, dim=None):
+        self.path = Path(path)
+        self.dim = dim
+        self._pending = {}  # id -> (vector, text, metadata), not yet persisted
+        self._deleted = set()  # Rows of the persisted store
+        self._load()
+
+    def _load(self):
+        self._store, self._index, self._ids, self._rows = None, None, [], {}
+        if not store_exists(self.path):
+            return
+        self._store = open_embedding_store(self.path)
+        self.dim = self.dim or self._store.dim
+        if ID_FIELD in self._store.columns:
+            codes, values = self._store.codes(ID_FIELD)
+            self._ids = [values[code] for code in np.asarray(codes).tolist()]
+        else:
+            # Stores written before ids were stored: the row number is the id
+            self._ids = [str(row) for row in range(len(self._store))]
+        self._rows = {point_id: row for row, point_id in enumerate(self._ids)}
+        self._index = load_index(self.path, self._store.version)
+
+    @property
+    def version(self):
+        """Version of the persisted store (None if nothing has been persisted)"""
+        return self._store.version if self._store is not None else None
+
+    @property
+    def ids(self):
+        """Ids of the persisted rows, by row number"""
+        return self._ids
+
+    def __len__(self):
+        return len(self._ids) - len(self._deleted) + len(self._pending)
+
+    def add(self, ids, vectors, texts, metadata):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if not len(ids) == len(vectors) == len(texts) == len(metadata):
+            raise ValueError("ids, vectors, texts and metadata must have the same number of rows")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected dimension {self.dim}, got {vectors.shape[1]}")
+        for point_id, vector, text, meta in zip(ids, vectors, texts, metadata):
+            point_id = str(point_id)
+            if point_id in self._rows:
+                self._deleted.add(self._rows[point_id])
+            self._pending[point_id] = (vector, text, {k: v for k, v in meta.items() if k != ID_FIELD})
+
+    def delete(self, ids):
+        for point_id in map(str, ids):
+            self._pending.pop(point_id, None)
+            if point_id in self._rows:
+                self._deleted.add(self._rows[point_id])
+
+    def clear(self):
+        self._pending.clear()
+        self._deleted = set(range(len(self._ids)))
+
+    def get(self, ids):
+        """(vectors, texts, metadata) of the given ids, in order"""
+        vectors, texts, metadata = [], [], []
+        for point_id in map(str, ids):
+            if point_id in self._pending:
+                vector, text, meta = self._pending[point_id]
+            else:
+                row = self._rows.get(point_id)
+                if row is None or row in self._deleted:
+                    raise KeyError(point_id)
+                vector, text, meta = self._store.embeddings[row], self._store.texts[row], self._metadata(row)
+            vectors.append(np.asarray(vector, dtype=np.float32))
+            texts.append(text)
+            metadata.append(meta)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.dim or 0), texts, metadata
+
+    def rows(self, ids):
+        """Row numbers of persisted ids in the packed store (the ids its lexical index returns)"""
+        return [self._rows[point_id] for point_id in map(str, ids)]
+
+    def _metadata(self, row):
+        return {k: v for k, v in self._store.metadata[row].items() if k != ID_FIELD}
+
+    def search(self, query_vectors, top_k, nprobe=DEFAULT_NPROBE):
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        persisted = len(self._ids)
+        results = [[] for _ in query_vectors]
+        if persisted - len(self._deleted) > 0:
+            # Over-fetch by the number of deleted rows, which are dropped afterwards
+            depth = top_k + len(self._deleted)
+            if self._index is not None:
+                found = self._index.search(self._store.embeddings, query_vectors, depth, nprobe)
+            else:
+                found = exact_search(self._store.embeddings, query_vectors, depth)
+            for i, (scores, rows) in enumerate(found):
+                keep = np.asarray([row not in self._deleted for row in rows.tolist()], dtype=bool)
+                results[i].append((scores[keep][:top_k], rows[keep][:top_k]))
+        pending_ids = list(self._pending)
+        if pending_ids:
+            # Unpersisted rows are scored exactly; their ids follow the persisted rows
+            vectors = np.stack([self._pending[point_id][0] for point_id in pending_ids])
+            for i, (scores, rows) in enumerate(exact_search(vectors, query_vectors, top_k)):
+                results[i].append((scores, rows + persisted))
+
+        hits = []
+        for parts in results:
+            scores, rows = merge_top_k(parts, top_k)
+            query_hits = []
+            for score, row in zip(scores.tolist(), rows.tolist()):
+                if row < persisted:
+                    query_hits.append(SearchHit(self._ids[row], score, self._store.texts[row], self._metadata(row)))
+                else:
+                    point_id = pending_ids[row - persisted]
+                    _, text, meta = self._pending[point_id]
+                    query_hits.append(SearchHit(point_id, score, text, meta))
+            hits.append(query_hits)
+        return hits
+
+    def iter_batches(self, batch_size=MIGRATE_BATCH_SIZE):
+        for start in range(0, len(self._ids), batch_size):
+            rows = [row for row in range(start, min(start + batch_size, len(self._ids))) if row not in self._deleted]
+            if rows:
+                yield ([self._ids[row] for row in rows], np.asarray(self._store.embeddings[rows]),
+                       [self._store.texts[row] for row in rows], [self._metadata(row) for row in rows])
+        pending_ids = list(self._pending)
+        for start in range(0, len(pending_ids), batch_size):
+            batch = pending_ids[start:start + batch_size]
+            yield (batch, np.stack([self._pending[point_id][0] for point_id in batch]),
+                   [self._pending[point_id][1] for point_id in batch],
+                   [self._pending[point_id][2] for point_id in batch])
+
+    def persist(self):
+        if not self._pending and not self._deleted:
+            return
+        rebuild = {
+            "ivf": index_path(self.path).exists(),
+            "lexical": (self.path / LEXICAL_DIR).exists(),
+            **{kind: (self.path / QUANTIZED_HEADER.format(kind=kind)).exists() for kind in QUANTIZED_KINDS},
+        }
+        writer = EmbeddingStoreWriter(self.path, self.dim)
+        try:
+            for ids, vectors, texts, metadata in self.iter_batches(PERSIST_BATCH_ROWS):
+                writer.add(vectors, texts, [{**meta, ID_FIELD: point_id} for point_id, meta in zip(ids, metadata)])
+        except Exception:
+            writer.abort()
+            raise
+        # Release the old store's memory maps before the directory is replaced
+        self._store = self._index = None
+        writer.close()
+        self._pending.clear()
+        self._deleted.clear()
+
+        if writer.rows:
+            if rebuild["ivf"]:
+                build_index(self.path)
+            if rebuild["lexical"]:
+                build_lexical_index(self.path)
+            for kind in QUANTIZED_KINDS:
+                if rebuild[kind]:
+                    build_quantized(self.path, kind)
+        self._load()
+
+
+def qdrant_point_id(point_id: str) -> str:
+    """Qdrant only accepts UUIDs (or integers) as ids"""
+    try:
+        return str(uuid.UUID(str(point_id)))
+    except ValueError:
+        return str(uuid.uuid5(QDRANT_ID_NAMESPACE, str(point_id)))
+
+
+class QdrantVectorStore(VectorStore):
+    """A Qdrant collection; the text and the original id are kept in the payload"""
+
+    def __init__(self, collection, dim=None, host="localhost", port=6333, client=None):
+        from qdrant_client import QdrantClient
+
+        self.collection = collection
+        self.dim = dim
+        self.client = client or QdrantClient(host=host, port=port)
+        if dim is not None:
+            self._ensure_collection(dim)
+
+    def _ensure_collection(self, dim):
+        from qdrant_client.models import Distance, VectorParams
+
+        existing = [collection.name for collection in self.client.get_collections().collections]
+        if self.collection not in existing:
+            self.client.create_collection(collection_name=self.collection,
+                                          vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+            print(f"Created collection '{self.collection}' with vector size {dim}")
+        self.dim = dim
+
+    def __len__(self):
+        return self.client.count(collection_name=self.collection).count
+
+    def add(self, ids, vectors, texts, metadata):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.dim is None:
+            self._ensure_collection(vectors.shape[1])
+        # upload_collection takes the numpy matrix directly (no per-point tolist())
+        self.client.upload_collection(
+            collection_name=self.collection,
+            vectors=vectors,
+            payload=[{"text": text, **meta, ID_FIELD: str(point_id)}
+                     for point_id, text, meta in zip(ids, texts, metadata)],
+            ids=[qdrant_point_id(point_id) for point_id in ids],
+            batch_size=MIGRATE_BATCH_SIZE,
+        )
+
+    def delete(self, ids):
+        from qdrant_client.models import PointIdsList
+
+        if len(ids):
+            self.client.delete(collection_name=self.collection,
+                               points_selector=PointIdsList(points=[qdrant_point_id(point_id) for point_id in ids]))
+
+    def clear(self):
+        self.client.delete_collection(collection_name=self.collection)
+        if self.dim is not None:
+            self._ensure_collection(self.dim)
+
+    @staticmethod
+    def _split_payload(point):
+        payload = dict(point.payload or {})
+        text = payload.pop("text", "")
+        return payload.pop(ID_FIELD, str(point.id)), text, payload
+
+    def search(self, query_vectors, top_k):
+        hits = []
+        for vector in np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)):
+            if hasattr(self.client, "query_points"):
+                points = self.client.query_points(collection_name=self.collection, query=vector.tolist(),
+                                                  limit=top_k, with_payload=True).points
+            else:
+                points = self.client.search(collection_name=self.collection, query_vector=vector.tolist(),
+                                            limit=top_k, with_payload=True)
+            query_hits = []
+            for point in points:
+                point_id, text, meta = self._split_payload(point)
+                query_hits.append(SearchHit(point_id, float(point.score), text, meta))
+            hits.append(query_hits)
+        return hits
+
+    def iter_batches(self, batch_size=MIGRATE_BATCH_SIZE):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(collection_name=self.collection, limit=batch_size, offset=offset,
+                                                with_payload=True, with_vectors=True)
+            if points:
+                ids, texts, metadata = zip(*(self._split_payload(point) for point in points))
+                yield list(ids), np.asarray([point.vector for point in points], dtype=np.float32), \
+                    list(texts), list(metadata)
+            if offset is None:
+                break
+
+
+def chroma_metadata(meta):
+    """Chroma accepts only str, int, float and bool values (and no None)"""
+    clean = {}
+    for key, value in meta.items():
+        if value is None:
+            continue
+        clean[key] = value if isinstance(value, (str, int, float, bool)) else json.dumps(value, ensure_ascii=False)
+    return clean
+
+
+class ChromaVectorStore(VectorStore):
+    """A collection of a persistent Chroma DB (e.g. one written by LangChain's Chroma)"""
+
+    def __init__(self, path, collection="langchain"):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=str(path))
+        self.name = collection
+        self.collection = self.client.get_or_create_collection(collection)
+        self.max_batch = getattr(self.client, "get_max_batch_size", lambda: MIGRATE_BATCH_SIZE)()
+
+    def __len__(self):
+        return self.collection.count()
+
+    def add(self, ids, vectors, texts, metadata):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        for start in range(0, len(ids), self.max_batch):
+            stop = start + self.max_batch
+            self.collection.upsert(ids=[str(point_id) for point_id in ids[start:stop]],
+                                   embeddings=vectors[start:stop].tolist(), documents=list(texts[start:stop]),
+                                   metadatas=[chroma_metadata(meta) for meta in metadata[start:stop]])
+
+    def delete(self, ids):
+        if len(ids):
+            self.collection.delete(ids=[str(point_id) for point_id in ids])
+
+    def clear(self):
+        self.client.delete_collection(self.name)
+        self.collection = self.client.get_or_create_collection(self.name)
+
+    def search(self, query_vectors, top_k):
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        result = self.collection.query(query_embeddings=query_vectors.tolist(), n_results=top_k,
+                                       include=["documents", "metadatas", "distances"])
+        # Higher is better: 1 - distance for cosine/ip spaces, the negated distance for l2
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        hits = []
+        for ids, texts, metadata, distances in zip(result["ids"], result["documents"], result["metadatas"],
+                                                   result["distances"]):
+            hits.append([SearchHit(point_id, (1 - distance) if space != "l2" else -distance, text, meta or {})
+                         for point_id, text, meta, distance in zip(ids, texts, metadata, distances)])
+        return hits
+
+    def iter_batches(self, batch_size=MIGRATE_BATCH_SIZE):
+        for offset in range(0, len(self), batch_size):
+            batch = self.collection.get(limit=batch_size, offset=offset,
+                                        include=["embeddings", "documents", "metadatas"])
+            if not batch["ids"]:
+                break
+            yield (list(batch["ids"]), np.asarray(batch["embeddings"], dtype=np.float32), list(batch["documents"]),
+                   [meta or {} for meta in batch["metadatas"]])
+
+
+def open_vector_store(spec: str, dim=None) -> VectorStore:
+    """Open a store from its spec: local:<dir>, qdrant:<collection>[@host:port] or chroma:<dir>[#collection]"""
+    kind, _, target = spec.partition(":")
+    if kind == "local":
+        return LocalVectorStore(target, dim)
+    if kind == "qdrant":
+        collection, _, address = target.partition("@")
+        host, _, port = (address or "localhost:6333").partition(":")
+        return QdrantVectorStore(collection, dim, host, int(port or 6333))
+    if kind == "chroma":
+        path, _, collection = target.partition("#")
+        return ChromaVectorStore(path, collection or "langchain")
+    raise ValueError(f"Unknown vector store '{spec}' (use local:<dir>, qdrant:<collection>[@host:port] "
+                     f"or chroma:<dir>[#collection])")
+
+
+def migrate(source: VectorStore, target: VectorStore, batch_size=MIGRATE_BATCH_SIZE, log=print) -> int:
+    """Copy every row of source into target in bulk; returns the number of rows copied"""
+    copied = 0
+    start = time.perf_counter()
+    for ids, vectors, texts, metadata in source.iter_batches(batch_size):
+        target.add(ids, vectors, texts, metadata)
+        copied += len(ids)
+        log(f"  {copied} rows copied ({copied / (time.perf_counter() - start):.0f} rows/s)")
+    target.persist()
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect vector stores or copy one into another")
+    parser.add_argument("command", choices=["migrate", "info"])
+    parser.add_argument("source", help="local:<dir>, qdrant:<collection>[@host:port] or chroma:<dir>[#collection]")
+    parser.add_argument("target", nargs="?", help="Store to copy into (migrate)")
+    parser.add_argument("--batch-size", type=int, default=MIGRATE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    source = open_vector_store(args.source)
+    if args.command == "info":
+        print(f"{args.source}: {len(source)} rows")
+    else:
+        if not args.target:
+            parser.error("migrate needs a target store")
+        target = open_vector_store(args.target)
+        print(f"Copying {len(source)} rows from {args.source} to {args.target}")
+        copied = migrate(source, target, args.batch_size)
+        print(f"✓ {copied} rows in {args.target} ({len(target)} in total)")
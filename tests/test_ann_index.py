@@ -0,0 +1,41 @@
+import numpy as np
+
+from ann_index import IVFIndex, exact_search, recall_at_k, sample_queries
+
+
+def test_exact_search_single_and_batched_agree():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((3000, 384)).astype(np.float32)
+    queries = rng.standard_normal((17, 384)).astype(np.float32)
+
+    batched = exact_search(embeddings, queries, 10)
+    for i, (scores, ids) in enumerate(batched):
+        single_scores, single_ids = exact_search(embeddings, queries[i], 10)[0]
+        np.testing.assert_array_equal(single_ids, ids)
+        np.testing.assert_allclose(single_scores, scores, rtol=1e-5, atol=1e-4)
+
+
+def test_exact_search_matches_a_full_sort():
+    rng = np.random.default_rng(1)
+    embeddings = rng.standard_normal((500, 32)).astype(np.float32)
+    query = rng.standard_normal(32).astype(np.float32)
+
+    scores, ids = exact_search(embeddings, query, 5, block_elements=64)[0]
+    expected = np.argsort(-(embeddings @ query))[:5]
+    np.testing.assert_array_equal(ids, expected)
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_ivf_recall_against_exact_search():
+    rng = np.random.default_rng(2)
+    centers = rng.standard_normal((20, 64)).astype(np.float32)
+    embeddings = centers[rng.integers(0, 20, 4000)] + 0.3 * rng.standard_normal((4000, 64)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    index = IVFIndex.build(embeddings, nlist=32)
+    queries = sample_queries(embeddings, 50)
+
+    report = {row["nprobe"]: row["recall"] for row in recall_at_k(embeddings, index, queries, 10, (1, 8, 32))}
+    assert report[8] >= 0.9
+    assert report[1] <= report[8] <= report[32]
+    # Probing every list scans every row, which is exact
+    assert report[32] == 1.0
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_mix import Ducker, MusicBed, write_variants
+
+RATE = 1000  # Small rate keeps the signals short; every length below is in samples at this rate
+
+
+def tone(frames, amplitude=0.5, period=20):
+    return (amplitude * np.sin(2 * np.pi * np.arange(frames) / period)).astype(np.float32)
+
+
+def test_music_loops_with_the_crossfade_period():
+    track = np.arange(1, 1001, dtype=np.float32)
+    bed = MusicBed(track, sample_rate=RATE, crossfade=0.1, block_frames=64)
+    music = bed.read(3700)
+
+    assert len(music) == 3700
+    # First pass up to the crossfade, then one crossfade + body every len - crossfade samples
+    np.testing.assert_array_equal(music[:900], track[:900])
+    for start in (900, 1800, 2700):
+        seam = music[start:start + 100]
+        assert np.all((seam > track[:100].min()) & (seam < track[-100:].max()))
+        np.testing.assert_array_equal(music[start + 100:start + 900], track[100:900])
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 333, 1000])
+def test_music_does_not_depend_on_the_read_size(read_size):
+    track = tone(700, period=37)
+    expected = MusicBed(track, sample_rate=RATE, crossfade=0.05).read(5000)
+    bed = MusicBed(track, sample_rate=RATE, crossfade=0.05, block_frames=64)
+    music = np.concatenate([bed.read(read_size) for _ in range(-(-5000 // read_size))])[:5000]
+    np.testing.assert_array_equal(music, expected)
+
+
+def test_crossfade_keeps_constant_power():
+    bed = MusicBed(np.ones(1000, dtype=np.float32), sample_rate=RATE, crossfade=0.2)
+    np.testing.assert_allclose(bed._fade_out ** 2 + bed._fade_in ** 2, 1.0, rtol=1e-6)
+
+
+def test_music_ducks_under_speech_and_recovers_after_the_hold():
+    ducker = Ducker(gain=0.2, depth=0.25, threshold=0.02, window_seconds=0.05, hold_seconds=0.2, sample_rate=RATE)
+    voice = np.concatenate([np.zeros(500), tone(1000), np.zeros(1000)]).astype(np.float32)
+    gains = np.concatenate([ducker(block) for block in np.split(voice, 5)])
+
+    assert len(gains) == len(voice)
+    np.testing.assert_allclose(gains[:400], 0.2)  # Silence before speech
+    np.testing.assert_allclose(gains[600:1500], 0.05)  # Speech
+    np.testing.assert_allclose(gains[1500:1650], 0.05)  # Held through a short pause
+    np.testing.assert_allclose(gains[1800:], 0.2)  # Recovered
+    assert np.all((gains >= 0.05 - 1e-6) & (gains <= 0.2 + 1e-6))
+
+
+def test_variants_have_the_narration_length(tmp_path):
+    voice = np.concatenate([tone(800), np.zeros(700)]).astype(np.float32)
+    outputs = {tmp_path / "mute.wav": False, tmp_path / "con_musica.wav": True}
+    duration = write_variants(np.split(voice, 3), outputs, music=tone(600, 0.8, 50), sample_rate=RATE)
+
+    assert duration == pytest.approx(1.5)
+    mute, rate = sf.read(tmp_path / "mute.wav", dtype="float32")
+    mixed, _ = sf.read(tmp_path / "con_musica.wav", dtype="float32")
+    assert rate == RATE and len(mute) == len(mixed) == len(voice)
+    np.testing.assert_allclose(mute, voice, atol=1e-4)
+    # The music is ducked under the voice and louder once it stops
+    music = mixed - mute
+    assert np.abs(music[200:700]).max() < np.abs(music[1200:]).max()
@@ -0,0 +1,106 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from audio_server import make_server, parse_range
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+NAME = "meditacion_kokoro_5_principiante_mute.opus"
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / NAME).write_bytes(CONTENT)
+    (tmp_path / "notes.txt").write_text("not audio", encoding="utf-8")
+    server = make_server(tmp_path, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, headers=None, method="GET"):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=900-5000", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    assert parse_range("bytes=1000-", 1000) is None
+    assert parse_range("bytes=-0", 1000) is None
+    for header in ["items=0-1", "bytes=0-1,5-6", "bytes=5-1", "bytes=a-b"]:
+        with pytest.raises(ValueError):
+            parse_range(header, 1000)
+
+
+def test_full_and_partial_responses(server):
+    response, body = get(server, f"/data/audio/{NAME}")
+    assert response.status == 200 and body == CONTENT
+    assert response.getheader("Accept-Ranges") == "bytes"
+    assert response.getheader("Content-Type") == "audio/ogg; codecs=opus"
+
+    response, body = get(server, f"/data/audio/{NAME}", {"Range": "bytes=100-199"})
+    assert response.status == 206 and body == CONTENT[100:200]
+    assert response.getheader("Content-Range") == f"bytes 100-199/{len(CONTENT)}"
+    assert response.getheader("Content-Length") == "100"
+
+    response, body = get(server, f"/data/audio/{NAME}", {"Range": "bytes=-10"})
+    assert response.status == 206 and body == CONTENT[-10:]
+
+    # Unparseable ranges are ignored: the whole file is sent
+    response, body = get(server, f"/data/audio/{NAME}", {"Range": "bytes=0-1,5-6"})
+    assert response.status == 200 and body == CONTENT
+
+
+def test_unsatisfiable_range_is_416(server):
+    response, body = get(server, f"/data/audio/{NAME}", {"Range": f"bytes={len(CONTENT)}-"})
+    assert response.status == 416 and body == b""
+    assert response.getheader("Content-Range") == f"bytes */{len(CONTENT)}"
+
+
+def test_etag_revalidation_and_if_range(server):
+    response, _ = get(server, f"/data/audio/{NAME}", method="HEAD")
+    etag = response.getheader("ETag")
+    assert etag and response.getheader("Last-Modified")
+
+    response, body = get(server, f"/data/audio/{NAME}", {"If-None-Match": etag})
+    assert response.status == 304 and body == b""
+    assert response.getheader("ETag") == etag
+    response, _ = get(server, f"/data/audio/{NAME}", {"If-None-Match": '"stale"'})
+    assert response.status == 200
+
+    response, body = get(server, f"/data/audio/{NAME}", {"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status == 206 and body == CONTENT[:10]
+    # The client's copy is another version of the file: send it whole
+    response, body = get(server, f"/data/audio/{NAME}", {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status == 200 and body == CONTENT
+
+
+def test_catalogue_lists_only_catalogue_audio(server):
+    response, body = get(server, "/api/catalogue")
+    assert response.status == 200
+    catalogue = json.loads(body)
+    assert [(v["duration"], v["level"], v["music"]) for v in catalogue["variants"]] == [(5, "principiante", "mute")]
+    assert catalogue["variants"][0]["files"][0]["url"] == f"/data/audio/{NAME}"
+
+    etag = response.getheader("ETag")
+    response, _ = get(server, "/api/catalogue", {"If-None-Match": etag})
+    assert response.status == 304
+
+
+def test_paths_outside_the_audio_directory_are_404(server):
+    for path in ["/data/audio/../../etc/passwd", "/data/audio/%2e%2e/secret", "/data/audio/missing.wav"]:
+        response, _ = get(server, path)
+        assert response.status == 404
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from build_catalogue import FILENAME_TEMPLATE, OUTPUT_EXTENSIONS, load_matrix, pending_guides
+
+MATRIX = {"durations": [5, 10], "levels": ["principiante"], "music": ["con_musica", "mute"]}
+
+
+def touch(output_dir, duracion, nivel, musica, extensions=OUTPUT_EXTENSIONS):
+    path = output_dir / FILENAME_TEMPLATE.format(duracion=duracion, nivel=nivel, musica=musica)
+    for extension in extensions:
+        path.with_suffix(extension).write_bytes(b"")
+
+
+def test_everything_is_missing_in_an_empty_directory(tmp_path):
+    guides = pending_guides(MATRIX, tmp_path)
+    assert sorted(guide.name for guide in guides) == ["10_principiante", "5_principiante"]
+    for guide in guides:
+        assert sorted(guide.variants) == ["con_musica", "mute"]
+        assert all(len(paths) == len(OUTPUT_EXTENSIONS) for paths in guide.variants.values())
+
+
+def test_only_missing_variants_and_formats_are_pending(tmp_path):
+    touch(tmp_path, 5, "principiante", "con_musica")
+    touch(tmp_path, 5, "principiante", "mute")
+    touch(tmp_path, 10, "principiante", "mute")
+    touch(tmp_path, 10, "principiante", "con_musica", extensions=OUTPUT_EXTENSIONS[:1])
+
+    guides = pending_guides(MATRIX, tmp_path)
+    assert [guide.name for guide in guides] == ["10_principiante"]
+    expected = tmp_path / FILENAME_TEMPLATE.format(duracion=10, nivel="principiante", musica="con_musica")
+    assert guides[0].variants == {"con_musica": [expected.with_suffix(ext) for ext in OUTPUT_EXTENSIONS[1:]]}
+
+
+def test_complete_catalogue_has_nothing_pending(tmp_path):
+    for duracion in MATRIX["durations"]:
+        for musica in MATRIX["music"]:
+            touch(tmp_path, duracion, "principiante", musica)
+    assert pending_guides(MATRIX, tmp_path) == []
+
+
+def test_unknown_music_option_is_rejected(tmp_path):
+    path = tmp_path / "matrix.json"
+    path.write_text(json.dumps({"music": ["con_musica", "lluvia"]}), encoding="utf-8")
+    with pytest.raises(ValueError, match="lluvia"):
+        load_matrix(path)
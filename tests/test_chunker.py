@@ -0,0 +1,63 @@
+import re
+
+import numpy as np
+import pytest
+
+from generate_embeddings import iter_chunks, split_text_into_chunks
+
+
+def legacy_split_text_into_chunks(text, max_length, overlap):
+    """The splitter iter_chunks replaced, kept as the reference for the character mode"""
+    text = re.sub(r'\s+', ' ', text).strip()
+    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        if len(current_chunk + " " + sentence) > max_length and current_chunk:
+            chunks.append(current_chunk.strip())
+            words = current_chunk.split()
+            overlap_words = words[-overlap:] if len(words) > overlap else words
+            current_chunk = " ".join(overlap_words) + " " + sentence
+        else:
+            current_chunk += " " + sentence if current_chunk else sentence
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def random_text(seed, sentences=200):
+    rng = np.random.default_rng(seed)
+    words = ["bhikkhu", "sati", "jhāna", "the", "mind", "is", "calm", "breathing", "in", "out", "satipaṭṭhāna"]
+    text = []
+    for _ in range(sentences):
+        sentence = " ".join(rng.choice(words, rng.integers(1, 30)))
+        text.append(sentence + rng.choice([".", "!", "?", "...", ".\n\n", "  "]))
+    return " ".join(text)
+
+
+class PieceTokenizer:
+    """Splits every word into word-pieces of up to three characters"""
+
+    def __call__(self, words, add_special_tokens=False):
+        return {"input_ids": [list(range(-(-len(word) // 3))) for word in words]}
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_length, overlap", [(100, 5), (512, 50), (40, 10)])
+def test_character_mode_matches_the_legacy_splitter(seed, max_length, overlap):
+    text = random_text(seed)
+    assert split_text_into_chunks(text, max_length, overlap) == legacy_split_text_into_chunks(text, max_length,
+                                                                                             overlap)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_token_mode_respects_the_budget_and_the_source_spans(seed):
+    text = random_text(seed)
+    chunks = list(iter_chunks(text, 32, 8, PieceTokenizer()))
+    assert chunks
+    for chunk in chunks:
+        assert chunk.length <= 32
+        assert chunk.text == " ".join(re.sub(r"[.!?]", " ", text[chunk.start_char:chunk.end_char]).split())
+    # Long sentences are split rather than truncated: every word is in some chunk
+    for word in re.finditer(r"[^\s.!?]+", text):
+        assert any(c.start_char <= word.start() and word.end() <= c.end_char for c in chunks)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from context_builder import build_context, estimate_tokens, merge_passages, mmr_order
+
+
+def overlapping_chunks(text, size, step, filename="mn.10.than.txt"):
+    """(text, metadata) chunks cut every `step` characters, so neighbours overlap"""
+    chunks = []
+    for start in range(0, len(text) - size + 1, step):
+        meta = {"filename": filename, "start_char": start, "end_char": start + size}
+        chunks.append((text[start:start + size], meta))
+    return chunks
+
+
+@pytest.mark.parametrize("budget", [0, 5, 40, 120, 400, 10000])
+def test_context_never_exceeds_the_token_budget(budget):
+    rng = np.random.default_rng(0)
+    words = rng.choice(["sati", "jhāna", "breath", "body", "calm", "mind", "the", "feeling"], 600)
+    source = " ".join(words)
+    chunks = overlapping_chunks(source, 200, 150) + overlapping_chunks(source, 120, 100, "dn.22.than.txt")
+    vectors = rng.standard_normal((len(chunks), 16)).astype(np.float32)
+
+    context, _, report = build_context(vectors[0], chunks, vectors, token_budget=budget)
+    assert estimate_tokens(context) <= budget
+    assert report["context_tokens"] <= report["token_budget"] == budget
+    if budget >= estimate_tokens(chunks[0][0]):
+        assert report["selected_chunks"] > 0
+
+
+def test_mmr_puts_near_duplicates_after_distinct_chunks():
+    query = np.array([1.0, 0.0, 0.0])
+    vectors = np.array([
+        [0.9, 0.1, 0.0],
+        [0.9, 0.1, 0.001],  # Near-duplicate of the best chunk
+        [0.7, 0.0, 0.7],
+    ])
+    assert mmr_order(query, vectors, lambda_=1.0) == [0, 1, 2]
+    assert mmr_order(query, vectors, lambda_=0.5) == [0, 2, 1]
+    assert mmr_order(query, vectors, k=1) == [0]
+
+
+def test_overlapping_chunks_merge_into_one_passage():
+    source = " ".join(f"w{i}" for i in range(100))
+    chunks = overlapping_chunks(source, 60, 40)
+    passages = merge_passages(chunks, list(range(len(chunks))), read_source=lambda filename: source)
+    assert len(passages) == 1
+    assert passages[0].text == source[:passages[0].end_char]
+    assert sorted(passages[0].chunks) == list(range(len(chunks)))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from encoder_backend import Encoder
+
+
+class FakeModel:
+    """Words are tokens; the embedding of a text is (word count, batch size) and every call is recorded"""
+
+    max_seq_length = 50
+
+    def __init__(self):
+        self.calls = []
+
+    def tokenizer(self, texts, add_special_tokens=True, truncation=True, max_length=None):
+        return {"input_ids": [list(range(min(len(text.split()) + 2, max_length))) for text in texts]}
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        self.calls.append(list(texts))
+        return np.asarray([[len(text.split()), len(texts)] for text in texts], dtype=np.float32)
+
+
+def texts(seed, n=200):
+    rng = np.random.default_rng(seed)
+    return [" ".join(["sati"] * int(length)) for length in rng.integers(1, 80, n)]
+
+
+@pytest.mark.parametrize("tokens_per_batch, max_batch_size", [(256, 16), (1000, 128), (52, 4)])
+def test_batches_respect_the_padded_token_budget(tokens_per_batch, max_batch_size):
+    encoder = Encoder(FakeModel(), tokens_per_batch=tokens_per_batch, max_batch_size=max_batch_size)
+    lengths = encoder.token_lengths(texts(0))
+    batches = encoder.batches(lengths)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= max_batch_size
+        # A single input longer than the budget still gets a batch of its own
+        assert len(batch) == 1 or len(batch) * lengths[batch].max() <= tokens_per_batch
+
+
+def test_encode_returns_vectors_in_input_order():
+    model = FakeModel()
+    encoder = Encoder(model, tokens_per_batch=256)
+    inputs = texts(1)
+    vectors = encoder.encode(inputs)
+
+    np.testing.assert_array_equal(vectors[:, 0], [len(text.split()) for text in inputs])
+    assert len(model.calls) > 1
+    # Every text went through the model exactly once
+    assert sorted(text for call in model.calls for text in call) == sorted(inputs)
+    assert encoder.encode("sati sati").tolist() == [2.0, 1.0]
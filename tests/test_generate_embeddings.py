@@ -0,0 +1,86 @@
+import zlib
+
+import numpy as np
+import pytest
+
+import generate_embeddings
+from embedding_store import open_embedding_store
+from vector_store import ID_FIELD
+
+
+class FakeModel:
+    """Deterministic vectors from the chunk text; every encode call is recorded"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        self.calls.append(list(texts))
+        return np.stack([vector_of(text) for text in texts])
+
+
+def vector_of(text):
+    return np.random.default_rng(zlib.crc32(text.encode())).standard_normal(8).astype(np.float32)
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    """Five small mn texts, chunked by characters into a store under tmp_path"""
+    texts_dir = tmp_path / "texts" / "mn"
+    texts_dir.mkdir(parents=True)
+    for i in range(1, 6):
+        sentences = [f"Sutta {i} sentence {j} about sati and the breath." for j in range(12 * i)]
+        (texts_dir / f"mn.{i}.than.txt").write_text(" ".join(sentences), encoding="utf-8")
+    monkeypatch.setattr(generate_embeddings, "TEXTS_ROOT", str(tmp_path / "texts"))
+    monkeypatch.setattr(generate_embeddings, "STORE_ROOT", str(tmp_path / "store"))
+    monkeypatch.setattr(generate_embeddings, "MANIFEST_TEMPLATE",
+                        str(tmp_path / "store" / "{collection}_manifest.json"))
+    monkeypatch.setattr(generate_embeddings, "CHUNK_UNIT", "chars")
+    monkeypatch.setattr(generate_embeddings, "CHUNK_SIZE", 300)
+    monkeypatch.setattr(generate_embeddings, "ENCODE_BATCH_SIZE", 16)
+    monkeypatch.setattr(generate_embeddings, "BUILD_LEXICAL_INDEX", False)
+    monkeypatch.setattr(generate_embeddings, "BUILD_QUANTIZED", ())
+    return texts_dir, tmp_path / "store" / "mn"
+
+
+def test_pipeline_stores_every_chunk_with_its_vector(collection):
+    texts_dir, store_dir = collection
+    model = FakeModel()
+    generate_embeddings.process_text_files(collection="mn", model=model)
+
+    store = open_embedding_store(store_dir)
+    expected = {}
+    for path in sorted(texts_dir.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        expected[path.name] = generate_embeddings.split_text_into_chunks(text, 300, generate_embeddings.CHUNK_OVERLAP)
+    assert len(store) == sum(len(chunks) for chunks in expected.values())
+    for row in range(len(store)):
+        meta = store.metadata[row]
+        assert store.texts[row] == expected[meta["filename"]][meta["chunk_id"]]
+        np.testing.assert_array_equal(store.embeddings[row], vector_of(store.texts[row]))
+        assert meta[ID_FIELD] == generate_embeddings.point_id(meta["filename"], meta["chunk_id"])
+
+    # Batches are filled across file boundaries: only the last one may be short
+    assert all(len(call) == 16 for call in model.calls[:-1])
+    assert sum(len(call) for call in model.calls) == len(store)
+
+
+def test_rerun_only_encodes_changed_chunks(collection):
+    texts_dir, store_dir = collection
+    generate_embeddings.process_text_files(collection="mn", model=FakeModel())
+    version = open_embedding_store(store_dir).version
+
+    model = FakeModel()
+    generate_embeddings.process_text_files(collection="mn", model=model)
+    assert model.calls == []
+    assert open_embedding_store(store_dir).version == version
+
+    path = texts_dir / "mn.2.than.txt"
+    path.write_text(path.read_text(encoding="utf-8") + " One more sentence about calm.", encoding="utf-8")
+    generate_embeddings.process_text_files(collection="mn", model=model)
+    encoded = [text for call in model.calls for text in call]
+    assert encoded and all(text in open_embedding_store(store_dir).texts for text in encoded)
+    assert len(encoded) <= 2
@@ -0,0 +1,16 @@
+import instrumentation
+
+
+def test_prometheus_label_values_are_escaped():
+    instrumentation.enable()
+    try:
+        instrumentation.reset()
+        instrumentation.count("queries_total", mode='mn={"translator": "than"}\\x\ny')
+        text = instrumentation.prometheus_text()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    lines = [line for line in text.splitlines() if "queries_total{" in line]
+    assert lines == [f'{instrumentation.METRIC_PREFIX}queries_total'
+                     '{mode="mn={\\"translator\\": \\"than\\"}\\\\x\\ny"} 1']
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from lexical_index import LexicalIndex, fold, reciprocal_rank_fusion, tokenize
+
+WORDS = ["satipaṭṭhāna", "jhāna", "sati", "breath", "body", "the", "of", "mind", "calm", "nibbāna",
+         "dukkha", "anatta", "metta", "karuṇā", "samādhi"]
+
+
+def random_corpus(seed, docs=2000):
+    rng = np.random.default_rng(seed)
+    # Zipf-like frequencies, so some terms are common and some rare
+    weights = 1 / np.arange(1, len(WORDS) + 1)
+    return [" ".join(rng.choice(WORDS, rng.integers(5, 60), p=weights / weights.sum())) for _ in range(docs)]
+
+
+def exhaustive_bm25(index, query, rows=None):
+    """Score of every chunk, adding every posting of every query term"""
+    scores = np.zeros(index.num_docs)
+    for term_id in {index.vocabulary[t] for t in tokenize(query) if t in index.vocabulary}:
+        docs, impacts = index.postings(term_id)
+        scores[docs] += impacts
+    candidates = np.flatnonzero(scores > 0) if rows is None else rows[scores[rows] > 0]
+    return candidates, scores
+
+
+def assert_same_top_k(index, query, top_k, rows=None):
+    scores, ids = index.search(query, top_k, rows)
+    candidates, all_scores = exhaustive_bm25(index, query, rows)
+    expected = np.sort(all_scores[candidates])[::-1][:top_k]
+    np.testing.assert_allclose(scores, expected, rtol=1e-5)
+    np.testing.assert_allclose(all_scores[ids], scores, rtol=1e-5)
+    if rows is not None:
+        assert set(ids.tolist()) <= set(rows.tolist())
+
+
+@pytest.mark.parametrize("top_k", [1, 10, 100])
+def test_maxscore_matches_exhaustive_scoring(top_k):
+    index = LexicalIndex.build(random_corpus(0))
+    rng = np.random.default_rng(1)
+    for _ in range(30):
+        assert_same_top_k(index, " ".join(rng.choice(WORDS, rng.integers(1, 6))), top_k)
+
+
+def test_filtered_search_matches_exhaustive_scoring():
+    index = LexicalIndex.build(random_corpus(2))
+    rows = np.sort(np.random.default_rng(3).choice(index.num_docs, 150, replace=False))
+    for query in ["sati breath", "nibbāna dukkha anatta", "the of mind"]:
+        assert_same_top_k(index, query, 10, rows)
+
+
+def test_diacritics_and_case_are_folded():
+    assert fold("Satipaṭṭhāna") == "satipatthana"
+    index = LexicalIndex.build(["The Satipaṭṭhāna sutta", "breath and body"])
+    _, ids = index.search("SATIPATTHANA", 5)
+    assert ids.tolist() == [0]
+    assert index.search("unknown words", 5)[1].tolist() == []
+
+
+def test_saved_index_gives_the_same_results(tmp_path):
+    index = LexicalIndex.build(random_corpus(4, docs=300), store_version="v1")
+    index.save(tmp_path)
+    loaded = LexicalIndex.load(tmp_path)
+    assert loaded.store_version == "v1"
+    for query in ["jhāna samādhi", "metta karuṇā body"]:
+        np.testing.assert_array_equal(loaded.search(query, 10)[1], index.search(query, 10)[1])
+
+
+def test_reciprocal_rank_fusion_order():
+    dense = [1, 2, 3, 4]
+    lexical = [3, 5, 1]
+    scores, ids = reciprocal_rank_fusion([dense, lexical], 10, k=60)
+    # 1: 1/61 + 1/63, 3: 1/63 + 1/61 (tie, lower id first), then 2 (1/62) before 5 (1/62, higher id), 4 last
+    assert ids.tolist() == [1, 3, 2, 5, 4]
+    np.testing.assert_allclose(scores[0], 1 / 61 + 1 / 63, rtol=1e-6)
+    assert np.all(np.diff(scores) <= 0)
+    assert reciprocal_rank_fusion([dense, lexical], 2)[1].tolist() == [1, 3]
+    assert reciprocal_rank_fusion([[], []], 5)[1].tolist() == []
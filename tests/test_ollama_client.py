@@ -0,0 +1,54 @@
+import time
+
+import pytest
+import requests
+
+from ollama_client import FakeOllamaServer, OllamaClient
+
+TOKENS = ["Breathe ", "in. ", "Breathe ", "out. "]
+
+
+def test_stream_yields_tokens_in_order():
+    with FakeOllamaServer(TOKENS) as server:
+        client = OllamaClient(server.url)
+        assert list(client.stream_generate("Guide a meditation", "mistral")) == TOKENS
+        assert server.requests[0]["stream"] is True
+        client.close()
+
+
+def test_final_chunk_fills_stats():
+    with FakeOllamaServer(TOKENS, token_delay=0.01) as server:
+        client = OllamaClient(server.url)
+        stats = {}
+        text = client.generate("Guide a short meditation", "mistral", stats=stats)
+        client.close()
+
+    assert text == "".join(TOKENS)
+    assert stats["eval_count"] == len(TOKENS)
+    assert stats["prompt_eval_count"] == 4
+    assert stats["prompt_eval_time"] == pytest.approx(0.001)
+    assert stats["tokens_per_second"] > 0
+    assert 0 < stats["time_to_first_token"] <= stats["total_time"]
+
+
+def test_error_chunk_raises():
+    with FakeOllamaServer(TOKENS[:2], error="model 'mistral' not found") as server:
+        client = OllamaClient(server.url)
+        received = []
+        with pytest.raises(RuntimeError, match="not found"):
+            for token in client.stream_generate("Guide a meditation", "mistral"):
+                received.append(token)
+        client.close()
+
+    assert received == TOKENS[:2]
+
+
+def test_read_timeout_between_chunks():
+    with FakeOllamaServer(TOKENS[:1], token_delay=1.0) as server:
+        client = OllamaClient(server.url, read_timeout=0.2)
+        start = time.perf_counter()
+        # requests reports a read timeout during streaming as a ConnectionError
+        with pytest.raises(requests.exceptions.ConnectionError, match="Read timed out"):
+            list(client.stream_generate("Guide a meditation", "mistral"))
+        assert time.perf_counter() - start < 1.0
+        client.close()
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from ann_index import exact_search, sample_queries
+from quantization import QuantizedIndex, popcount_rows, quantize_binary
+
+
+def clustered_embeddings(seed, rows=3000, dim=96):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((30, dim)).astype(np.float32)
+    embeddings = centers[rng.integers(0, 30, rows)] + 0.4 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("kind, min_recall", [("int8", 0.99), ("binary", 0.9)])
+def test_rescored_search_matches_exact_top_k(kind, min_recall):
+    embeddings = clustered_embeddings(0)
+    queries = sample_queries(embeddings, 40)
+    index = QuantizedIndex.build(embeddings, kind)
+
+    hits = 0
+    for (_, exact_ids), (_, ids) in zip(exact_search(embeddings, queries, 10), index.search(embeddings, queries, 10)):
+        hits += len(set(exact_ids.tolist()) & set(ids.tolist()))
+    assert hits / (10 * len(queries)) >= min_recall
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_scores_are_exact_after_rescoring(kind):
+    embeddings = clustered_embeddings(1)
+    queries = sample_queries(embeddings, 10)
+    index = QuantizedIndex.build(embeddings, kind)
+
+    for query, (scores, ids) in zip(queries, index.search(embeddings, queries, 10)):
+        np.testing.assert_allclose(scores, embeddings[ids] @ query, rtol=1e-5)
+        assert np.all(np.diff(scores) <= 0)
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_shortlist_of_every_row_is_exact(kind):
+    embeddings = clustered_embeddings(2, rows=500)
+    queries = sample_queries(embeddings, 5)
+    index = QuantizedIndex.build(embeddings, kind)
+    index.oversample = 50  # 10 * 50 = every row
+
+    for (_, exact_ids), (_, ids) in zip(exact_search(embeddings, queries, 10), index.search(embeddings, queries, 10)):
+        np.testing.assert_array_equal(ids, exact_ids)
+
+
+def test_hamming_distance_of_packed_codes():
+    a = quantize_binary(np.array([[1.0, -1.0, 1.0, 1.0] * 20]))
+    b = quantize_binary(np.array([[1.0, 1.0, -1.0, 1.0] * 20]))
+    assert a.shape[1] % 8 == 0
+    assert popcount_rows(a ^ b)[0] == 40
+    assert popcount_rows(a ^ a)[0] == 0
@@ -0,0 +1,56 @@
+import numpy as np
+
+from query_cache import QueryCache
+
+
+def test_memory_lru_evicts_the_least_recently_used_query():
+    cache = QueryCache("model", max_memory_entries=2)
+    cache.put_vector("a", [1.0, 0.0])
+    cache.put_vector("b", [0.0, 1.0])
+    assert cache.get_vector("a") is not None  # "a" is now the most recent
+    cache.put_vector("c", [1.0, 1.0])
+
+    assert cache.get_vector("b") is None
+    np.testing.assert_array_equal(cache.get_vector("a"), [1.0, 0.0])
+    np.testing.assert_array_equal(cache.get_vector("c"), [1.0, 1.0])
+    assert cache.stats["vector_hits"] == 3 and cache.stats["vector_misses"] == 1
+
+
+def test_queries_are_normalized():
+    cache = QueryCache("model")
+    cache.put_vector("  Satipaṭṭhāna   SUTTA ", [0.5])
+    np.testing.assert_array_equal(cache.get_vector("satipaṭṭhāna sutta"), [0.5])
+    assert QueryCache("other model").get_vector("satipaṭṭhāna sutta") is None
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = QueryCache("model", store_version="v1", path=path)
+    cache.put_vector("breath", np.arange(4, dtype=np.float32))
+    cache.put_hits("breath", 3, "exact", [0.9, 0.8, 0.7], [5, 2, 9])
+    cache.close()
+
+    reopened = QueryCache("model", store_version="v1", path=path)
+    np.testing.assert_array_equal(reopened.get_vector("breath"), np.arange(4, dtype=np.float32))
+    scores, ids = reopened.get_hits("breath", 3, "exact")
+    np.testing.assert_array_equal(ids, [5, 2, 9])
+    np.testing.assert_allclose(scores, [0.9, 0.8, 0.7])
+    assert reopened.get_hits("breath", 3, "ivf:8") is None
+    reopened.close()
+
+
+def test_store_change_drops_hits_but_keeps_vectors(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = QueryCache("model", store_version="v1", path=path)
+    cache.put_vector("breath", [1.0, 2.0])
+    cache.put_hits("breath", 1, "exact", [0.9], [5])
+    cache.close()
+
+    rebuilt = QueryCache("model", store_version="v2", path=path)
+    assert rebuilt.get_hits("breath", 1, "exact") is None
+    np.testing.assert_array_equal(rebuilt.get_vector("breath"), [1.0, 2.0])
+
+    rebuilt.put_hits("breath", 1, "exact", [0.9], [5])
+    rebuilt.set_store_version("v3")
+    assert rebuilt.get_hits("breath", 1, "exact") is None
+    rebuilt.close()
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStoreWriter
+from sharded_index import ShardedIndex, open_sharded_corpus, translator_of
+
+TRANSLATORS = ("than", "bodh", "nana")
+
+
+def test_translator_comes_from_the_leaf_file_name():
+    assert translator_of("mn.118.than.txt") == "than"
+    assert translator_of("dhp__dhp.01.budd.txt") == "budd"
+    assert translator_of("dhp__index.txt") == ""
+    assert translator_of("snp__snp.1.08.piya.txt") == "piya"
+    assert translator_of("index.txt") == ""
+    assert translator_of("dhp__dhp.intro.txt") == ""
+    assert translator_of("sn.56.011.than.txt") == "than"
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    """Two shards of random rows with collection, translator and chunk_length fields"""
+    root = tmp_path_factory.mktemp("shards")
+    rng = np.random.default_rng(0)
+    for collection, rows in (("mn", 300), ("dn", 200)):
+        writer = EmbeddingStoreWriter(root / collection)
+        vectors = rng.standard_normal((rows, 16)).astype(np.float32)
+        translators = rng.choice(TRANSLATORS, rows)
+        metadata = [{"filename": f"{collection}.{i % 20}.{translator}.txt", "collection": collection,
+                     "translator": str(translator), "chunk_length": int(length)}
+                    for i, (translator, length) in enumerate(zip(translators, rng.integers(50, 500, rows)))]
+        writer.add(vectors, [f"{collection} {i}" for i in range(rows)], metadata)
+        writer.close()
+    return open_sharded_corpus(root)
+
+
+def brute_force(corpus, query, top_k, accept):
+    rows = np.asarray([i for i in range(len(corpus)) if accept(corpus.metadata[i])], dtype=np.int64)
+    scores = np.asarray(corpus.embeddings[rows]) @ query
+    return rows[np.argsort(-scores, kind="stable")[:top_k]]
+
+
+@pytest.mark.parametrize("filters, accept", [
+    (None, lambda meta: True),
+    ({"collection": "dn"}, lambda meta: meta["collection"] == "dn"),
+    ({"translator": "bodh"}, lambda meta: meta["translator"] == "bodh"),
+    ({"collection": ["mn", "dn"], "translator": ["than", "nana"]}, lambda meta: meta["translator"] != "bodh"),
+    ({"chunk_length": {"min": 100, "max": 200}}, lambda meta: 100 <= meta["chunk_length"] <= 200),
+    ({"collection": "mn", "translator": "than", "chunk_length": {"min": 300}},
+     lambda meta: meta["collection"] == "mn" and meta["translator"] == "than" and meta["chunk_length"] >= 300),
+    ({"translator": "nobody"}, lambda meta: False),
+])
+def test_filtered_search_matches_brute_force(corpus, filters, accept):
+    queries = np.random.default_rng(1).standard_normal((5, 16)).astype(np.float32)
+    found = ShardedIndex(corpus).search(corpus.embeddings, queries, 10, filters=filters)
+    for query, (scores, ids) in zip(queries, found):
+        np.testing.assert_array_equal(ids, brute_force(corpus, query, 10, accept))
+        assert all(accept(corpus.metadata[idx]) for idx in ids.tolist())
+        np.testing.assert_allclose(scores, np.asarray(corpus.embeddings[ids]) @ query, rtol=1e-5)
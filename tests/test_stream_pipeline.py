@@ -0,0 +1,68 @@
+import pytest
+
+from stream_pipeline import SegmentParser, SegmentProducer, iter_segments
+from tts_renderer import parse_guide
+
+GUIDE = ("Siéntate cómodamente. [Pausa 5 segundos] Lleva la atención a la respiración. "
+         "[Pausa 10 segundos]\nObserva el cuerpo [sin juzgar]. [Pausa 3 segundos] Vuelve poco a poco.")
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, len(GUIDE)])
+def test_segments_match_parse_guide(size):
+    assert list(iter_segments(split_every(GUIDE, size))) == parse_guide(GUIDE)
+
+
+def test_marker_split_across_tokens():
+    parser = SegmentParser()
+    assert parser.feed("Respira hondo. [Pau") == []
+    assert parser.feed("sa 5 seg") == []
+    # The segment is released by the token that completes the marker
+    assert parser.feed("undos] Suelta") == [("speech", "Respira hondo."), ("pause", 5)]
+    assert parser.close() == [("speech", "Suelta")]
+
+
+def test_several_markers_in_one_token():
+    parser = SegmentParser()
+    assert parser.feed("Uno. [Pausa 1 segundos] Dos. [Pausa 2 segundos] Tr") == [
+        ("speech", "Uno."), ("pause", 1), ("speech", "Dos."), ("pause", 2)]
+    assert parser.close() == [("speech", "Tr")]
+
+
+def test_trailing_segment_without_pause():
+    parser = SegmentParser()
+    assert parser.feed("Descansa en la quietud") == []
+    assert parser.feed(" del momento.  ") == []
+    assert parser.close() == [("speech", "Descansa en la quietud del momento.")]
+    assert parser.close() == []
+
+
+def test_guide_ending_in_a_pause_has_no_trailing_segment():
+    text = "Cierra los ojos. [Pausa 4 segundos]  \n"
+    assert list(iter_segments(split_every(text, 4))) == [("speech", "Cierra los ojos."), ("pause", 4)]
+
+
+def test_producer_yields_segments_in_order():
+    tokens = split_every(GUIDE, 5)
+    seen = []
+    producer = SegmentProducer(iter(tokens), on_token=seen.append)
+    assert list(producer) == parse_guide(GUIDE)
+    assert producer.text == GUIDE
+    assert seen == tokens
+    assert producer.llm_time is not None
+
+
+def test_producer_reraises_stream_errors():
+    def tokens():
+        yield "Respira. [Pausa 1 segundos] "
+        raise ConnectionError("stream dropped")
+
+    producer = SegmentProducer(tokens())
+    received = []
+    with pytest.raises(ConnectionError, match="stream dropped"):
+        for segment in producer:
+            received.append(segment)
+    assert received == [("speech", "Respira."), ("pause", 1)]
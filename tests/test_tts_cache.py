@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from tts_cache import SegmentCache
+
+
+def test_key_ignores_whitespace_but_not_voice_or_speed(tmp_path):
+    cache = SegmentCache(tmp_path, model_version="1.0")
+    key = cache.key("Respira  hondo.\n", "e", "em_alex", 0.7)
+    assert key == cache.key("Respira hondo.", "e", "em_alex", 0.7)
+    assert key != cache.key("Respira hondo.", "e", "ef_dora", 0.7)
+    assert key != cache.key("Respira hondo.", "e", "em_alex", 0.8)
+    assert key != SegmentCache(tmp_path, model_version="1.1").key("Respira hondo.", "e", "em_alex", 0.7)
+
+
+@pytest.mark.parametrize("storage, tolerance", [("pcm16", 1 / 32767), ("float16", 1e-3)])
+def test_round_trip(tmp_path, storage, tolerance):
+    cache = SegmentCache(tmp_path, storage=storage, model_version="1.0")
+    audio = np.sin(np.linspace(0, 20, 2400)).astype(np.float32) * 0.8
+    key = cache.key("Suelta", "e", "em_alex", 0.7)
+    assert cache.get(key) is None
+    cache.put(key, audio)
+
+    reopened = SegmentCache(tmp_path, storage=storage, model_version="1.0")
+    np.testing.assert_allclose(reopened.get(key), audio, atol=tolerance)
+    assert reopened.size_bytes == cache.size_bytes > 0
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_least_recently_used_segments_are_evicted(tmp_path):
+    audio = np.zeros(1000, dtype=np.float32)
+    probe = SegmentCache(tmp_path / "probe", model_version="1.0")
+    probe.put("probe", audio)
+    size = probe.size_bytes
+
+    # Room for three segments, and still three after evicting down to EVICT_TO_FRACTION
+    cache = SegmentCache(tmp_path / "cache", max_bytes=int(3.5 * size), model_version="1.0")
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, audio)
+        os.utime(cache.cache_dir / f"{key}.npy", (1000 + i, 1000 + i))
+    assert cache.get("a") is not None  # Refreshes "a", so "b" is now the oldest
+    cache.put("d", audio)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ["a", "c", "d"])
+    assert cache.size_bytes <= 3 * size
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import numpy as np
+
+from tts_cache import SegmentCache
+from tts_renderer import SAMPLE_RATE, iter_audio, parse_guide
+
+GUIDE = "Siéntate. [Pausa 2 segundos] Respira hondo y suelta. [Pausa 1 segundos] Vuelve poco a poco."
+
+
+def fake_synthesize(texto, voice, speed, lang_code):
+    """One sample per character, valued by the text length; longer texts take longer"""
+    time.sleep(0.001 * len(texto))
+    return np.full(len(texto), len(texto) / 100, dtype=np.float32)
+
+
+def test_blocks_come_out_in_guide_order():
+    audio = np.concatenate(list(iter_audio(parse_guide(GUIDE), synthesize=fake_synthesize, max_workers=3)))
+    expected = []
+    for kind, value in parse_guide(GUIDE):
+        if kind == "speech":
+            expected.append(np.full(len(value), len(value) / 100, dtype=np.float32))
+        else:
+            expected.append(np.zeros(value * SAMPLE_RATE, dtype=np.float32))
+    np.testing.assert_array_equal(audio, np.concatenate(expected))
+
+
+def test_segments_are_consumed_lazily():
+    produced = []
+
+    def segments():
+        for segment in parse_guide(GUIDE):
+            produced.append(segment)
+            yield segment
+
+    blocks = iter_audio(segments(), synthesize=fake_synthesize, max_in_flight=2)
+    next(blocks)
+    assert len(produced) <= 3
+    list(blocks)
+    assert produced == parse_guide(GUIDE)
+
+
+def test_cached_segments_are_not_synthesised_again(tmp_path):
+    cache = SegmentCache(tmp_path, model_version="1.0")
+    calls = []
+    lock = threading.Lock()
+
+    def counting_synthesize(texto, voice, speed, lang_code):
+        with lock:
+            calls.append(texto)
+        return fake_synthesize(texto, voice, speed, lang_code)
+
+    first = list(iter_audio(parse_guide(GUIDE), synthesize=counting_synthesize, cache=cache))
+    assert len(calls) == 3
+    second = list(iter_audio(parse_guide(GUIDE), synthesize=counting_synthesize, cache=cache))
+    assert len(calls) == 3
+    np.testing.assert_allclose(np.concatenate(second), np.concatenate(first), atol=1 / 32767)
@@ -0,0 +1,65 @@
+import numpy as np
+
+from vector_store import LocalVectorStore, migrate
+
+
+def fill(store, rows=50, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = [f"id-{i}" for i in range(rows)]
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [f"chunk {i}" for i in range(rows)]
+    metadata = [{"filename": f"mn.{i % 5}.than.txt", "chunk_id": i} for i in range(rows)]
+    store.add(ids, vectors, texts, metadata)
+    return ids, vectors, texts, metadata
+
+
+def contents(store):
+    rows = {}
+    for ids, vectors, texts, metadata in store.iter_batches(7):
+        for point_id, vector, text, meta in zip(ids, vectors, texts, metadata):
+            rows[point_id] = (vector.tolist(), text, meta)
+    return rows
+
+
+def test_persisted_store_reopens_with_the_same_rows(tmp_path):
+    store = LocalVectorStore(tmp_path / "a")
+    ids, vectors, texts, metadata = fill(store)
+    store.persist()
+
+    reopened = LocalVectorStore(tmp_path / "a")
+    assert len(reopened) == len(ids)
+    got_vectors, got_texts, got_metadata = reopened.get(ids[::-1])
+    np.testing.assert_array_equal(got_vectors, vectors[::-1])
+    assert got_texts == texts[::-1]
+    assert got_metadata == metadata[::-1]
+
+
+def test_migrate_round_trip(tmp_path):
+    source = LocalVectorStore(tmp_path / "source")
+    ids, vectors, _, _ = fill(source)
+    source.persist()
+    source.delete(ids[:3])  # Unpersisted changes are migrated too
+    fill(source, rows=2, seed=1)
+
+    middle = LocalVectorStore(tmp_path / "middle")
+    assert migrate(source, middle, batch_size=16, log=lambda message: None) == len(source)
+    back = LocalVectorStore(tmp_path / "back")
+    migrate(LocalVectorStore(tmp_path / "middle"), back, batch_size=16, log=lambda message: None)
+
+    assert contents(LocalVectorStore(tmp_path / "back")) == contents(source)
+    hits = back.search(vectors[10], 3)[0]
+    assert hits[0].id == "id-10"
+    assert hits[0].metadata == {"filename": "mn.0.than.txt", "chunk_id": 10}
+
+
+def test_search_sees_unpersisted_changes(tmp_path):
+    store = LocalVectorStore(tmp_path / "a")
+    ids, vectors, _, _ = fill(store)
+    store.persist()
+
+    store.delete(["id-4"])
+    assert all(hit.id != "id-4" for hit in store.search(vectors[4], 5)[0])
+    store.add(["new"], vectors[4:5], ["new chunk"], [{"filename": "dn.1.than.txt", "chunk_id": 0}])
+    assert store.search(vectors[4], 1)[0][0].id == "new"
+    assert len(store) == len(ids)
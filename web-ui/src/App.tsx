@@ -1,27 +1,54 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import './App.css';
 
-interface AudioFile {
-  name: string;
-  path: string;
-  displayName: string;
+interface CatalogueFile {
+  format: string;
+  url: string;
+  type: string;
+  bytes: number;
 }
 
-const DURATIONS = [5, 10];
-const LEVELS = ["principiante", "avanzado"];
-const MUSIC_OPTIONS = ["con_musica", "_mute"];
+interface CatalogueVariant {
+  duration: number;
+  level: string;
+  music: string;
+  seconds: number | null;
+  files: CatalogueFile[];
+}
+
+interface Catalogue {
+  variants: CatalogueVariant[];
+}
+
+// scripts/audio_server.py; empty = same origin (the dev server proxies /api to it, see package.json)
+const AUDIO_SERVER = process.env.REACT_APP_AUDIO_SERVER || "";
+const MUSIC_LABELS: Record<string, string> = { con_musica: "Con música", mute: "Sin música" };
+
+const unique = <T,>(values: T[]): T[] => Array.from(new Set(values));
 
 function App() {
+  const [catalogue, setCatalogue] = useState<Catalogue | null>(null);
+  const [error, setError] = useState<string>("");
   const [duracion, setDuracion] = useState<number | "">("");
   const [nivel, setNivel] = useState<string>("");
   const [musica, setMusica] = useState<string>("");
 
-  let audioFileName = "";
-  let audioFilePath = "";
-  if (duracion && nivel && musica) {
-    audioFileName = `meditacion_kokoro_${duracion}_${nivel}_${musica}.wav`;
-    audioFilePath = `/data/audio/${audioFileName}`;
-  }
+  useEffect(() => {
+    fetch(`${AUDIO_SERVER}/api/catalogue`)
+      .then(response => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+      })
+      .then(setCatalogue)
+      .catch(e => setError(String(e)));
+  }, []);
+
+  // Only combinations that exist on the server are offered
+  const variants = catalogue ? catalogue.variants : [];
+  const durations = unique(variants.map(v => v.duration)).sort((a, b) => a - b);
+  const levels = unique(variants.filter(v => v.duration === duracion).map(v => v.level));
+  const musicOptions = unique(variants.filter(v => v.duration === duracion && v.level === nivel).map(v => v.music));
+  const selected = variants.find(v => v.duration === duracion && v.level === nivel && v.music === musica);
 
   return (
     <div className="App">
@@ -30,15 +57,16 @@ function App() {
         <p>Filtra y escucha meditaciones:</p>
       </header>
       <main>
+        {error && <p>No se pudo cargar el catálogo ({error}).</p>}
         <div className="audio-selector">
           <label>Duración:
             <select
               value={duracion}
-              onChange={e => setDuracion(Number(e.target.value))}
+              onChange={e => { setDuracion(e.target.value ? Number(e.target.value) : ""); setNivel(""); setMusica(""); }}
               className="audio-dropdown"
             >
               <option value="">Selecciona duración</option>
-              {DURATIONS.map(d => (
+              {durations.map(d => (
                 <option key={d} value={d}>{d} minutos</option>
               ))}
             </select>
@@ -46,11 +74,12 @@ function App() {
           <label>Nivel:
             <select
               value={nivel}
-              onChange={e => setNivel(e.target.value)}
+              onChange={e => { setNivel(e.target.value); setMusica(""); }}
               className="audio-dropdown"
+              disabled={!levels.length}
             >
               <option value="">Selecciona nivel</option>
-              {LEVELS.map(l => (
+              {levels.map(l => (
                 <option key={l} value={l}>{l.charAt(0).toUpperCase() + l.slice(1)}</option>
               ))}
             </select>
@@ -60,25 +89,33 @@ function App() {
               value={musica}
               onChange={e => setMusica(e.target.value)}
               className="audio-dropdown"
+              disabled={!musicOptions.length}
             >
               <option value="">Selecciona música</option>
-              <option value="con_musica">Con música</option>
-              <option value="mute">Sin música</option>
+              {musicOptions.map(m => (
+                <option key={m} value={m}>{MUSIC_LABELS[m] || m}</option>
+              ))}
             </select>
           </label>
         </div>
-        {audioFileName && (
+        {selected && (
           <div className="audio-player">
             <audio
-              key={audioFileName}
+              key={selected.files[0].url}
               controls
+              preload="metadata"
               style={{ width: '100%', marginTop: '1rem' }}
             >
-              <source src={process.env.PUBLIC_URL + audioFilePath} type="audio/wav" />
+              {/* Smallest file first; the browser plays the first format it supports */}
+              {selected.files.map(f => (
+                <source key={f.url} src={AUDIO_SERVER + f.url} type={f.type} />
+              ))}
               Tu navegador no soporta el elemento de audio.
             </audio>
             <div className="file-info">
-              <span>Archivo: {audioFileName}</span>
+              <span>
+                Archivo: {selected.files.map(f => `${f.format} (${(f.bytes / 1e6).toFixed(1)} MB)`).join(", ")}
+              </span>
             </div>
           </div>
         )}